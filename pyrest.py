@@ -32,6 +32,16 @@ from rest.crossdomain import CrossDomains
 from rest.fei import FEITunerHandler, FEIRFInfoHandler, FEIRFSourceHandler, FEIGPSHandler, FEINavDataHandler
 from rest.port import PortHandler
 from rest.bulkio_handler import BulkIOWebsocketHandler
+from rest.bulkio_capture import BulkIOSnapshotHandler
+from rest.bulkio_stream import BulkIOStreamHandler
+from rest.bulkio_stats import BulkIOStatsHandler
+from rest.bulkio_trace import BulkIOTraceHandler
+from rest import bulkio_trace
+from rest import bulkio_capture
+from rest.bulkio_recorder import BulkIORecordingHandler, BulkIORecordingDataHandler
+from rest import bulkio_recorder
+from rest import bulkio_worker
+from rest import crossdomainsocket
 from rest.event_handler import EventHandler, EventChannelHandler
 
 import tornado.httpserver
@@ -46,6 +56,28 @@ from tornado.options import define, options
 
 define('port', default=8080, type=int, help="server port")
 define('debug', default=False, type=bool, help="Enable Tornado debug mode.  Reloads code")
+define('bulkio_threads', default=bulkio_worker.DEFAULT_THREADS, type=int,
+       help="Worker threads limiting and encoding bulkio packets (0 uses the CORBA thread)")
+define('bulkio_processes', default=bulkio_worker.DEFAULT_PROCESSES, type=int,
+       help="Worker processes limiting large bulkio packets (0 disables)")
+define('bulkio_process_threshold', default=bulkio_worker.DEFAULT_PROCESS_THRESHOLD, type=int,
+       help="Minimum bulkio packet length (words) limited in a worker process")
+define('bulkio_capture_seconds', default=bulkio_capture.DEFAULT_SECONDS, type=float,
+       help="Seconds of samples kept per stream of every watched bulkio port for snapshots (0 for no limit)")
+define('bulkio_capture_bytes', default=bulkio_capture.DEFAULT_BYTES, type=int,
+       help="Bytes of samples kept per stream of every watched bulkio port (0 for no limit, both 0 disables the capture)")
+define('bulkio_record_dir', default=bulkio_recorder.DEFAULT_DIRECTORY, type=str,
+       help="Directory of the server-side bulkio recordings (empty disables recording)")
+define('bulkio_record_queue', default=bulkio_recorder.DEFAULT_QUEUE_PACKETS, type=int,
+       help="Packets queued per recording for its writer thread before packets are dropped")
+define('bulkio_trace', default=bulkio_trace.DEFAULT_EVERY, type=int,
+       help="Trace the latency of one bulkio packet out of this many (0 disables)")
+define('ws_compression', default=crossdomainsocket.DEFAULT_COMPRESSION_LEVEL, type=int,
+       help="zlib level of the websocket permessage-deflate compression (0 disables)")
+define('ws_compression_wbits', default=crossdomainsocket.DEFAULT_COMPRESSION_WBITS, type=int,
+       help="Window bits (9-15) of the websocket compression")
+define('ws_compression_min_size', default=crossdomainsocket.DEFAULT_COMPRESSION_MIN_SIZE, type=int,
+       help="Websocket messages shorter than this (bytes) are not compressed")
 
 _ID = r'/([^/]+)'
 _LIST = r'/?'
@@ -65,8 +97,14 @@ _FEI_RFSOURCE_ID = r'/(RFSource[^/]+)'
 _FEI_GPS_ID = r'/((gps|GPS)[^/]*)'
 _FEI_NAVDATA_ID = r'/(NavData[^/]+)'
 _BULKIO_PATH = _PORT_PATH + _ID + r'/bulkio(/[^/]*)?'
+_STREAM_PATH = _PORT_PATH + _ID + r'/stream(/[^/]*)?'
+_SNAPSHOT_PATH = _PORT_PATH + _ID + r'/snapshot'
+_RECORDINGS_PATH = _PORT_PATH + _ID + r'/recordings'
+_RECORDING_DATA = r'/(data|sidecar)'
 
 _SYSTEM_EVENT_PATH = _BASE_URL + r'/redhawk'
+_BULKIO_CONNECTIONS_PATH = _BASE_URL + r'/bulkio/connections'
+_BULKIO_TRACE_PATH = _BASE_URL + r'/bulkio/trace'
 _EVENT_CHANNELS_PATH = _BASE_URL + r'/events'
 
 
@@ -99,6 +137,11 @@ class Application(tornado.web.Application):
             (_EVENT_CHANNELS_PATH + _ID, EventChannelHandler, dict(redhawk=redhawk)),
             (_EVENT_CHANNELS_PATH + _LIST, EventChannelHandler, dict(redhawk=redhawk)),
 
+            # Statistics of the bulkio clients
+            (_BULKIO_CONNECTIONS_PATH + _LIST, BulkIOStatsHandler, dict(redhawk=redhawk)),
+            (_BULKIO_CONNECTIONS_PATH + _ID, BulkIOStatsHandler, dict(redhawk=redhawk)),
+            (_BULKIO_TRACE_PATH + _LIST, BulkIOTraceHandler, dict(redhawk=redhawk)),
+
             # Domains, wild guess on the eventChannels one.
             (_DOMAIN_PATH + _LIST, DomainInfo, dict(redhawk=redhawk)),
             (_DOMAIN_PATH + _ID, DomainInfo, dict(redhawk=redhawk)),
@@ -120,6 +163,16 @@ class Application(tornado.web.Application):
                 dict(redhawk=redhawk, kind='application')),
             (_APPLICATION_PATH + _ID + _BULKIO_PATH, BulkIOWebsocketHandler, 
                 dict(redhawk=redhawk, kind='application', _ioloop=_ioloop, close_future=_ws_close_future)),
+            (_APPLICATION_PATH + _ID + _STREAM_PATH, BulkIOStreamHandler,
+                dict(redhawk=redhawk, kind='application', _ioloop=_ioloop)),
+            (_APPLICATION_PATH + _ID + _SNAPSHOT_PATH, BulkIOSnapshotHandler,
+                dict(redhawk=redhawk, kind='application')),
+            (_APPLICATION_PATH + _ID + _RECORDINGS_PATH + _LIST, BulkIORecordingHandler,
+                dict(redhawk=redhawk, kind='application')),
+            (_APPLICATION_PATH + _ID + _RECORDINGS_PATH + _ID, BulkIORecordingHandler,
+                dict(redhawk=redhawk, kind='application')),
+            (_APPLICATION_PATH + _ID + _RECORDINGS_PATH + _ID + _RECORDING_DATA, BulkIORecordingDataHandler,
+                dict(redhawk=redhawk, kind='application')),
             (_APPLICATION_PATH + _ID + _PROPERTIES_PATH + _LIST, ApplicationProperties,
                 dict(redhawk=redhawk)),
             (_APPLICATION_PATH + _ID + _PROPERTIES_PATH + _ID, ApplicationProperties,
@@ -138,6 +191,16 @@ class Application(tornado.web.Application):
                 dict(redhawk=redhawk, kind='component')),
             (_COMPONENT_PATH + _ID + _BULKIO_PATH, BulkIOWebsocketHandler,
                 dict(redhawk=redhawk, kind='component', _ioloop=_ioloop, close_future=_ws_close_future)),
+            (_COMPONENT_PATH + _ID + _STREAM_PATH, BulkIOStreamHandler,
+                dict(redhawk=redhawk, kind='component', _ioloop=_ioloop)),
+            (_COMPONENT_PATH + _ID + _SNAPSHOT_PATH, BulkIOSnapshotHandler,
+                dict(redhawk=redhawk, kind='component')),
+            (_COMPONENT_PATH + _ID + _RECORDINGS_PATH + _LIST, BulkIORecordingHandler,
+                dict(redhawk=redhawk, kind='component')),
+            (_COMPONENT_PATH + _ID + _RECORDINGS_PATH + _ID, BulkIORecordingHandler,
+                dict(redhawk=redhawk, kind='component')),
+            (_COMPONENT_PATH + _ID + _RECORDINGS_PATH + _ID + _RECORDING_DATA, BulkIORecordingDataHandler,
+                dict(redhawk=redhawk, kind='component')),
 
             # Device Managers
             (_DEVICE_MGR_PATH + _LIST, DeviceManagers, dict(redhawk=redhawk)),
@@ -163,6 +226,16 @@ class Application(tornado.web.Application):
             (_DEVICE_PATH + _ID + _PORT_PATH + _ID, PortHandler, dict(redhawk=redhawk, kind='device')), # Default port handler
             (_DEVICE_PATH + _ID + _BULKIO_PATH, BulkIOWebsocketHandler,
                 dict(redhawk=redhawk, kind='device', _ioloop=_ioloop, close_future=_ws_close_future)),
+            (_DEVICE_PATH + _ID + _STREAM_PATH, BulkIOStreamHandler,
+                dict(redhawk=redhawk, kind='device', _ioloop=_ioloop)),
+            (_DEVICE_PATH + _ID + _SNAPSHOT_PATH, BulkIOSnapshotHandler,
+                dict(redhawk=redhawk, kind='device')),
+            (_DEVICE_PATH + _ID + _RECORDINGS_PATH + _LIST, BulkIORecordingHandler,
+                dict(redhawk=redhawk, kind='device')),
+            (_DEVICE_PATH + _ID + _RECORDINGS_PATH + _ID, BulkIORecordingHandler,
+                dict(redhawk=redhawk, kind='device')),
+            (_DEVICE_PATH + _ID + _RECORDINGS_PATH + _ID + _RECORDING_DATA, BulkIORecordingDataHandler,
+                dict(redhawk=redhawk, kind='device')),
 
             # Filesystem
             (_FS_PATH, FileSystem, dict(redhawk=redhawk))
@@ -187,6 +260,11 @@ class BaseInfo(CrossDomains):
 
 def main():
     tornado.options.parse_command_line()
+    bulkio_worker.configure(options.bulkio_threads, options.bulkio_processes, options.bulkio_process_threshold)
+    bulkio_capture.configure(options.bulkio_capture_seconds, options.bulkio_capture_bytes)
+    bulkio_recorder.configure(options.bulkio_record_dir, options.bulkio_record_queue)
+    bulkio_trace.configure(options.bulkio_trace)
+    crossdomainsocket.configure_compression(options.ws_compression, options.ws_compression_wbits, options.ws_compression_min_size)
     application = Application(debug=options.debug)
     application.listen(options.port)
 
@@ -194,6 +272,8 @@ def main():
         ioloop.IOLoop.instance().start()
     except KeyboardInterrupt:
         pass
+    finally:
+        bulkio_worker.shutdown()
         
 
 if __name__ == '__main__':
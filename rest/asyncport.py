@@ -19,10 +19,56 @@
 #
 
 import logging
+import threading
 from new import classobj
 from bulkio.bulkioInterfaces import BULKIO, BULKIO__POA
 
-        
+import bulkio_trace
+
+
+class _PortServant(object):
+    """
+        Forwards the calls made on a servant to the AsyncPort that owns it.
+        Once the port is released, calls that were already on their way are
+        ignored.
+    """
+    def __init__(self, owner):
+        self._owner = owner
+
+    def pushSRI(self, H):
+        owner = self._owner
+        if owner is not None:
+            owner._pushSRI(H)
+
+    def pushPacket(self, data, ts, EOS, stream_id):
+        owner = self._owner
+        if owner is not None:
+            owner._pushPacket(data, ts, EOS, stream_id)
+
+
+# One servant class per BULKIO__POA interface, see _servant_class()
+_SERVANT_CLASSES = dict()
+_SERVANT_CLASSES_LOCK = threading.Lock()
+
+def _servant_class(porttype):
+    """
+        Returns the servant class of a BULKIO__POA interface, generating it
+        the first time.
+    """
+    with _SERVANT_CLASSES_LOCK:
+        servant_class = _SERVANT_CLASSES.get(porttype, None)
+        if servant_class is None:
+            # The classobj generates a class using the following arguments:
+            #
+            #    name:        The name of the class to generate
+            #    bases:       A tuple containing all the base classes to use
+            #    dct:         A dictionary containing all the attributes such as
+            #                 functions, and class variables
+            servant_class = classobj('%sPort' % porttype.__name__, (_PortServant, porttype), {})
+            _SERVANT_CLASSES[porttype] = servant_class
+        return servant_class
+
+
 class AsyncPort(object):
 
     """
@@ -42,6 +88,11 @@ class AsyncPort(object):
         self._pushSRI_callback = pushSRI
         self._pushPacket_callback = pushPacket
 
+        # The servant returned by getPort() and where it is activated
+        self._servant = None
+        self._servant_id = None
+        self._poa = None
+
         self._logger = logging.getLogger(self.__class__.__name__)
     
     def start(self):
@@ -75,42 +126,49 @@ class AsyncPort(object):
             self.eos = True
 
         self.last_packet = data
+        # Sampled packets are followed through the clients (see bulkio_trace)
+        trace = bulkio_trace.begin(ts)
         try:
             self._pushPacket_callback(data, ts, EOS, stream_id)
         except Exception, e:
             self._logger.exception("PushPacket Failure ts=%s, EOS=%s, stream_id=%s, data=%d elements", ts, EOS, stream_id, len(data))
+        finally:
+            if trace is not None:
+                bulkio_trace.end()
             
     def getPort(self):
         """
         Returns a Port object of the same type as the one specified as the 
-        porttype argument during the object instantiation.  It uses the 
-        classobj from the new module to generate a class on runtime.
+        porttype argument during the object instantiation.
 
-        The classobj generates a class using the following arguments:
-        
-            name:        The name of the class to generate
-            bases:       A tuple containing all the base classes to use
-            dct:         A dictionary containing all the attributes such as
-                         functions, and class variables
-        
         It is important to notice that the porttype is a BULKIO__POA type and
         not a BULKIO type.  The reason is because it is used to generate a 
         Port class that will be returned when the getPort() is invoked.  The
         returned class is the one acting as a server and therefore must be a
         Portable Object Adapter rather and a simple BULKIO object.
-                
+
+        The Port class is generated once per porttype (see _servant_class())
+        and its instance forwards the pushes to this AsyncPort.  The servant
+        stays active in the POA until releasePort() is called.
+        """
+        if self._servant is None:
+            self._servant = _servant_class(self.port_type)(self)
+            self._poa = self._servant._default_POA()
+            self._servant_id = self._poa.activate_object(self._servant)
+        return self._poa.id_to_reference(self._servant_id)
+
+    def releasePort(self):
         """
-        # The classobj generates a class using the following arguments:
-        #
-        #    name:        The name of the class to generate
-        #    bases:       A tuple containing all the base classes to use
-        #    dct:         A dictionary containing all the attributes such as
-        #                 functions, and class variables
-        PortClass = classobj('PortClass',
-                             (self.port_type,),
-                             {'pushPacket':self._pushPacket,
-                              'pushSRI':self._pushSRI})
-
-        # Create a port using the generate Metaclass and return an instance 
-        port = PortClass()
-        return port._this()
\ No newline at end of file
+        Deactivates the servant of getPort() once the port it was connected
+        to has been disconnected.
+        """
+        servant, self._servant = self._servant, None
+        if servant is None:
+            return
+        servant._owner = None
+        try:
+            self._poa.deactivate_object(self._servant_id)
+        except Exception:
+            self._logger.exception("Failure deactivating the port servant")
+        self._servant_id = None
+        self._poa = None
@@ -0,0 +1,315 @@
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+"""
+In-memory capture of watched BULKIO ports
+
+When enabled (see configure() and the bulkio_capture options of pyrest.py)
+every PortHub keeps the last samples of each of its streams in a
+preallocated ring buffer, so that the moments before an anomaly can be
+downloaded from
+
+    .../ports/{PORT}/snapshot[?seconds=N]
+
+A snapshot is a sequence of records, each starting with an 8-byte header:
+
+    offset  size  field
+         0     4  record length in bytes, not counting this header (uint32)
+         4     1  kind: 0 = SRI, 1 = packet, 2 = other control message
+         5     3  reserved
+         8     n  record
+
+SRI records are the JSON text of bulkio_protocol.sri_message() and packet
+records are binary frames of bulkio_protocol, which refer to the SRI by
+its version counter and carry the timestamp of their first sample.
+Snapshots have no other records; the binary HTTP streams of bulkio_stream
+use the same records and also send the other JSON control messages (e.g.
+the listing of the streams).
+
+Functions:
+configure -- size the capture buffers (0 disables them)
+create -- a CaptureBuffer for a new hub, or None if disabled
+record -- frame an SRI message or binary packet as a record
+
+Classes:
+CaptureBuffer -- the ring buffers of the streams of one port
+BulkIOSnapshotHandler -- download the contents of a CaptureBuffer
+"""
+
+import collections
+import json
+import logging
+import math
+import struct
+import threading
+
+import numpy
+from tornado import gen
+
+from ossie.properties import props_to_dict
+
+import bulkio_dsp
+import bulkio_hub
+import bulkio_protocol
+from handler import JsonHandler
+from model.domain import ResourceNotFound
+
+RECORD = struct.Struct('<IB3x')
+RECORD_SRI = 0
+RECORD_PACKET = 1
+RECORD_MESSAGE = 2
+
+# Default seconds and bytes captured per stream (0 for no limit, both 0
+# disables the capture)
+DEFAULT_SECONDS = 0
+DEFAULT_BYTES = 0
+
+# Ended streams are kept until there are more than this many streams
+MAX_STREAMS = 16
+
+_SECONDS = DEFAULT_SECONDS
+_BYTES = DEFAULT_BYTES
+
+
+def configure(seconds=DEFAULT_SECONDS, nbytes=DEFAULT_BYTES):
+    """
+    Sets the size of the buffer of every stream: the last `seconds` of
+    samples, at most `nbytes` bytes.  Applies to hubs created afterwards.
+    """
+    global _SECONDS, _BYTES
+    _SECONDS = max(seconds, 0)
+    _BYTES = max(nbytes, 0)
+    if (_SECONDS or _BYTES):
+        logging.info('Bulkio capture: %s seconds, %s bytes per stream', _SECONDS or 'any', _BYTES or 'any')
+
+def create(dtype):
+    """
+    Returns a CaptureBuffer for a port of the given sample dtype, or None if
+    the capture is disabled or the port does not carry numeric samples.
+    """
+    if (dtype is None or not (_SECONDS or _BYTES)):
+        return None
+    return CaptureBuffer(dtype, _SECONDS, _BYTES)
+
+
+class _StreamRing(object):
+    # The last words of one stream and the packets they came in
+
+    def __init__(self, dtype, capacity):
+        self.words = numpy.empty(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.written = 0
+        self.ended = False
+        # (position of the first word, number of words, ts, sri)
+        self.packets = collections.deque()
+
+    def push(self, words, ts, sri):
+        count = len(words)
+        position = self.written
+        if (count > self.capacity):
+            # Only the end of the packet fits
+            skipped = _alignWords(count - self.capacity, sri)
+            ts = bulkio_dsp.offset_time(ts, _wordsToSeconds(skipped, sri))
+            words = words[skipped:]
+            position += skipped
+            # Whole frames, so less than the capacity unless it is aligned
+            count = len(words)
+
+        start = position % self.capacity
+        first = min(count, self.capacity - start)
+        self.words[start:start + first] = words[:first]
+        self.words[:count - first] = words[first:]
+
+        self.packets.append((position, count, ts, sri))
+        self.written = position + count
+        # Forget the packets that have been overwritten completely
+        oldest = self.written - self.capacity
+        while (self.packets and self.packets[0][0] + self.packets[0][1] <= oldest):
+            self.packets.popleft()
+
+    def snapshot(self, seconds=None):
+        # Returns [(words, ts, sri)] of the last `seconds`, oldest first
+        oldest = max(self.written - self.capacity, 0)
+        packets = []
+        for position, count, ts, sri in reversed(self.packets):
+            first = oldest
+            if (seconds is not None):
+                # Only the end of the packet may be wanted
+                wanted = _secondsToWords(seconds, sri)
+                if (wanted is not None):
+                    first = max(first, position + count - wanted)
+            if (position < first):
+                skipped = _alignWords(first - position, sri)
+                if (skipped >= count):
+                    break
+                ts = bulkio_dsp.offset_time(ts, _wordsToSeconds(skipped, sri))
+                position, count = position + skipped, count - skipped
+            start = position % self.capacity
+            if (start + count <= self.capacity):
+                words = self.words[start:start + count].copy()
+            else:
+                words = numpy.concatenate((self.words[start:], self.words[:start + count - self.capacity]))
+            packets.append((words, ts, sri))
+            if (seconds is not None):
+                seconds -= _wordsToSeconds(count, sri)
+                if (seconds <= 0):
+                    break
+        packets.reverse()
+        return packets
+
+
+class CaptureBuffer(object):
+    """
+    The last samples of every stream of a port, for PortHub.
+
+    Each stream gets a ring buffer of words, allocated once when its first
+    packet arrives, sized from `seconds` at the sample rate of its SRI
+    and/or `nbytes`.  A packet overwrites the oldest words in place; the
+    timestamp and SRI of each packet are kept alongside so a snapshot can
+    restore them.
+    """
+    def __init__(self, dtype, seconds=DEFAULT_SECONDS, nbytes=DEFAULT_BYTES):
+        self.dtype = numpy.dtype(dtype)
+        self.seconds = seconds
+        self.nbytes = nbytes
+
+        self._SRIs = dict()
+        self._streams = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def pushSRI(self, sri):
+        with self._lock:
+            self._SRIs[sri.streamID] = sri
+
+    def pushPacket(self, data, ts, EOS, stream_id):
+        words = bulkio_protocol.to_array(data, self.dtype)
+        with self._lock:
+            sri = self._SRIs.get(stream_id, None)
+            if sri is None:
+                return
+            ring = self._streams.get(stream_id, None)
+            if (ring is None or ring.ended):
+                ring = _StreamRing(self.dtype, self._capacity(sri))
+                self._streams.pop(stream_id, None)
+                self._streams[stream_id] = ring
+                self._forgetEnded()
+            if len(words):
+                ring.push(words, ts, sri)
+            ring.ended = EOS
+
+    def snapshot(self, seconds=None):
+        """
+        Returns the snapshot of the last `seconds` (or everything) of every
+        stream as a string of records (see the module documentation).
+        """
+        with self._lock:
+            streams = [(stream_id, ring.snapshot(seconds)) for stream_id, ring in self._streams.items()]
+
+        records = []
+        for stream_id, packets in streams:
+            version, lastSRI = 0, None
+            for words, ts, sri in packets:
+                changed = sri is not lastSRI
+                if changed:
+                    version, lastSRI = version + 1, sri
+                    message = bulkio_protocol.sri_message(
+                        stream_id, version, dict(sri.__dict__, keywords=props_to_dict(sri.keywords)))
+                    records.append(record(RECORD_SRI, json.dumps(message)))
+                frame = bulkio_protocol.binary_packet(words, self.dtype, stream_id, ts, False, sri, version, changed)
+                records.append(record(RECORD_PACKET, frame))
+        return ''.join(records)
+
+    def _capacity(self, sri):
+        # Words of the ring buffer of a stream
+        itemsize = self.dtype.itemsize
+        capacity = None
+        if self.seconds:
+            capacity = _secondsToWords(self.seconds, sri)
+        if self.nbytes:
+            capacity = min(capacity or self.nbytes // itemsize, self.nbytes // itemsize)
+        if not capacity:
+            # Seconds only and no sample (or frame) rate
+            capacity = 1024 * 1024 // itemsize
+        return max(capacity, 1)
+
+    def _forgetEnded(self):
+        # Drops the oldest ended streams beyond MAX_STREAMS.  Caller holds the lock.
+        for stream_id, ring in self._streams.items():
+            if (len(self._streams) <= MAX_STREAMS):
+                return
+            if ring.ended:
+                del self._streams[stream_id]
+                self._SRIs.pop(stream_id, None)
+
+def _alignWords(words, sri):
+    # Rounds a number of words up to whole samples (or frames for 2D data)
+    frame = (sri.subsize or 1) * (2 if sri.mode else 1)
+    return -(-words // frame) * frame
+
+def _secondsToWords(seconds, sri):
+    # Number of words of a stream covering a duration, None if it has no rate
+    if (sri.subsize and sri.ydelta):
+        return int(math.ceil(seconds / sri.ydelta)) * sri.subsize * (2 if sri.mode else 1)
+    if (not sri.subsize and sri.xdelta):
+        return int(math.ceil(seconds / sri.xdelta - 1e-9)) * (2 if sri.mode else 1)
+    return None
+
+def _wordsToSeconds(words, sri):
+    # Duration of a number of words of a stream
+    if sri.subsize:
+        # 2D data advances by ydelta per frame
+        return words / float(sri.subsize * (2 if sri.mode else 1)) * (sri.ydelta or 0.0)
+    return words / (2 if sri.mode else 1) * (sri.xdelta or 0.0)
+
+def record(kind, payload):
+    """
+    Returns a record (see the module documentation) of the given kind.
+    """
+    return RECORD.pack(len(payload), kind) + payload
+
+
+class BulkIOSnapshotHandler(JsonHandler):
+    """
+    Downloads the capture of a watched port (see the module documentation).
+    The port is only captured while at least one websocket is attached.
+    """
+    def initialize(self, kind, redhawk=None):
+        super(BulkIOSnapshotHandler, self).initialize(redhawk)
+        self.kind = kind
+
+    @gen.coroutine
+    def get(self, *args):
+        try:
+            seconds = self.get_argument('seconds', None)
+            seconds = float(seconds) if seconds is not None else None
+
+            key = (self.kind,) + tuple(args)
+            for hub in bulkio_hub.hubs():
+                if (hub.key[:len(key)] == key and hub.capture is not None):
+                    break
+            else:
+                raise ResourceNotFound('port capture', args[-1])
+
+            snapshot = hub.capture.snapshot(seconds)
+            self.set_header('Content-Type', 'application/octet-stream')
+            self.set_header('Content-Disposition', 'attachment; filename="%s.snapshot"' % args[-1])
+            self.finish(snapshot)
+        except Exception, e:
+            logging.exception('Error with request %s' % self.request.full_url())
+            self._handle_request_exception(e)
@@ -0,0 +1,346 @@
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+"""
+Signal processing modes of the BulkIO websocket
+
+These run on the worker threads (see bulkio_worker) and keep state per
+stream across packets.
+
+Functions:
+offset_time -- a PrecisionUTCTime shifted by a number of seconds
+time_difference -- the seconds between two PrecisionUTCTimes
+spectrum_sri -- the SRI of the frames produced by a PowerSpectrum
+
+Classes:
+PowerSpectrum -- averaged, windowed power spectral density of a stream
+Raster -- ring buffer of the last 1D frames of a stream, for waterfalls
+Decimator -- anti-aliased decimation of a stream by an integer factor
+"""
+
+import numpy
+from numpy.lib.stride_tricks import as_strided
+
+from bulkio.bulkioInterfaces import BULKIO
+
+import bulkio_limiter
+
+
+def enum(**enums):
+    return type('Enum', (), enums)
+
+# Windows applied to every FFT segment
+WindowEnum = enum(Rectangular=0, Hann=1, Hamming=2, Blackman=3)
+
+# Names of the windows as accepted in query arguments
+WINDOW_NAMES = {
+    'rectangular': WindowEnum.Rectangular,
+    'hann':        WindowEnum.Hann,
+    'hamming':     WindowEnum.Hamming,
+    'blackman':    WindowEnum.Blackman,
+}
+
+WINDOW_FUNCTIONS = {
+    WindowEnum.Rectangular: numpy.ones,
+    WindowEnum.Hann:        numpy.hanning,
+    WindowEnum.Hamming:     numpy.hamming,
+    WindowEnum.Blackman:    numpy.blackman,
+}
+
+DEFAULT_FFT_SIZE = 1024
+
+# Percentage of every segment shared with the next one
+DEFAULT_OVERLAP = 50
+
+DEFAULT_WINDOW = WindowEnum.Hann
+
+# Number of segments averaged into every frame
+DEFAULT_AVERAGES = 1
+
+# Milliseconds between the waterfall frames sent to a client
+DEFAULT_RASTER_INTERVAL = 100
+
+# Sample type of the spectrum frames
+SPECTRUM_DTYPE = numpy.dtype('<f4')
+
+# Coefficients per output sample (polyphase branch length) of the
+# anti-aliasing filter of a Decimator, and the beta of its Kaiser window
+DEFAULT_DECIMATOR_TAPS = 16
+DECIMATOR_BETA = 8.0
+
+# BULKIO.UNITS_TIME and BULKIO.UNITS_FREQUENCY
+UNITS_TIME = 1
+UNITS_FREQUENCY = 3
+
+# Power floor of the dB conversion
+_MIN_POWER = 1e-20
+
+
+def offset_time(ts, seconds):
+    """
+    Returns a copy of the PrecisionUTCTime ts moved by (seconds).
+    """
+    twsec, tfsec = divmod(ts.twsec + (ts.tfsec + seconds), 1.0)
+    return BULKIO.PrecisionUTCTime(ts.tcmode, ts.tcstatus, ts.toff, twsec, tfsec)
+
+def time_difference(a, b):
+    """
+    Returns the seconds from the PrecisionUTCTime b to a.
+    """
+    return (a.twsec - b.twsec) + (a.tfsec - b.tfsec)
+
+def spectrum_sri(inSRI, fftSize):
+    """
+    Returns the SRI of the power spectra of a stream with SRI inSRI: real
+    1D frames of fftSize bins (fftSize/2 + 1 for real input) in Hz,
+    centered on 0 Hz for complex input.
+    """
+    outSRI = bulkio_limiter.copy_sri(inSRI)
+    sampleRate = 1.0 / inSRI.xdelta if inSRI.xdelta else 1.0
+    outSRI.xdelta = sampleRate / fftSize
+    outSRI.xstart = -sampleRate / 2.0 if inSRI.mode else 0.0
+    outSRI.xunits = UNITS_FREQUENCY
+    outSRI.subsize = 0
+    outSRI.mode = 0
+    return outSRI
+
+
+class PowerSpectrum(object):
+    """
+    Welch power spectral density of one stream.
+
+    Samples are cut into segments of fftSize samples, advancing by
+    fftSize * (100 - overlap) / 100 samples, and the samples left over at
+    the end of a packet are carried into the next one.  Every `averages`
+    segments produce one frame in dB (relative to one unit squared per Hz)
+    time-stamped with the first sample of its first segment.  All segments
+    of a packet are windowed and transformed as a single 2D FFT.
+    """
+    def __init__(self, fftSize=DEFAULT_FFT_SIZE, overlap=DEFAULT_OVERLAP, window=DEFAULT_WINDOW, averages=DEFAULT_AVERAGES):
+        if (fftSize < 2):
+            raise ValueError('FFT size must be at least 2, not %d' % fftSize)
+        if (window not in WINDOW_FUNCTIONS):
+            raise ValueError('Unknown window %d' % window)
+        self.fftSize = fftSize
+        self.step = max(fftSize - fftSize * min(max(overlap, 0), 99) // 100, 1)
+        self.averages = max(averages, 1)
+
+        self._window = WINDOW_FUNCTIONS[window](fftSize)
+        # Window power, for the density scaling
+        self._windowPower = numpy.sum(self._window ** 2)
+
+        self._buffer = None
+        self._bufferTime = None
+        self._total = None
+        self._count = 0
+        self._frameTime = None
+
+    def reset(self):
+        """
+        Discards the carried samples and the partial average.
+        """
+        self._buffer = None
+        self._total = None
+        self._count = 0
+
+    def push(self, data, ts, sri, dtype=None):
+        """
+        Adds the words of a packet and returns the list of (frame, ts) tuples
+        it completes.  Frames are numpy arrays of SPECTRUM_DTYPE.
+        """
+        samples = bulkio_limiter.toSamples(data, sri.mode, dtype)
+        xdelta = sri.xdelta or 1.0
+
+        # Prepend the samples carried over from the previous packet
+        if (self._buffer is not None and len(self._buffer)):
+            samples = numpy.concatenate((self._buffer, samples))
+            bufferTime = self._bufferTime
+        else:
+            bufferTime = ts
+
+        numSegments = 0
+        if (len(samples) >= self.fftSize):
+            numSegments = (len(samples) - self.fftSize) // self.step + 1
+
+        frames = []
+        if numSegments:
+            # View the overlapping segments as rows without copying
+            samples = numpy.ascontiguousarray(samples)
+            itemsize = samples.strides[0]
+            segments = as_strided(samples, shape=(numSegments, self.fftSize),
+                                  strides=(self.step * itemsize, itemsize))
+            power = self._power(segments * self._window, sri.mode)
+
+            first = 0
+            while (first < numSegments):
+                if (self._count == 0):
+                    self._frameTime = offset_time(bufferTime, first * self.step * xdelta)
+                    self._total = numpy.zeros(power.shape[1])
+                last = min(first + self.averages - self._count, numSegments)
+                self._total += power[first:last].sum(axis=0)
+                self._count += last - first
+                first = last
+                if (self._count == self.averages):
+                    frames.append((self._frame(xdelta), self._frameTime))
+                    self._count = 0
+
+        # Carry whatever the next segment needs over to the next packet
+        consumed = numSegments * self.step
+        self._buffer = samples[consumed:].copy()
+        self._bufferTime = offset_time(bufferTime, consumed * xdelta)
+        return frames
+
+    def _power(self, segments, complexData):
+        # Squared magnitude of the FFT of every row
+        if complexData:
+            spectra = numpy.fft.fftshift(numpy.fft.fft(segments, axis=1), axes=1)
+            return spectra.real ** 2 + spectra.imag ** 2
+        spectra = numpy.fft.rfft(segments, axis=1)
+        power = spectra.real ** 2 + spectra.imag ** 2
+        # One-sided spectrum: fold the negative frequencies (all but DC and Nyquist)
+        power[:, 1:(self.fftSize + 1) // 2] *= 2.0
+        return power
+
+    def _frame(self, xdelta):
+        # Averaged power spectral density in dB
+        density = self._total * (xdelta / (self._count * self._windowPower))
+        return (10.0 * numpy.log10(numpy.maximum(density, _MIN_POWER))).astype(SPECTRUM_DTYPE)
+
+
+class Raster(object):
+    """
+    The last `rows` 1D frames of a stream, stacked into a 2D raster.
+
+    Frames are copied into a preallocated (rows, cols) ring buffer, so
+    pushing a frame never allocates.  The time between rows (ydelta) is
+    measured between the first two frames and kept for the life of the
+    raster so that the SRI of the raster only changes with its stream.
+    """
+    def __init__(self, rows, cols, dtype):
+        self.rows = rows
+        self.cols = cols
+        self.ydelta = 0.0
+
+        self._data = numpy.empty((rows, cols), dtype=dtype)
+        self._times = [None] * rows
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def push(self, frame, ts):
+        """
+        Stores a frame of `cols` samples, overwriting the oldest one once the
+        raster is full.
+        """
+        if (self._count == 1 and not self.ydelta):
+            first = self._times[0]
+            self.ydelta = (ts.twsec - first.twsec) + (ts.tfsec - first.tfsec)
+        self._data[self._next] = frame
+        self._times[self._next] = ts
+        self._next = (self._next + 1) % self.rows
+        self._count = min(self._count + 1, self.rows)
+
+    def snapshot(self):
+        """
+        Returns the stored frames as a new (rows, cols) array, oldest first,
+        and the timestamp of the oldest one.
+        """
+        if (self._count < self.rows):
+            return self._data[:self._count].copy(), self._times[0]
+        oldest = self._next
+        return numpy.concatenate((self._data[oldest:], self._data[:oldest])), self._times[oldest]
+
+
+class Decimator(object):
+    """
+    Anti-aliased decimation of one stream by an integer factor.
+
+    The low-pass filter is a Kaiser-windowed sinc of factor * taps
+    coefficients, cut off at the Nyquist frequency of the output and
+    normalized to unity gain at DC.  It runs as a polyphase decimator: only
+    every factor-th output is computed, as one product of the coefficients
+    with a strided view of the input windows.  The last samples of every
+    packet are carried into the next one, so the output is continuous
+    across packets, and the output samples are time-stamped for the delay
+    of the filter.  The state is dropped when a packet does not start
+    where the previous one ended (e.g. packets were dropped upstream).
+    """
+    def __init__(self, factor, taps=DEFAULT_DECIMATOR_TAPS):
+        if (factor < 1):
+            raise ValueError('Decimation factor must be at least 1, not %d' % factor)
+        self.factor = factor
+        numTaps = factor * max(taps, 1)
+        offsets = numpy.arange(numTaps) - (numTaps - 1) / 2.0
+        coefficients = numpy.sinc(offsets / factor) * numpy.kaiser(numTaps, DECIMATOR_BETA)
+        # Reversed, so that a window of samples (oldest first) dots with it
+        self._coefficients = (coefficients / coefficients.sum())[::-1].copy()
+        # Group delay of the (symmetric) filter, in input samples
+        self.delay = (numTaps - 1) / 2.0
+
+        self._history = None
+        self._phase = 0
+        self._nextTime = None
+
+    def reset(self):
+        """
+        Discards the carried samples.
+        """
+        self._history = None
+        self._phase = 0
+        self._nextTime = None
+
+    def push(self, data, ts, sri, dtype=None):
+        """
+        Adds the words of a packet and returns (words, ts) of the samples it
+        completes, ts being the time of the first one (None if there are
+        none).  Real samples are returned as float words (float32 unless
+        the input is float64) and complex ones as interleaved float words.
+        """
+        samples = bulkio_limiter.toSamples(data, sri.mode, dtype)
+        xdelta = sri.xdelta or 1.0
+        if (self._nextTime is not None and abs(time_difference(ts, self._nextTime)) > xdelta / 2.0):
+            self.reset()
+        self._nextTime = offset_time(ts, len(samples) * xdelta)
+        outType = numpy.result_type(samples.dtype, numpy.float32)
+        if not len(samples):
+            return numpy.empty(0, outType), None
+
+        numTaps = len(self._coefficients)
+        if (self._history is None):
+            # Start as if the first sample had always been there rather
+            # than from silence
+            self._history = numpy.empty(numTaps - 1, dtype=outType)
+            self._history.fill(samples[0])
+
+        # The window of every output ends on its input sample
+        buffered = numpy.concatenate((self._history, samples.astype(outType)))
+        first = self._phase
+        numOutputs = (len(samples) - 1 - first) // self.factor + 1 if (first < len(samples)) else 0
+        self._phase = first + numOutputs * self.factor - len(samples)
+        self._history = buffered[len(buffered) - (numTaps - 1):].copy()
+        if not numOutputs:
+            return numpy.empty(0, outType), None
+
+        itemsize = buffered.strides[0]
+        windows = as_strided(buffered[first:], shape=(numOutputs, numTaps),
+                             strides=(self.factor * itemsize, itemsize))
+        output = windows.dot(self._coefficients).astype(outType)
+        return bulkio_limiter.toWords(output), offset_time(ts, (first - self.delay) * xdelta)
@@ -0,0 +1,348 @@
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+"""
+Flow control for the BulkIO websocket
+
+Classes:
+SendQueue -- bounded per-client queue of outgoing messages with a drop policy
+PacketRateLimiter -- token bucket limiting the packets per second of a client
+PacketCoalescer -- concatenates consecutive small packets of a stream
+"""
+
+import collections
+import threading
+import time
+
+import numpy
+
+
+def enum(**enums):
+    return type('Enum', (), enums)
+
+# What a full SendQueue does with a new data packet:
+#   DropOldest - discard the oldest queued data packet
+#   DropNewest - discard the new data packet
+#   KeepLatest - only ever queue the latest data packet of each stream
+DropPolicyEnum = enum(DropOldest=0, DropNewest=1, KeepLatest=2)
+
+# Names of the drop policies as accepted in query arguments
+DROP_POLICY_NAMES = {
+    'drop-oldest': DropPolicyEnum.DropOldest,
+    'drop-newest': DropPolicyEnum.DropNewest,
+    'keep-latest': DropPolicyEnum.KeepLatest,
+}
+
+# What a PacketRateLimiter does with a packet that exceeds the rate:
+#   Drop  - discard it
+#   Merge - average it with the following packets of the stream until a
+#           packet is allowed through
+RatePolicyEnum = enum(Drop=0, Merge=1)
+
+# Names of the rate policies as accepted in query arguments
+RATE_POLICY_NAMES = {
+    'drop':  RatePolicyEnum.Drop,
+    'merge': RatePolicyEnum.Merge,
+}
+
+# Default number of data packets queued per client
+DEFAULT_QUEUE_SIZE = 32
+
+# Default number of bytes Tornado may buffer for a client before the queue
+# stops handing it messages
+DEFAULT_MAX_WRITE_BUFFER = 1024 * 1024
+
+
+class SendQueue(object):
+    """
+    A bounded queue of outgoing websocket messages for one client.
+
+    put() is called from the omniORB thread(s) and pop() from the ioloop so
+    all access is serialized by a lock.  Only data packets count towards
+    the bound and may be dropped; control messages (SRI updates, errors,
+    end of stream) are always delivered.
+    """
+    def __init__(self, maxsize=DEFAULT_QUEUE_SIZE, policy=DropPolicyEnum.DropOldest):
+        self.maxsize = maxsize
+        self.policy = policy
+
+        # Number of data packets dropped since the queue was created
+        self.dropped = 0
+
+        self._items = collections.deque()
+        self._droppable = 0
+        self._scheduled = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, message, binary=False, stream_id=None, droppable=True, trace=None):
+        """
+        Queues a message (and the bulkio_trace.Trace of its packet, if
+        traced) and returns True if the caller has to schedule a drain of
+        the queue (i.e. one is not already pending).
+        """
+        with self._lock:
+            if droppable:
+                if (self.policy == DropPolicyEnum.KeepLatest):
+                    # Replace any queued packet of the same stream
+                    self._remove(lambda item: item[3] and item[0] == stream_id)
+                if (self._droppable >= self.maxsize):
+                    if (self.policy == DropPolicyEnum.DropNewest):
+                        self.dropped += 1
+                        return False
+                    self._remove(lambda item: item[3])
+
+            self._items.append((stream_id, message, binary, droppable, trace))
+            if droppable:
+                self._droppable += 1
+
+            if self._scheduled:
+                return False
+            self._scheduled = True
+            return True
+
+    def pop(self):
+        """
+        Returns the next (message, binary, trace) tuple or None if the queue
+        is empty.  Once None is returned the next put() schedules a new drain.
+        """
+        with self._lock:
+            if not self._items:
+                self._scheduled = False
+                return None
+            _, message, binary, droppable, trace = self._items.popleft()
+            if droppable:
+                self._droppable -= 1
+            return message, binary, trace
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._droppable = 0
+
+    def _remove(self, match):
+        # Drops the oldest queued item that matches.  Caller holds the lock.
+        for index, item in enumerate(self._items):
+            if match(item):
+                del self._items[index]
+                self._droppable -= 1
+                self.dropped += 1
+                return
+
+
+class PacketRateLimiter(object):
+    """
+    A token bucket limiting the data packets per second of one client.
+
+    The bucket holds at most `burst` tokens and refills at `rate` tokens per
+    second; every packet let through costs one token.  Packets arriving
+    while the bucket is empty are dropped or, with the Merge policy, summed
+    into a per-stream accumulator so the next packet let through is the
+    average of all packets since the last one (provided they have the same
+    length, otherwise the older ones are discarded).  The average is taken
+    in floating point and cast back to the dtype of the port, and the
+    merged packet carries the timestamp of the first packet it contains.  End of stream
+    packets are always let through.
+    """
+    def __init__(self, rate=0, policy=RatePolicyEnum.Drop, burst=1.0):
+        self.policy = policy
+        self.burst = burst
+
+        # Number of packets dropped or merged into another one
+        self.dropped = 0
+
+        self._rate = 0
+        self._tokens = burst
+        self._last = time.time()
+        self._pending = dict()
+        self._lock = threading.Lock()
+        self.rate = rate
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @rate.setter
+    def rate(self, value):
+        """
+        Packets per second (0 disables the limit)
+        """
+        with self._lock:
+            self._rate = max(value, 0)
+            self._tokens = self.burst
+            self._last = time.time()
+            self._pending.clear()
+
+    def reset(self, stream_id):
+        """
+        Discards the packets accumulated for the stream (e.g. on SRI change).
+        """
+        with self._lock:
+            self._pending.pop(stream_id, None)
+
+    def filter(self, data, ts, EOS, stream_id, dtype=None):
+        """
+        Returns the (data, ts) to deliver for this packet or None if it has
+        been dropped or merged.  Merged data is returned as a numpy array of
+        dtype (the dtype of the port's words, see bulkio_protocol.port_dtype).
+        """
+        if not self._rate:
+            return data, ts
+
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self._rate)
+            self._last = now
+
+            allowed = EOS or self._tokens >= 1.0
+            if allowed:
+                self._tokens = max(self._tokens - 1.0, 0.0)
+            else:
+                self.dropped += 1
+
+            if (self.policy != RatePolicyEnum.Merge or (dtype is None and isinstance(data, str))):
+                # Nothing to average in e.g. the URLs of dataFile ports
+                return (data, ts) if allowed else None
+
+            # Accumulate the packet with the previous ones of the stream
+            samples = numpy.frombuffer(data, dtype) if isinstance(data, str) else numpy.asarray(data, dtype)
+            total, count, first_ts = self._pending.pop(stream_id, (None, 0, ts))
+            if total is None or total.shape != samples.shape:
+                total, count, first_ts = samples.astype(numpy.result_type(samples, numpy.float64)), 0, ts
+            else:
+                total += samples
+            count += 1
+
+            if not allowed:
+                self._pending[stream_id] = (total, count, first_ts)
+                return None
+            if count == 1:
+                return data, ts
+            average = total / count
+            if (samples.dtype.kind in 'iu'):
+                average = numpy.rint(average)
+            return average.astype(samples.dtype), first_ts
+
+
+class PacketCoalescer(object):
+    """
+    Concatenates consecutive packets of a stream into one packet.
+
+    Packets of a stream are held until `window` milliseconds have passed
+    since the first one or `maxBytes` bytes are held (either limit can be
+    0 to disable it, both 0 disables the coalescing).  The held packets are
+    released at once, and before the new packet, when the stream's SRI
+    changes; an end of stream packet is appended to them and released
+    right away.  A released packet carries the timestamp of its first
+    packet.
+
+    Packets are released by calling emit(data, ts, EOS, stream_id, sri)
+    while holding the lock of the coalescer, so that the packets of a
+    stream keep their order whether they are released by add() on the
+    omniORB thread or by expire() on a timer.
+    """
+    def __init__(self, window=0, maxBytes=0):
+        self.window = window
+        self.maxBytes = maxBytes
+
+        # Number of packets merged into another one
+        self.coalesced = 0
+
+        self._pending = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.window or self.maxBytes)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, data, ts, EOS, stream_id, sri, emit):
+        """
+        Holds the packet or releases it with the packets held before it.
+        """
+        with self._lock:
+            pending = self._pending.get(stream_id, None)
+            if (pending is not None and pending['sri'] is not sri):
+                # Don't mix SRIs in one packet
+                self._release(stream_id, emit)
+                pending = None
+
+            if pending is None:
+                pending = dict(chunks=[], bytes=0, ts=ts, sri=sri, start=time.time())
+                self._pending[stream_id] = pending
+            else:
+                self.coalesced += 1
+            pending['chunks'].append(data)
+            pending['bytes'] += _nbytes(data)
+
+            if (EOS or (self.maxBytes and pending['bytes'] >= self.maxBytes) or
+                    (self.window and (time.time() - pending['start']) * 1000.0 >= self.window)):
+                self._release(stream_id, emit, EOS)
+
+    def expire(self, emit):
+        """
+        Releases the packets held longer than the window and returns the
+        number of streams that still have packets held.
+        """
+        with self._lock:
+            now = time.time()
+            for stream_id, pending in self._pending.items():
+                if (not self.window or (now - pending['start']) * 1000.0 >= self.window):
+                    self._release(stream_id, emit)
+            return len(self._pending)
+
+    def flush(self, emit):
+        """
+        Releases all the held packets.
+        """
+        with self._lock:
+            for stream_id in self._pending.keys():
+                self._release(stream_id, emit)
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+
+    def _release(self, stream_id, emit, EOS=False):
+        # Concatenates the held packets of the stream.  Caller holds the lock.
+        pending = self._pending.pop(stream_id)
+        chunks = pending['chunks']
+        if (len(chunks) == 1):
+            data = chunks[0]
+        elif isinstance(chunks[0], str):
+            data = ''.join(chunks)
+        elif isinstance(chunks[0], numpy.ndarray):
+            data = numpy.concatenate(chunks)
+        else:
+            data = []
+            for chunk in chunks:
+                data.extend(chunk)
+        emit(data, pending['ts'], EOS, stream_id, pending['sri'])
+
+def _nbytes(data):
+    # Size of a packet; lists from omniORB are counted as 8 bytes per word
+    if isinstance(data, str):
+        return len(data)
+    if isinstance(data, numpy.ndarray):
+        return data.nbytes
+    return 8 * len(data)
@@ -20,20 +20,31 @@
 # system imports
 import logging
 
-from bulkio.bulkioInterfaces import BULKIO__POA
 from bulkio import sri
 from ossie.properties import props_to_dict
-from omniORB import CORBA
 
 # third party imports
 from tornado import ioloop, gen, websocket
+from tornado.escape import json_encode
 
 import time
 import json
+import math
+import datetime
+import fnmatch
+import re
+import threading
+import numpy
 import bulkio_limiter
+import bulkio_protocol
+import bulkio_flow
+import bulkio_dsp
 
 from model.domain import Domain, ResourceNotFound
-from asyncport import AsyncPort
+import bulkio_hub
+import bulkio_stats
+import bulkio_trace
+import bulkio_worker
 
 from crossdomainsocket import CrossDomainSockets
 
@@ -43,12 +54,65 @@ def enum(**enums):
 # Control messages are a dictionary of type and value.  The type should be
 # one of these enumerations.
 # E.g.:     ControlMessage = { 'type': 0, 'value': 1024 }
-ControlEnum = enum(xMax=0, xBegin=1, xEnd=2, xZoomIn=3, xZoomReset=4, yMax=5, yBegin=6, yEnd=7, yZoomIn=8, yZoomReset=9, MaxPPS=10)
+ControlEnum = enum(xMax=0, xBegin=1, xEnd=2, xZoomIn=3, xZoomReset=4, yMax=5, yBegin=6, yEnd=7, yZoomIn=8, yZoomReset=9, MaxPPS=10, Protocol=11, QueueSize=12, DropPolicy=13, PPSPolicy=14, xDecimation=15, yDecimation=16, Mode=17, FFTSize=18, FFTOverlap=19, FFTWindow=20, FFTAverages=21, WaterfallRows=22, WaterfallInterval=23, CoalesceWindow=24, CoalesceBytes=25, Precision=26, Subscribe=27)
 
+# Wire encodings of data packets, selected with the 'format' query argument
+# (e.g. ws://.../bulkio?format=binary) or a Protocol control message.
+#   JSON        - every packet is a JSON message carrying the full SRI
+#   Binary      - binary frames, see bulkio_protocol for the layout
+#   CompactJSON - JSON packets carrying only the timestamp, data and the
+#                 version of the SRI, which is sent as its own message
+#                 whenever it changes (same as for Binary)
+ProtocolEnum = enum(JSON=0, Binary=1, CompactJSON=2)
 
-class BulkIOWebsocketHandler(CrossDomainSockets):
-    def initialize(self, close_future, kind, redhawk=None, _ioloop=None):
-        self.close_future = close_future
+# Names of the encodings as accepted in the 'format' query argument
+PROTOCOL_NAMES = {
+    'json':         ProtocolEnum.JSON,
+    'binary':       ProtocolEnum.Binary,
+    'json-compact': ProtocolEnum.CompactJSON,
+}
+
+# Processing applied to the packets before they are limited, selected with
+# the 'mode' query argument or a Mode control message.
+#   Raw - the samples as they are
+#   PSD - averaged power spectral density frames in dB, see bulkio_dsp
+#         (configured with the fftsize, overlap, window and averages query
+#         arguments or the FFT* control messages)
+ModeEnum = enum(Raw=0, PSD=1)
+
+# Names of the modes as accepted in the 'mode' query argument
+MODE_NAMES = {
+    'raw': ModeEnum.Raw,
+    'psd': ModeEnum.PSD,
+}
+
+# A client only receives the streams it subscribed to, set with the 'streams'
+# query argument (comma-separated stream IDs or a shell-style pattern such as
+# 'tuner_*') or a Subscribe control message whose value is a list of stream
+# IDs, a pattern or null for all streams.  The client is sent a 'streams'
+# message listing the streams of the port whenever they or the subscription
+# change, see bulkio_protocol.streams_message().
+
+# Independently of the mode, real 1D frames (e.g. spectra) can be stacked
+# into a waterfall of the last N frames, sent as one 2D packet per interval.
+# It is enabled with the 'waterfall' (number of rows) and 'interval'
+# (milliseconds) query arguments or the Waterfall* control messages.
+
+
+class BulkIOClient(object):
+    """
+    The per-client packet pipeline of the bulkio handlers, independent of
+    the transport: the hub callbacks, the limiting and processing of the
+    packets on the worker threads and their encoding into the send queue.
+
+    Subclasses call _setup() from initialize(), _parseArguments() and
+    _attach() when the client connects and _detach() when it goes away,
+    and implement _drain() to write the queued messages to the client.
+    """
+    # How the client is connected, for bulkio_stats
+    _transport = None
+
+    def _setup(self, kind, redhawk=None, _ioloop=None):
         self.kind = kind
         self.redhawk = redhawk
         if not _ioloop:
@@ -78,47 +142,690 @@ class BulkIOWebsocketHandler(CrossDomainSockets):
         self._xFactor = 1
         self._yFactor = 1
 
+        # The down-sampling operation of each axis (bulkio_limiter.DecimateEnum)
+        self._xDecimation = bulkio_limiter.DecimateEnum.Mean
+        self._yDecimation = bulkio_limiter.DecimateEnum.Mean
+
+        # Map of streamID to (settings version, bulkio_limiter.LimitPlan) of
+        # the last packet limited; the version changes with every control
+        # message so the plans are rebuilt with the new settings
+        self._limitPlans = dict()
+        self._limitVersion = 0
+
+        # Map of streamID to (SRI, trace) held by the MaxHold X decimation
+        self._maxHold = dict()
+
+        # Map of streamID to the state of the FIR X decimation, see _decimate()
+        self._decimators = dict()
+
+        # Processing mode and the settings of the PSD mode
+        self._mode = ModeEnum.Raw
+        self._fftSize = bulkio_dsp.DEFAULT_FFT_SIZE
+        self._fftOverlap = bulkio_dsp.DEFAULT_OVERLAP
+        self._fftWindow = bulkio_dsp.DEFAULT_WINDOW
+        self._fftAverages = bulkio_dsp.DEFAULT_AVERAGES
+
+        # Map of streamID to (SRI, spectrum SRI, PowerSpectrum) in PSD mode
+        self._spectra = dict()
+
+        # Number of rows (0 disables) and milliseconds between the frames of
+        # the waterfall accumulation
+        self._waterfallRows = 0
+        self._waterfallInterval = bulkio_dsp.DEFAULT_RASTER_INTERVAL
+
+        # Map of streamID to the waterfall state, see _accumulate()
+        self._rasters = dict()
+
         # Map of SRIs seen on this port.
         self._SRIs = dict()
 
+        # The streams of the port that have not ended, and the subscription
+        # of the client with the predicate of the stream IDs it accepts (None
+        # accepts all of them)
+        self._streams = set()
+        self._streamsLock = threading.Lock()
+        self._subscription = None
+        self._accept = None
+
+        # Wire encoding of the data packets
+        self._protocol = ProtocolEnum.JSON
+
+        # Precision of the samples sent (bulkio_protocol.PrecisionEnum)
+        self._precision = bulkio_protocol.PrecisionEnum.Native
+
+        # Map of streamID to (version, SRI dictionary) last sent to the client
+        # in the Binary and CompactJSON modes.
+        self._sentSRIs = dict()
+
+        # Map of streamID to (SRI, keywords dictionary) so the keywords of
+        # an SRI are only converted once
+        self._keywords = dict()
+
+        # Bounded queue of outgoing messages, drained by the ioloop while
+        # Tornado's write buffer for this client is below _maxWriteBuffer
+        self._sendQueue = bulkio_flow.SendQueue()
+        self._maxWriteBuffer = bulkio_flow.DEFAULT_MAX_WRITE_BUFFER
+        self._closed = False
+
+        # Limits the packets per second delivered to this client (MaxPPS)
+        self._rateLimiter = bulkio_flow.PacketRateLimiter()
+
+        # Concatenates small packets of a stream into one (a window in
+        # milliseconds and/or a number of bytes, both 0 by default)
+        self._coalescer = bulkio_flow.PacketCoalescer()
+        self._coalesceScheduled = False
+
+        # The shared connection to the port this client is attached to
+        self.hub = None
+        self._connectionId = None
+
+        # Counters and ID of the client in bulkio_stats while it is attached
+        self._stats = bulkio_stats.Counters()
+        self._statsId = None
+        self._portPath = None
+        self._opened = None
+
+    def _parseArguments(self):
+        """
+        Applies the settings passed as query arguments, raising ValueError
+        if one is not valid.
+        """
+        protocol = self.get_argument('format', 'json')
+        if protocol not in PROTOCOL_NAMES:
+            raise ValueError("Unknown format '%s'" % protocol)
+        self._protocol = PROTOCOL_NAMES[protocol]
+        precision = self.get_argument('precision', 'native')
+        if precision not in bulkio_protocol.PRECISION_NAMES:
+            raise ValueError("Unknown precision '%s'" % precision)
+        self._precision = bulkio_protocol.PRECISION_NAMES[precision]
+        self._sendQueue.maxsize = max(int(self.get_argument('queue', self._sendQueue.maxsize)), 1)
+        policy = self.get_argument('policy', None)
+        if policy:
+            if policy not in bulkio_flow.DROP_POLICY_NAMES:
+                raise ValueError("Unknown drop policy '%s'" % policy)
+            self._sendQueue.policy = bulkio_flow.DROP_POLICY_NAMES[policy]
+        ppsPolicy = self.get_argument('ppspolicy', None)
+        if ppsPolicy:
+            if ppsPolicy not in bulkio_flow.RATE_POLICY_NAMES:
+                raise ValueError("Unknown PPS policy '%s'" % ppsPolicy)
+            self._rateLimiter.policy = bulkio_flow.RATE_POLICY_NAMES[ppsPolicy]
+        self._rateLimiter.rate = max(float(self.get_argument('maxpps', 0)), 0.0)
+        self._coalescer.window = max(int(self.get_argument('coalesce', 0)), 0)
+        self._coalescer.maxBytes = max(int(self.get_argument('coalescebytes', 0)), 0)
+        mode = self.get_argument('mode', 'raw')
+        if mode not in MODE_NAMES:
+            raise ValueError("Unknown mode '%s'" % mode)
+        self._mode = MODE_NAMES[mode]
+        self._fftSize = int(self.get_argument('fftsize', self._fftSize))
+        self._fftOverlap = int(self.get_argument('overlap', self._fftOverlap))
+        window = self.get_argument('window', None)
+        if window:
+            if window not in bulkio_dsp.WINDOW_NAMES:
+                raise ValueError("Unknown window '%s'" % window)
+            self._fftWindow = bulkio_dsp.WINDOW_NAMES[window]
+        self._fftAverages = int(self.get_argument('averages', self._fftAverages))
+        # Fail on bad PSD settings before connecting
+        bulkio_dsp.PowerSpectrum(self._fftSize, self._fftOverlap, self._fftWindow, self._fftAverages)
+        self._waterfallRows = max(int(self.get_argument('waterfall', 0)), 0)
+        self._waterfallInterval = max(int(self.get_argument('interval', self._waterfallInterval)), 0)
+        streams = self.get_argument('streams', None)
+        if streams is not None:
+            if any(c in streams for c in '*?['):
+                self._subscribe(streams, notify=False)
+            else:
+                self._subscribe([stream for stream in streams.split(',') if stream], notify=False)
+        self._xMax = max(int(self.get_argument('xmax', 0)), 0)
+        self._yMax = max(int(self.get_argument('ymax', 0)), 0)
+        for axis in ('x', 'y'):
+            decimation = self.get_argument(axis + 'decimation', None)
+            if decimation:
+                if decimation not in bulkio_limiter.DECIMATE_NAMES:
+                    raise ValueError("Unknown decimation '%s'" % decimation)
+                setattr(self, '_%sDecimation' % axis, bulkio_limiter.DECIMATE_NAMES[decimation])
+
     @gen.coroutine
-    def open(self, *args):
-        try:
-            logging.debug("BulkIOWebsocketHandler open kind=%s, path=%s", self.kind, args)
-            obj, path = yield self.redhawk.get_object_by_path(args, path_type=self.kind)
-            logging.debug("Found object %s", dir(obj))
+    def _attach(self, args):
+        """
+        Attaches the client to the hub of the port at the path args (the
+        object path, port name and optional connection ID).
+        """
+        obj, path = yield self.redhawk.get_object_by_path(args, path_type=self.kind)
+        logging.debug("Found object %s", dir(obj))
+
+        self.port, bulkio_poa = bulkio_hub.find_port(obj, path[0])
+        logging.debug("Found port %s", self.port)
 
-            for p in obj.ports:
-                if p.name == path[0]:
-                    if p._direction == 'Uses':
-                        namespace = p._using.nameSpace
+        # An explicit connection ID gets its own connection
+        connectionId = None
+        if len(path) > 1 and path[1]:
+            connectionId = path[1][1:]
 
-                        if namespace == 'BULKIO':
-                            self.port = p
-                            logging.debug("Found port %s", self.port)
+        # Share one port connection between all clients of the port (and
+        # connection ID)
+        self.hub = bulkio_hub.attach((self.kind,) + tuple(args),
+            self.port, bulkio_poa, self, connectionId)
+        self._connectionId = self.hub.connection_id
+        logging.info("Attached client to %s, %s", self.port, self._connectionId)
+        self._portPath = '/'.join(arg.strip('/') for arg in args if arg)
+        self._opened = datetime.datetime.utcnow()
+        self._statsId = bulkio_stats.register(self)
 
-                            data_type = p._using.name
-                            bulkio_poa = getattr(BULKIO__POA, data_type)
-                            logging.debug(bulkio_poa)
+        if self._closed:
+            # The client went away while the port was being looked up
+            self._detach()
 
-                            self.async_port = AsyncPort(bulkio_poa, self._pushSRI, self._pushPacket)
+    def _detach(self):
+        if self._statsId:
+            bulkio_stats.unregister(self._statsId)
+        hub, self.hub = self.hub, None
+        if hub:
+            bulkio_hub.detach(hub, self)
+            logging.info("Detached client from %s, %s", self.port, self._connectionId)
 
-                            if len(path) == 3:
-                                self._connectionId = path[2][1:]
-                            else:
-                                self._connectionId = 'rest-python-%s' % id(self)
+    def _subscribe(self, subscription, notify=True):
+        """
+        Only passes the packets of the streams whose IDs are in the list
+        subscription or match it as a shell-style pattern, or of all streams
+        if it is None.  Sends the listing of the streams if notify.
+        """
+        if subscription is None:
+            accept = None
+        elif isinstance(subscription, basestring):
+            accept = re.compile(fnmatch.translate(subscription)).match
+        elif isinstance(subscription, (list, tuple)):
+            accept = frozenset(subscription).__contains__
+        else:
+            raise ValueError('A subscription is a list of stream IDs, a pattern or null')
+        self._subscription = subscription
+        self._accept = accept
+        logging.info('Bulkio client subscribed to streams {0}'.format(subscription))
+        if notify:
+            self._sendStreams()
 
-                            self.port.ref.connectPort(self.async_port.getPort(), self._connectionId)
-                            logging.info("Opened websocket to %s, %s", self.port, self._connectionId)
+    def _sendStreams(self):
+        """
+        Sends the listing of the streams of the port and of those the client
+        is subscribed to.
+        """
+        with self._streamsLock:
+            streams = sorted(self._streams)
+        accept = self._accept
+        subscribed = [stream for stream in streams if accept is None or accept(stream)]
+        self._send(bulkio_protocol.streams_message(streams, subscribed, self._subscription), droppable=False)
 
-                            break
-                        else:
-                            raise ValueError("Port '%s' is not a BULKIO port" % path[0])
-                    else:
-                        raise ValueError("Port '%s' is not a uses" % path[0])
+    def _pushSRI(self, newSRI):
+        with self._streamsLock:
+            added = newSRI.streamID not in self._streams
+            self._streams.add(newSRI.streamID)
+        if added:
+            self._sendStreams()
+        accept = self._accept
+        if (accept is not None and not accept(newSRI.streamID)):
+            # Kept for a later subscription, nothing else to do
+            self._SRIs[newSRI.streamID] = (newSRI, True)
+            return
+
+        origSRI, changed = self._getSRI(newSRI.streamID)
+        if origSRI is not None:
+            changed = sri.compare(origSRI, newSRI)
+        self._SRIs[newSRI.streamID] = (newSRI, changed)
+        # Don't merge packets across an SRI change (sri.compare() is True
+        # when the SRIs are the same)
+        if (origSRI is None or not sri.compare(origSRI, newSRI)):
+            self._rateLimiter.reset(newSRI.streamID)
+
+    def _getSRI(self, streamID):
+        return self._SRIs.get(streamID, (None, True))
+
+    def _pushPacket(self, data, ts, EOS, stream_id):
+        if EOS:
+            with self._streamsLock:
+                ended = stream_id in self._streams
+                self._streams.discard(stream_id)
+            if ended:
+                self._sendStreams()
+
+        # Drop the streams the client is not subscribed to before anything
+        # else is done with them
+        accept = self._accept
+        if (accept is not None and not accept(stream_id)):
+            self._stats.filtered += 1
+            return
+
+        # Retrieve SRI from stream_id now since it may change before the
+        # packet is processed
+        sri, _ = self._getSRI(stream_id)
+        self._stats.packetsIn += 1
+        self._stats.samplesIn += len(data) // (2 if (sri is not None and sri.mode) else 1)
+
+        if not self._coalescer.enabled:
+            trace = bulkio_trace.current()
+            if trace is not None:
+                trace = trace.fork('dispatch')
+            self._forwardPacket(data, ts, EOS, stream_id, sri, trace)
+            return
+
+        # Hold small packets and forward them as one
+        self._coalescer.add(data, ts, EOS, stream_id, sri, self._forwardPacket)
+        if (self._coalescer.window and len(self._coalescer) and not self._coalesceScheduled):
+            self._coalesceScheduled = True
+            self._ioloop.add_callback(self._scheduleCoalesced)
+
+    def _scheduleCoalesced(self):
+        # Releases the held packets once their window has passed
+        self._ioloop.add_timeout(datetime.timedelta(milliseconds=self._coalescer.window), self._expireCoalesced)
+
+    def _expireCoalesced(self):
+        if (self._coalescer.expire(self._forwardPacket) and not self._closed and self._coalescer.window):
+            self._scheduleCoalesced()
+            return
+        self._coalesceScheduled = False
+        # A packet may have been held after expire() and before the flag was cleared
+        if (len(self._coalescer) and not self._closed and self._coalescer.window):
+            self._coalesceScheduled = True
+            self._scheduleCoalesced()
+
+    def _flushCoalesced(self):
+        # Releases everything held, e.g. when the coalescing settings change
+        self._coalescer.flush(self._forwardPacket)
+
+    def _forwardPacket(self, data, ts, EOS, stream_id, sri, trace=None):
+        # Drop or merge packets beyond the client's packets per second
+        delivered = self._rateLimiter.filter(data, ts, EOS, stream_id,
+            bulkio_protocol.port_dtype(self.port._using.name))
+        if delivered is None:
+            return
+        data, ts = delivered
+
+        currentSRI, sriChangedFromPacket = self._getSRI(stream_id)
+        if (currentSRI is not sri):
+            sriChangedFromPacket = True
+
+        # Return to the ORB right away, the rest happens on a worker thread
+        # (in order for each stream of this client)
+        bulkio_worker.submit((self, stream_id), self._processPacket,
+            data, ts, EOS, stream_id, sri, sriChangedFromPacket, trace)
+
+    def _processPacket(self, data, ts, EOS, stream_id, sri, sriChangedFromPacket, trace=None):
+        if self._closed:
+            return
+        dtype = bulkio_protocol.port_dtype(self.port._using.name)
+
+        # _sendPacket() picks the trace up
+        if trace is not None:
+            trace.mark('queue')
+        previous = bulkio_trace.activate(trace)
+        try:
+            if (self._mode == ModeEnum.PSD):
+                self._processSpectrum(data, ts, EOS, stream_id, sri, dtype)
+            elif (self._xDecimation == bulkio_limiter.DecimateEnum.FIR and self._xMax and
+                  not sri.subsize and self._xBegin is None and self._xEnd is None):
+                self._decimate(data, ts, EOS, stream_id, sri, sriChangedFromPacket, dtype)
             else:
-                raise ValueError("Could not find port of name '%s'" % path[0])
+                self._deliver(data, ts, EOS, stream_id, sri, sriChangedFromPacket, dtype)
+        finally:
+            bulkio_trace.activate(previous)
+
+    def _processSpectrum(self, data, ts, EOS, stream_id, sri, dtype):
+        """
+        Feeds the packet to the PowerSpectrum of the stream and sends the
+        frames it completes (plus an empty one for the end of stream).
+        """
+        spectra = self._spectra
+        inSRI, psdSRI, spectrum = spectra.get(stream_id, (None, None, None))
+        if (inSRI is not sri):
+            # New stream or SRI (e.g. sample rate), start over
+            psdSRI = bulkio_dsp.spectrum_sri(sri, self._fftSize)
+            spectrum = bulkio_dsp.PowerSpectrum(self._fftSize, self._fftOverlap, self._fftWindow, self._fftAverages)
+            spectra[stream_id] = (sri, psdSRI, spectrum)
+            sriChanged = True
+        else:
+            sriChanged = False
+
+        for frame, frameTime in spectrum.push(data, ts, sri, dtype):
+            self._deliver(frame, frameTime, False, stream_id, psdSRI, sriChanged, bulkio_dsp.SPECTRUM_DTYPE)
+            sriChanged = False
+
+        if EOS:
+            spectra.pop(stream_id, None)
+            self._deliver(numpy.empty(0, bulkio_dsp.SPECTRUM_DTYPE), ts, True, stream_id, psdSRI, sriChanged, bulkio_dsp.SPECTRUM_DTYPE)
+
+    def _decimate(self, data, ts, EOS, stream_id, sri, sriChanged, dtype):
+        """
+        Low-pass filters and decimates a 1D packet with the Decimator of its
+        stream, which carries the filter state from packet to packet, and
+        delivers the samples it completes with the decimated SRI.  The
+        factor brings the first packet of the stream (or SRI, or xMax) down
+        to xMax; longer packets are limited further by the plan.
+        """
+        decimators = self._decimators
+        state = decimators.get(stream_id, None)
+        if (state is None or state['sri'] is not sri or state['xMax'] != self._xMax):
+            samples = len(data) // 2 if sri.mode else len(data)
+            if not samples:
+                # Nothing to size the filter with yet
+                self._deliver(data, ts, EOS, stream_id, sri, sriChanged, dtype)
+                return
+            factor = max(int(math.ceil(samples / float(self._xMax))), 1)
+            outSRI = bulkio_limiter.copy_sri(sri)
+            outSRI.xdelta = sri.xdelta * factor
+            state = dict(sri=sri, outSRI=outSRI, xMax=self._xMax, changed=True,
+                         decimator=bulkio_dsp.Decimator(factor) if factor > 1 else None)
+            decimators[stream_id] = state
+        state['changed'] = state['changed'] or sriChanged
+        if EOS:
+            decimators.pop(stream_id, None)
+
+        decimator = state['decimator']
+        if decimator is None:
+            # Already within xMax
+            self._deliver(data, ts, EOS, stream_id, sri, state['changed'], dtype)
+            state['changed'] = False
+            return
+        words, firstTime = decimator.push(data, ts, sri, dtype)
+        if (firstTime is None and not EOS):
+            # Not a full output sample yet, the SRI change goes with the next
+            return
+        self._deliver(words, firstTime if firstTime is not None else ts, EOS, stream_id,
+                      state['outSRI'], state['changed'], words.dtype, decimator.factor)
+        state['changed'] = False
+
+    def _deliver(self, data, ts, EOS, stream_id, sri, sriChanged, dtype, xDecimated=1):
+        """
+        Sends a packet, or stacks it into the waterfall of its stream if the
+        waterfall accumulation is enabled and the packet is a real 1D frame.
+        xDecimated is the X decimation the packet already went through (see
+        _decimate()).
+        """
+        if (self._waterfallRows > 0 and not sri.subsize and not sri.mode):
+            self._accumulate(data, ts, EOS, stream_id, sri, dtype, xDecimated)
+        else:
+            self._sendPacket(data, ts, EOS, stream_id, sri, sriChanged, dtype, xDecimated)
+
+    def _accumulate(self, data, ts, EOS, stream_id, sri, dtype, xDecimated=1):
+        """
+        Adds a 1D frame to the Raster of the stream and sends the raster as
+        a 2D packet (oldest row first, limited like any other packet) once
+        the waterfall interval has passed since the last one.
+        """
+        rasters = self._rasters
+        state = rasters.get(stream_id, None)
+        frame = bulkio_limiter.toSamples(data, False, dtype)
+
+        if len(frame):
+            if (state is None or state['sri'] is not sri or state['raster'].cols != len(frame)):
+                # New stream, SRI or frame size, start a new raster
+                rasterSRI = bulkio_limiter.copy_sri(sri)
+                rasterSRI.subsize = len(frame)
+                rasterSRI.ystart = 0.0
+                rasterSRI.yunits = bulkio_dsp.UNITS_TIME
+                state = dict(sri=sri, rasterSRI=rasterSRI, changed=True, sent=0.0,
+                             raster=bulkio_dsp.Raster(self._waterfallRows, len(frame), frame.dtype))
+                rasters[stream_id] = state
+            state['raster'].push(frame, ts)
+        elif (state is None):
+            if EOS:
+                self._sendPacket(data, ts, EOS, stream_id, sri, True, dtype, xDecimated)
+            return
+
+        if EOS:
+            rasters.pop(stream_id, None)
+        now = time.time()
+        if (EOS or (now - state['sent']) * 1000.0 >= self._waterfallInterval):
+            state['sent'] = now
+            raster = state['raster']
+            rasterSRI = state['rasterSRI']
+            if (rasterSRI.ydelta != raster.ydelta):
+                # A new SRI object rather than an update in place, which
+                # the cached limit plan would not notice
+                rasterSRI = state['rasterSRI'] = bulkio_limiter.copy_sri(rasterSRI)
+                rasterSRI.ydelta = raster.ydelta
+                state['changed'] = True
+            matrix, firstTime = raster.snapshot()
+            self._sendPacket(matrix.ravel(), firstTime, EOS, stream_id, rasterSRI, state['changed'], dtype, xDecimated)
+            state['changed'] = False
+
+    def _sendPacket(self, data, ts, EOS, stream_id, sri, sriChangedFromPacket, dtype, xDecimated=1):
+        """
+        Limits a packet and queues it for the client in its wire encoding.
+        The X factor of the limiter is multiplied by xDecimated, the X
+        decimation the packet already went through, so that the zoom
+        indexes of the client map back to the samples of the port.
+        """
+        started = time.time()
+        # Only the first packet sent for a traced packet is traced
+        trace = bulkio_trace.activate(None)
+
+        # Check if any limiting parameter exists
+        if (self._hasLimitingParameter() and not bulkio_worker.in_process(len(data))):
+            # Limit with the plan of the stream, worked out again only when
+            # the packet length, SRI or settings change
+            plan = self._limitPlan(stream_id, data, sri, dtype)
+            outData = plan.apply(data)
+            outSRI, self._xFactor, self._yFactor, sriChangedFromLimiter = plan.outSRI, plan.xFactor * xDecimated, plan.yFactor, plan.sriChanged
+            if EOS:
+                self._limitPlans.pop(stream_id, None)
+        elif (self._hasLimitingParameter()):
+            # Call the limit function with the down-sampling operation of each axis
+            outData, outSRI, self._xFactor, self._yFactor, sriChangedFromLimiter, warningMessage = bulkio_worker.limit(
+                data, sri, self._xMax, self._xBegin, self._xEnd, self._xDecimation,
+                self._yMax, self._yBegin, self._yEnd, self._yDecimation, dtype
+            )
+            self._xFactor *= xDecimated
+
+            # Logging for debug (comment out operationally)
+            #logging.info("connection_id: " + str(self._connectionId))
+            #logging.info("bulkio_limiter info: \n" +
+            #             "    originalWordLength="+str(len(data))+", finalWordLength="+str(len(outData))+", originalSubsize="+str(sri.subsize)+", finalSubsize="+str(outSRI.subsize)+"\n"+
+            #             "    xMax="+str(self._xMax)+", xBegin="+str(self._xBegin)+", xEnd="+str(self._xEnd)+", xDownSampFactor="+str(self._xFactor)+"\n"+
+            #             "    yMax="+str(self._yMax)+", yBegin="+str(self._yBegin)+", yEnd="+str(self._yEnd)+", yDownSampFactor="+str(self._yFactor)+"\n"+
+            #             "    sriChangedFromLimiter="+str(sriChangedFromLimiter))
+
+            # Print warnings if they exist
+            if (warningMessage):
+                logging.warning('bulkio_limiter.limit(): ' + warningMessage)
+        else:
+            # Don't do anything if no limiting parameter exists
+            outData = data
+            outSRI = sri
+            sriChangedFromLimiter = False
 
+        sriChanged = sriChangedFromPacket or sriChangedFromLimiter
+        limited = time.time()
+        self._stats.limitSeconds += limited - started
+        if trace is not None:
+            trace.mark('limit')
+
+        if (self._xDecimation == bulkio_limiter.DecimateEnum.MaxHold):
+            outData, outSRI = self._applyMaxHold(stream_id, outData, outSRI, sri, EOS, dtype)
+
+        # Reduce the precision of the samples for display clients (octet
+        # and char samples are as small as they get, short of the log scale)
+        scale, offset = None, 0.0
+        if (self._precision != bulkio_protocol.PrecisionEnum.Native and dtype is not None and
+                (dtype.itemsize > 1 or self._precision == bulkio_protocol.PrecisionEnum.Int8Log)):
+            outData, outSRI, scale, offset = bulkio_protocol.quantize(
+                outData, dtype, self._precision, outSRI, is_db=(self._mode == ModeEnum.PSD))
+            dtype = outData.dtype
+            if (self._protocol != ProtocolEnum.Binary and self._precision == bulkio_protocol.PrecisionEnum.Float32):
+                # Keep JSON from printing 17 digits of every float32
+                outData = bulkio_protocol.round_significant(outData, 7)
+
+        # Tack on SRI, Package, Deliver.
+        samples = len(outData) // (2 if outSRI.mode else 1)
+        sriDict = dict(outSRI.__dict__, keywords=self._getKeywords(stream_id, sri))
+        if (self._protocol == ProtocolEnum.Binary and dtype is not None):
+            sriVersion, sriChanged = self._updateSentSRI(stream_id, sriDict)
+            frame = bulkio_protocol.binary_packet(
+                outData, dtype, stream_id, ts, EOS, outSRI, sriVersion, sriChanged,
+                self._sendQueue.dropped, scale, offset)
+            self._send(frame, True, stream_id, droppable=not EOS, trace=trace)
+        elif (self._protocol == ProtocolEnum.CompactJSON):
+            sriVersion, _ = self._updateSentSRI(stream_id, sriDict)
+            packet = dict(
+                streamID   = stream_id,
+                T          = ts.__dict__,
+                EOS        = EOS,
+                sriVersion = sriVersion,
+                dropped    = self._sendQueue.dropped,
+                samples    = samples,
+                dataBuffer = bulkio_protocol.to_list(outData, dtype)
+                )
+            if (scale is not None):
+                packet.update(scale=scale, offset=offset)
+            self._send(packet, False, stream_id, droppable=not EOS, trace=trace)
+        else:
+            packet = dict(
+                streamID   = stream_id,
+                T          = ts.__dict__,
+                EOS        = EOS,
+                sriChanged = sriChanged,
+                SRI        = sriDict,
+                type       = self.port._using.name,
+                dropped    = self._sendQueue.dropped,
+                samples    = samples,
+                dataBuffer = bulkio_protocol.to_list(outData, dtype)
+                )
+            if (scale is not None):
+                packet.update(scale=scale, offset=offset)
+            self._send(packet, False, stream_id, droppable=not EOS, trace=trace)
+
+        self._stats.packetsOut += 1
+        self._stats.samplesOut += samples
+        self._stats.encodeSeconds += time.time() - limited
+
+    def _limitPlan(self, stream_id, data, sri, dtype):
+        """
+        Returns the limit plan of the stream for the packet, creating it if
+        the packet does not fit the cached one or the settings changed.
+        """
+        version = self._limitVersion
+        cachedVersion, plan = self._limitPlans.get(stream_id, (None, None))
+        if (cachedVersion != version or not plan.fits(len(data), sri) or plan.dtype != dtype):
+            plan = bulkio_limiter.LimitPlan(
+                len(data), sri, self._xMax, self._xBegin, self._xEnd, self._xDecimation,
+                self._yMax, self._yBegin, self._yEnd, self._yDecimation, dtype)
+            self._limitPlans[stream_id] = (version, plan)
+            # Warned once per plan rather than for every packet
+            if (plan.warningMessage):
+                logging.warning('bulkio_limiter.limit(): ' + plan.warningMessage)
+        return plan
+
+    def _applyMaxHold(self, stream_id, outData, outSRI, inSRI, EOS, dtype=None):
+        """
+        Holds the max of every sample of a real 1D stream across packets and
+        returns the packet as two rows: the current trace and the held one.
+        The hold restarts when a new SRI is pushed or the length changes.
+        """
+        if (outSRI.subsize > 0 or outSRI.mode or (dtype is None and isinstance(outData, str))):
+            return outData, outSRI
+        current = bulkio_protocol.to_array(outData, dtype) if isinstance(outData, str) else numpy.asarray(outData)
+        holdSRI, hold = self._maxHold.get(stream_id, (None, None))
+        if (holdSRI is not inSRI or hold.shape != current.shape):
+            hold = numpy.array(current, dtype=numpy.result_type(current, numpy.float32))
+        else:
+            numpy.maximum(hold, current, out=hold)
+        if EOS:
+            self._maxHold.pop(stream_id, None)
+        else:
+            self._maxHold[stream_id] = (inSRI, hold)
+
+        holdSRI = bulkio_limiter.copy_sri(outSRI)
+        holdSRI.subsize = len(current)
+        return numpy.concatenate((current, hold)), holdSRI
+
+    def _getKeywords(self, stream_id, streamSRI):
+        """
+        Returns the keywords of the SRI as a dictionary, converting them only
+        the first time this SRI is seen.
+        """
+        cachedSRI, keywords = self._keywords.get(stream_id, (None, None))
+        if cachedSRI is not streamSRI:
+            keywords = props_to_dict(streamSRI.keywords)
+            self._keywords[stream_id] = (streamSRI, keywords)
+        return keywords
+
+    def _updateSentSRI(self, stream_id, sriDict):
+        """
+        Returns the SRI version counter of the stream and whether it changed,
+        sending the SRI as a control message first if it differs from the last
+        one sent.
+        """
+        version, lastSRI = self._sentSRIs.get(stream_id, (0, None))
+        if (sriDict == lastSRI):
+            return version, False
+        version += 1
+        self._sentSRIs[stream_id] = (version, sriDict)
+        self._send(bulkio_protocol.sri_message(stream_id, version, sriDict), droppable=False)
+        return version, True
+
+    def _send(self, message, binary=False, stream_id=None, droppable=True, trace=None):
+        """
+        Queues a message for the client.  Safe to call from any thread.
+        """
+        if trace is not None:
+            trace.mark('build')
+        if self._sendQueue.put(message, binary, stream_id, droppable, trace):
+            self._ioloop.add_callback(self._drain)
+
+    def stats(self):
+        """
+        Returns the settings and counters of the client, see bulkio_stats.
+        """
+        info = self._stats.as_dict()
+        info.update(
+            transport     = self._transport,
+            kind          = self.kind,
+            port          = self._portPath,
+            connectionId  = self._connectionId,
+            remoteAddress = self.request.remote_ip,
+            opened        = self._opened.isoformat() + 'Z' if self._opened else None,
+            format        = [k for k, v in PROTOCOL_NAMES.items() if v == self._protocol][0],
+            mode          = [k for k, v in MODE_NAMES.items() if v == self._mode][0],
+            subscription  = self._subscription,
+            queued        = len(self._sendQueue),
+            queueSize     = self._sendQueue.maxsize,
+            dropped       = self._sendQueue.dropped,
+            rateDropped   = self._rateLimiter.dropped,
+            coalesced     = self._coalescer.coalesced,
+            maxpps        = self._rateLimiter.rate,
+            xMax          = self._xMax,
+            yMax          = self._yMax,
+            xFactor       = self._xFactor,
+            yFactor       = self._yFactor,
+            )
+        return info
+
+    def throttle(self, maxpps):
+        """
+        Limits the packets per second sent to the client (0 removes the limit).
+        """
+        self._rateLimiter.rate = max(maxpps, 0)
+
+    def _hasLimitingParameter(self):
+        # Check if any of the X axis parameters are not None
+        if (self._xMax or self._xBegin or self._xEnd):
+            return True
+        # Check if any of the Y axis parameters are not None
+        if (self._yMax or self._yBegin or self._yEnd):
+            return True
+        # Return false if all the parameters are None
+        return False
+
+
+class BulkIOWebsocketHandler(BulkIOClient, CrossDomainSockets):
+    _transport = 'websocket'
+
+    def initialize(self, close_future, kind, redhawk=None, _ioloop=None):
+        self.close_future = close_future
+        self._setup(kind, redhawk, _ioloop)
+
+    @gen.coroutine
+    def open(self, *args):
+        try:
+            logging.debug("BulkIOWebsocketHandler open kind=%s, path=%s", self.kind, args)
+            self._parseArguments()
+            yield self._attach(args)
         except ResourceNotFound, e:
             self.write_message(dict(error='ResourceNotFound', message=str(e)))
             self.close()
@@ -132,6 +839,11 @@ class BulkIOWebsocketHandler(CrossDomainSockets):
             # Parse a JSON string into a dictionary
             ctrl = json.loads(message)
 
+            # Select the streams sent (the value is not a number) -------------
+            if (ctrl['type'] == ControlEnum.Subscribe):
+                self._subscribe(ctrl['value'])
+                return
+
             # Convert the value to integer
             ctrlValueInt = int(ctrl['value'])
 
@@ -148,7 +860,7 @@ class BulkIOWebsocketHandler(CrossDomainSockets):
             elif (ctrl['type'] == ControlEnum.xBegin):
                 # Calculate the index based on the original packet size since we
                 # slice and then downsample in the bulkio_limiter
-                self._xBeginStaged = ctrlValueInt * self._xFactor
+                self._xBeginStaged = int(round(ctrlValueInt * self._xFactor))
                 # If there is already a start index, this means that we are
                 # zooming on a zoomed region and we need to adjust the indices
                 # to reflect the previously zoomed region.
@@ -159,7 +871,7 @@ class BulkIOWebsocketHandler(CrossDomainSockets):
             elif (ctrl['type'] == ControlEnum.xEnd):
                 # Calculate the index based on the original packet size since we
                 # slice and then downsample in the bulkio_limiter
-                self._xEndStaged = ctrlValueInt * self._xFactor
+                self._xEndStaged = int(round(ctrlValueInt * self._xFactor))
                 # If there is already a start index, this means that we are
                 # zooming on a zoomed region and we need to adjust the indices
                 # to reflect the previously zoomed region.
@@ -196,7 +908,7 @@ class BulkIOWebsocketHandler(CrossDomainSockets):
             elif (ctrl['type'] == ControlEnum.yBegin):
                 # Calculate the index based on the original packet size since we
                 # slice and then downsample in the bulkio_limiter
-                self._yBeginStaged = ctrlValueInt * self._yFactor
+                self._yBeginStaged = int(round(ctrlValueInt * self._yFactor))
                 # If there is already a start index, this means that we are
                 # zooming on a zoomed region and we need to adjust the indices
                 # to reflect the previously zoomed region.
@@ -207,7 +919,7 @@ class BulkIOWebsocketHandler(CrossDomainSockets):
             elif (ctrl['type'] == ControlEnum.yEnd):
                 # Calculate the index based on the original packet size since we
                 # slice and then downsample in the bulkio_limiter
-                self._yEndStaged = ctrlValueInt * self._yFactor
+                self._yEndStaged = int(round(ctrlValueInt * self._yFactor))
                 # If there is already a start index, this means that we are
                 # zooming on a zoomed region and we need to adjust the indices
                 # to reflect the previously zoomed region.
@@ -231,83 +943,139 @@ class BulkIOWebsocketHandler(CrossDomainSockets):
                 self._yEndStaged = None
                 logging.info('Zoom RESET commanded for the Y axis')
 
+            # Select the down-sampling operation ------------------------------
+            elif (ctrl['type'] == ControlEnum.xDecimation):
+                if (ctrlValueInt not in bulkio_limiter.DECIMATE_NAMES.values()):
+                    raise ValueError('Unknown decimation %d' % ctrlValueInt)
+                self._xDecimation = ctrlValueInt
+                # Start a new max-hold trace and new filters
+                self._maxHold = dict()
+                self._decimators = dict()
+                logging.info('Bulkio packets down-sampled with operation {0} on the X axis'.format(ctrlValueInt))
+            elif (ctrl['type'] == ControlEnum.yDecimation):
+                if (ctrlValueInt not in bulkio_limiter.DECIMATE_NAMES.values()):
+                    raise ValueError('Unknown decimation %d' % ctrlValueInt)
+                self._yDecimation = ctrlValueInt
+                logging.info('Bulkio packets down-sampled with operation {0} on the Y axis'.format(ctrlValueInt))
+
+            # Select the processing mode -------------------------------------
+            elif (ctrl['type'] == ControlEnum.Mode):
+                if (ctrlValueInt not in MODE_NAMES.values()):
+                    raise ValueError('Unknown mode %d' % ctrlValueInt)
+                self._mode = ctrlValueInt
+                self._spectra = dict()
+                logging.info('Bulkio packets processed with mode {0}'.format(ctrlValueInt))
+            elif (ctrl['type'] in (ControlEnum.FFTSize, ControlEnum.FFTOverlap, ControlEnum.FFTWindow, ControlEnum.FFTAverages)):
+                settings = dict(fftSize=self._fftSize, overlap=self._fftOverlap, window=self._fftWindow, averages=self._fftAverages)
+                name = {ControlEnum.FFTSize: 'fftSize', ControlEnum.FFTOverlap: 'overlap',
+                        ControlEnum.FFTWindow: 'window', ControlEnum.FFTAverages: 'averages'}[ctrl['type']]
+                settings[name] = ctrlValueInt
+                # Validate the settings before applying them
+                bulkio_dsp.PowerSpectrum(**settings)
+                self._fftSize = settings['fftSize']
+                self._fftOverlap = settings['overlap']
+                self._fftWindow = settings['window']
+                self._fftAverages = settings['averages']
+                self._spectra = dict()
+                logging.info('Bulkio PSD {0} set to {1}'.format(name, ctrlValueInt))
+
+            # Configure the waterfall accumulation ----------------------------
+            elif (ctrl['type'] == ControlEnum.WaterfallRows):
+                self._waterfallRows = max(ctrlValueInt, 0)
+                self._rasters = dict()
+                logging.info('Bulkio waterfall set to {0} rows'.format(self._waterfallRows))
+            elif (ctrl['type'] == ControlEnum.WaterfallInterval):
+                self._waterfallInterval = max(ctrlValueInt, 0)
+                logging.info('Bulkio waterfall sent every {0} ms'.format(self._waterfallInterval))
+
             # Set the max PPS --------------------------------------------------
             elif (ctrl['type'] == ControlEnum.MaxPPS):
-                logging.warning('Packets per second (PPS) not implemented yet.')
+                if (ctrlValueInt > 0):
+                    self._rateLimiter.rate = ctrlValueInt
+                    logging.info('Bulkio packets limited to {0} per second'.format(ctrlValueInt))
+                else:
+                    self._rateLimiter.rate = 0
+                    logging.info('Bulkio packets per second limit removed')
+            elif (ctrl['type'] == ControlEnum.PPSPolicy):
+                if (ctrlValueInt not in bulkio_flow.RATE_POLICY_NAMES.values()):
+                    raise ValueError('Unknown PPS policy %d' % ctrlValueInt)
+                self._rateLimiter.policy = ctrlValueInt
+                logging.info('Bulkio packets per second policy set to {0}'.format(ctrlValueInt))
+
+            # Configure the packet coalescing ---------------------------------
+            elif (ctrl['type'] == ControlEnum.CoalesceWindow):
+                self._coalescer.window = max(ctrlValueInt, 0)
+                self._flushCoalesced()
+                logging.info('Bulkio packets coalesced for {0} ms'.format(self._coalescer.window))
+            elif (ctrl['type'] == ControlEnum.CoalesceBytes):
+                self._coalescer.maxBytes = max(ctrlValueInt, 0)
+                self._flushCoalesced()
+                logging.info('Bulkio packets coalesced up to {0} bytes'.format(self._coalescer.maxBytes))
+
+            # Select the wire encoding -----------------------------------------
+            elif (ctrl['type'] == ControlEnum.Protocol):
+                if (ctrlValueInt not in PROTOCOL_NAMES.values()):
+                    raise ValueError('Unknown protocol %d' % ctrlValueInt)
+                self._protocol = ctrlValueInt
+                logging.info('Bulkio packets sent with protocol {0}'.format(ctrlValueInt))
+                # Make sure the new encoding starts with a full SRI
+                self._sentSRIs.clear()
+            elif (ctrl['type'] == ControlEnum.Precision):
+                if (ctrlValueInt not in bulkio_protocol.PRECISION_NAMES.values()):
+                    raise ValueError('Unknown precision %d' % ctrlValueInt)
+                self._precision = ctrlValueInt
+                logging.info('Bulkio packets sent with precision {0}'.format(ctrlValueInt))
+
+            # Configure the send queue -----------------------------------------
+            elif (ctrl['type'] == ControlEnum.QueueSize):
+                self._sendQueue.maxsize = max(ctrlValueInt, 1)
+                logging.info('Bulkio send queue limited to {0} packets'.format(self._sendQueue.maxsize))
+            elif (ctrl['type'] == ControlEnum.DropPolicy):
+                if (ctrlValueInt not in bulkio_flow.DROP_POLICY_NAMES.values()):
+                    raise ValueError('Unknown drop policy %d' % ctrlValueInt)
+                self._sendQueue.policy = ctrlValueInt
+                logging.info('Bulkio send queue drop policy set to {0}'.format(ctrlValueInt))
+
+            # Any setting of the limiter may have changed
+            self._limitVersion += 1
 
         except Exception as e:
             self.write_message(dict(error='SystemError', message=str(e)))
 
     def on_close(self):
         logging.debug('Stream CLOSE')
+        self._closed = True
+        self._sendQueue.clear()
+        self._coalescer.clear()
         self.close_future.set_result((self.close_code, self.close_reason))
-        try:
-            self.port.ref.disconnectPort(self._connectionId)
-            logging.info("Closed websocket to %s, %s", self.port, self._connectionId)
-        except CORBA.TRANSIENT:
-            pass
-        except Exception, e:
-            logging.exception('Error disconnecting port %s' % self._connectionId)
-
-    def _pushSRI(self, newSRI):
-        origSRI, changed = self._getSRI(newSRI.streamID)
-        if origSRI is not None:
-            changed = sri.compare(origSRI, newSRI)
-        self._SRIs[newSRI.streamID] = (newSRI, changed)
+        self._detach()
 
-    def _getSRI(self, streamID):
-        return self._SRIs.get(streamID, (None, True))
+    def _drain(self):
+        """
+        Writes queued messages while Tornado's write buffer has room, then
+        polls until it drains if the client is not keeping up.
+        """
+        while not self._closed:
+            if (self._pendingBytes() >= self._maxWriteBuffer):
+                self._ioloop.add_timeout(datetime.timedelta(milliseconds=10), self._drain)
+                return
+            item = self._sendQueue.pop()
+            if item is None:
+                return
+            message, binary, trace = item
+            if not binary:
+                # Same as write_message() does, but counted
+                started = time.time()
+                message = json_encode(message)
+                self._stats.encodeSeconds += time.time() - started
+            self._stats.bytesSent += len(message)
+            self.write_message(message, binary=binary)
+            if trace is not None:
+                trace.finish('send')
 
-    def _pushPacket(self, data, ts, EOS, stream_id):
-        # Retrieve SRI from stream_id
-        sri, sriChangedFromPacket = self._getSRI(stream_id)
-
-        # Check if any limiting parameter exists
-        if (self._hasLimitingParameter()):
-            # Call the limit function (the "True" flags tell the function to use the mean() down-sampling)
-            outData, outSRI, self._xFactor, self._yFactor, sriChangedFromLimiter, warningMessage = bulkio_limiter.limit(
-                data, sri, self._xMax, self._xBegin, self._xEnd, True, self._yMax, self._yBegin, self._yEnd, True
-            )
-
-            # Logging for debug (comment out operationally)
-            #logging.info("connection_id: " + str(self._connectionId))
-            #logging.info("bulkio_limiter info: \n" +
-            #             "    originalWordLength="+str(len(data))+", finalWordLength="+str(len(outData))+", originalSubsize="+str(sri.subsize)+", finalSubsize="+str(outSRI.subsize)+"\n"+
-            #             "    xMax="+str(self._xMax)+", xBegin="+str(self._xBegin)+", xEnd="+str(self._xEnd)+", xDownSampFactor="+str(self._xFactor)+"\n"+
-            #             "    yMax="+str(self._yMax)+", yBegin="+str(self._yBegin)+", yEnd="+str(self._yEnd)+", yDownSampFactor="+str(self._yFactor)+"\n"+
-            #             "    sriChangedFromLimiter="+str(sriChangedFromLimiter))
-
-            # Print warnings if they exist
-            if (warningMessage):
-                logging.warning('bulkio_limiter.limit(): ' + warningMessage)
-        else:
-            # Don't do anything if no limiting parameter exists
-            outData = data
-            outSRI = bulkio_limiter.copy_sri(sri)
-            sriChangedFromLimiter = False
-
-        # Tack on SRI, Package, Deliver.
-        outSRI.keywords = props_to_dict(outSRI.keywords)
-        packet = dict(
-            streamID   = stream_id,
-            T          = ts.__dict__,
-            EOS        = EOS,
-            sriChanged = (sriChangedFromPacket or sriChangedFromLimiter),
-            SRI        = outSRI.__dict__,
-            type       = self.port._using.name,
-            dataBuffer = outData
-            )
-        self._ioloop.add_callback(self.write_message, packet)
-
-    def _hasLimitingParameter(self):
-        # Check if any of the X axis parameters are not None
-        if (self._xMax or self._xBegin or self._xEnd):
-            return True
-        # Check if any of the Y axis parameters are not None
-        if (self._yMax or self._yBegin or self._yEnd):
-            return True
-        # Return false if all the parameters are None
-        return False
+    def _pendingBytes(self):
+        # IOStream does not expose the size of its write buffer publicly
+        return getattr(self.stream, '_write_buffer_size', 0)
 
     def write_message(self, *args, **ioargs):
         # hide WebSocketClosedError because it's very likely
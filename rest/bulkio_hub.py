@@ -0,0 +1,234 @@
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+"""
+Shared connections to BULKIO uses ports
+
+Every uses port watched by one or more clients is connected once, to a
+PortHub, which fans the SRI and packets out to all of the attached
+listeners.  A listener is any object with the AsyncPort callbacks:
+
+    _pushSRI(sri)
+    _pushPacket(data, ts, EOS, stream_id)
+
+Functions:
+find_port -- look up a BULKIO uses port of a REDHAWK object
+attach -- attach a listener to the hub of a port, connecting it if needed
+detach -- detach a listener, disconnecting the port after the last one
+
+Classes:
+PortHub -- one AsyncPort connection fanned out to many listeners
+"""
+
+import logging
+import threading
+
+from omniORB import CORBA
+from bulkio.bulkioInterfaces import BULKIO__POA
+
+from asyncport import AsyncPort
+import bulkio_capture
+import bulkio_protocol
+
+
+class PortHub(object):
+    """
+    Owns the AsyncPort connected to a uses port and forwards everything it
+    receives to the attached listeners.  The current SRI of every active
+    stream is kept so that listeners attaching mid-stream start with it,
+    and the last samples are kept in a CaptureBuffer if the capture is
+    enabled (see bulkio_capture).
+    """
+    def __init__(self, key, port, bulkio_poa, connection_id=None):
+        self.key = key
+        self.port = port
+        self.connection_id = connection_id or 'rest-python-%s' % id(self)
+
+        self.capture = bulkio_capture.create(bulkio_protocol.port_dtype(port._using.name))
+
+        self._listeners = []
+        self._SRIs = dict()
+        self._lock = threading.Lock()
+
+        # Serializes connect() and disconnect(), which call the component
+        self._connectLock = threading.Lock()
+        self.connected = False
+
+        self.async_port = AsyncPort(bulkio_poa, self._pushSRI, self._pushPacket)
+
+    def connect(self):
+        """
+        Connects the port unless it already is.  Listeners attaching while
+        another one connects the port wait for it here, then try again
+        themselves if it failed.
+        """
+        with self._connectLock:
+            if self.connected:
+                return
+            try:
+                self.port.ref.connectPort(self.async_port.getPort(), self.connection_id)
+            except Exception:
+                self.async_port.releasePort()
+                raise
+            self.connected = True
+        logging.info("Connected hub to %s, %s", self.port, self.connection_id)
+
+    def disconnect(self):
+        """
+        Disconnects the port unless it is not connected or a listener has
+        attached again in the meantime.
+        """
+        with self._connectLock:
+            if (not self.connected or self.listeners()):
+                return
+            self.connected = False
+            try:
+                self.port.ref.disconnectPort(self.connection_id)
+                logging.info("Disconnected hub from %s, %s", self.port, self.connection_id)
+            except CORBA.TRANSIENT:
+                pass
+            except Exception:
+                logging.exception('Error disconnecting port %s' % self.connection_id)
+            # The servant is not reachable anymore, free it from the POA
+            self.async_port.releasePort()
+
+    def add_listener(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+            SRIs = self._SRIs.values()
+        for streamSRI in SRIs:
+            listener._pushSRI(streamSRI)
+
+    def listeners(self):
+        """
+        Returns the number of listeners.
+        """
+        with self._lock:
+            return len(self._listeners)
+
+    def remove_listener(self, listener):
+        """
+        Returns the number of listeners left.
+        """
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+            return len(self._listeners)
+
+    def _pushSRI(self, H):
+        with self._lock:
+            self._SRIs[H.streamID] = H
+            listeners = self._listeners[:]
+        if self.capture is not None:
+            try:
+                self.capture.pushSRI(H)
+            except Exception:
+                logging.exception("PUSH SRI Failure in the capture of %s", self.connection_id)
+        for listener in listeners:
+            try:
+                listener._pushSRI(H)
+            except Exception:
+                logging.exception("PUSH SRI Failure in listener %s", listener)
+
+    def _pushPacket(self, data, ts, EOS, stream_id):
+        with self._lock:
+            if EOS:
+                self._SRIs.pop(stream_id, None)
+            listeners = self._listeners[:]
+        if self.capture is not None:
+            # The capture must not keep the packet from the listeners
+            try:
+                self.capture.pushPacket(data, ts, EOS, stream_id)
+            except Exception:
+                logging.exception("PushPacket Failure in the capture of %s", self.connection_id)
+        for listener in listeners:
+            try:
+                listener._pushPacket(data, ts, EOS, stream_id)
+            except Exception:
+                logging.exception("PushPacket Failure in listener %s", listener)
+
+
+def find_port(obj, name):
+    """
+    Returns the port `name` of a REDHAWK object and the BULKIO servant class
+    (POA) of its interface.  Raises ValueError if there is no such port or
+    if it is not a BULKIO uses port.
+    """
+    for port in obj.ports:
+        if port.name == name:
+            if port._direction != 'Uses':
+                raise ValueError("Port '%s' is not a uses" % name)
+            if port._using.nameSpace != 'BULKIO':
+                raise ValueError("Port '%s' is not a BULKIO port" % name)
+            return port, getattr(BULKIO__POA, port._using.name)
+    raise ValueError("Could not find port of name '%s'" % name)
+
+
+# Hubs by key, see attach()
+_HUBS = dict()
+_HUBS_LOCK = threading.Lock()
+
+
+def attach(key, port, bulkio_poa, listener, connection_id=None):
+    """
+    Attaches the listener to the hub identified by key (the object path,
+    port name and connection ID), creating and connecting the hub if this
+    is the first listener.  Returns the hub.
+
+    The port is connected outside of the lock of the hubs so that a slow
+    component only holds up the clients of its own port.
+    """
+    with _HUBS_LOCK:
+        hub = _HUBS.get(key, None)
+        if hub is None:
+            hub = PortHub(key, port, bulkio_poa, connection_id)
+            _HUBS[key] = hub
+        # Listening already keeps the hub from being removed by detach()
+        hub.add_listener(listener)
+    try:
+        hub.connect()
+    except Exception:
+        detach(hub, listener)
+        raise
+    return hub
+
+def detach(hub, listener):
+    """
+    Detaches the listener from the hub and disconnects the hub from its port
+    if that was the last listener.
+
+    The hub stays registered until it is disconnected, so a listener
+    attaching in the meantime reuses (and reconnects) it instead of
+    connecting a new hub with the same connection ID that the disconnect
+    would remove.
+    """
+    with _HUBS_LOCK:
+        if hub.remove_listener(listener) > 0:
+            return
+    hub.disconnect()
+    with _HUBS_LOCK:
+        if (_HUBS.get(hub.key, None) is hub and not hub.listeners()):
+            del _HUBS[hub.key]
+
+def hubs():
+    """
+    Returns a list of the connected hubs.
+    """
+    with _HUBS_LOCK:
+        return _HUBS.values()
@@ -9,9 +9,42 @@
 """
 import math
 import numpy
-from ossie.utils.bulkio import bulkio_helpers
 from bulkio import sri
 
+# The complex dtype each word dtype is viewed as for complex (mode 1) data.
+# Integer words have no complex counterpart and are converted to the
+# smallest float type that holds them exactly first.
+COMPLEX_DTYPES = {
+    'f': {4: numpy.complex64, 8: numpy.complex128},
+    'i': {1: numpy.complex64, 2: numpy.complex64, 4: numpy.complex128, 8: numpy.complex128},
+    'u': {1: numpy.complex64, 2: numpy.complex64, 4: numpy.complex128, 8: numpy.complex128},
+}
+
+def enum(**enums):
+    return type('Enum', (), enums)
+
+# Down-sampling operations of limit(), per axis.  The values of Drop and Mean
+# match the booleans the xUseMean/yUseMean flags used to be.
+#   Drop    - keep one sample of each block
+#   Mean    - average of each block
+#   MinMax  - min and max of each block (an envelope of two samples per block
+#             that keeps spikes and transients visible)
+#   Max     - max of each block (keeps narrowband peaks of spectra)
+#   MaxHold - same as Max in limit(), the caller also holds the max across packets
+#   FIR     - same as Mean in limit(), the caller low-pass filters 1D streams
+#             across packets before limiting them (see bulkio_dsp.Decimator)
+DecimateEnum = enum(Drop=0, Mean=1, MinMax=2, Max=3, MaxHold=4, FIR=5)
+
+# Names of the down-sampling operations as accepted in query arguments
+DECIMATE_NAMES = {
+    'drop':    DecimateEnum.Drop,
+    'mean':    DecimateEnum.Mean,
+    'minmax':  DecimateEnum.MinMax,
+    'max':     DecimateEnum.Max,
+    'maxhold': DecimateEnum.MaxHold,
+    'fir':     DecimateEnum.FIR,
+}
+
 def copy_sri(SRI):
     """
     This function copies the fields of an SRI object into a new object.
@@ -31,55 +64,160 @@ def copy_sri(SRI):
     copied.keywords = SRI.keywords[:]
     return copied
 
-def meanDownsampleX(dataMatrix, resampleFactor):
+def reduceDownsampleX(dataMatrix, resampleFactor, reduceFunc):
     """
-    This function down-samples the matrix using a mean function across the X dimension.
+    This function down-samples the matrix across the X dimension by applying reduceFunc (e.g.
+    numpy.mean) to every block of (resampleFactor) input columns, and to whatever is left when
+    the row length is not a multiple of (resampleFactor).  The output has the same dtype as the input.
     """
-    # Initialize output matrix
-    outMatrix = dataMatrix[:,::resampleFactor]
-    # Calculate the dimensions to loop through
-    numRows = outMatrix.shape[0]
-    numCols = outMatrix.shape[1]
-    origCols = dataMatrix.shape[1]
-    # Loop through the rows
-    for row in range(0, numRows):
-        # Loop through the columns
-        for col in range(0, numCols):
-            # Check if there is an even (resampleFactor) amount of data to calculate a mean() on
-            if ((col*resampleFactor+resampleFactor) > origCols):
-                # Calculate the mean with whatever is left
-                outMatrix[row, col] = dataMatrix[row, col*resampleFactor:].mean()
-            else:
-                # Calculate the mean with (resampleFactor) samples
-                outMatrix[row, col] = dataMatrix[row, col*resampleFactor:col*resampleFactor+resampleFactor].mean()
+    # Calculate the number of full (resampleFactor) blocks and the ragged tail
+    numRows, origCols = dataMatrix.shape
+    fullCols = origCols // resampleFactor
+    fullLength = fullCols * resampleFactor
+    # Reduce the full blocks as one reduction over a (rows, blocks, factor) view
+    outMatrix = numpy.empty((numRows, fullCols + (fullLength < origCols)), dtype=dataMatrix.dtype)
+    outMatrix[:, :fullCols] = reduceFunc(dataMatrix[:, :fullLength].reshape((numRows, fullCols, resampleFactor)), axis=2)
+    # Reduce whatever is left
+    if (fullLength < origCols):
+        outMatrix[:, fullCols] = reduceFunc(dataMatrix[:, fullLength:], axis=1)
+    # Return output matrix
+    return outMatrix
+
+def reduceDownsampleY(dataMatrix, resampleFactor, reduceFunc):
+    """
+    This function down-samples the matrix across the Y dimension by applying reduceFunc (e.g.
+    numpy.mean) to every block of (resampleFactor) input rows, and to whatever is left when the
+    number of rows is not a multiple of (resampleFactor).  The output has the same dtype as the input.
+    """
+    # Calculate the number of full (resampleFactor) blocks and the ragged tail
+    origRows, numCols = dataMatrix.shape
+    fullRows = origRows // resampleFactor
+    fullLength = fullRows * resampleFactor
+    # Reduce the full blocks as one reduction over a (blocks, factor, cols) view
+    outMatrix = numpy.empty((fullRows + (fullLength < origRows), numCols), dtype=dataMatrix.dtype)
+    outMatrix[:fullRows, :] = reduceFunc(dataMatrix[:fullLength, :].reshape((fullRows, resampleFactor, numCols)), axis=1)
+    # Reduce whatever is left
+    if (fullLength < origRows):
+        outMatrix[fullRows, :] = reduceFunc(dataMatrix[fullLength:, :], axis=0)
     # Return output matrix
     return outMatrix
 
+def componentReduce(reduceFunc):
+    """
+    This function wraps an order-based reduction (e.g. numpy.max) so that complex data is reduced
+    separately on its real and imaginary parts rather than by numpy's lexicographic ordering.
+    """
+    def reduce(data, axis):
+        if (data.dtype.kind != 'c'):
+            return reduceFunc(data, axis=axis)
+        return reduceFunc(data.real, axis=axis) + 1j * reduceFunc(data.imag, axis=axis)
+    return reduce
+
+def meanDownsampleX(dataMatrix, resampleFactor):
+    """
+    This function down-samples the matrix using a mean function across the X dimension.
+    """
+    return reduceDownsampleX(dataMatrix, resampleFactor, numpy.mean)
+
 def meanDownsampleY(dataMatrix, resampleFactor):
     """
     This function down-samples the matrix using a mean function across the Y dimension.
     """
-    # Initialize output matrix
-    outMatrix = dataMatrix[::resampleFactor,:]
-    # Calculate the dimensions to loop through
-    numRows = outMatrix.shape[0]
-    numCols = outMatrix.shape[1]
-    origRows = dataMatrix.shape[0]
-    # Loop through the columns
-    for col in range(0, numCols):
-        # Loop through the rows
-        for row in range(0, numRows):
-            # Check if there is an even (resampleFactor) amount of data to calculate a mean() on
-            if ((row*resampleFactor+resampleFactor) > origRows):
-                # Calculate the mean with whatever is left
-                outMatrix[row, col] = dataMatrix[row*resampleFactor:, col].mean()
-            else:
-                # Calculate the mean with (resampleFactor) samples
-                outMatrix[row, col] = dataMatrix[row*resampleFactor:row*resampleFactor+resampleFactor, col].mean()
-    # Return output matrix
+    return reduceDownsampleY(dataMatrix, resampleFactor, numpy.mean)
+
+def maxDownsampleX(dataMatrix, resampleFactor):
+    """
+    This function down-samples the matrix using a max function across the X dimension.
+    """
+    return reduceDownsampleX(dataMatrix, resampleFactor, componentReduce(numpy.max))
+
+def maxDownsampleY(dataMatrix, resampleFactor):
+    """
+    This function down-samples the matrix using a max function across the Y dimension.
+    """
+    return reduceDownsampleY(dataMatrix, resampleFactor, componentReduce(numpy.max))
+
+def minMaxDownsampleX(dataMatrix, resampleFactor):
+    """
+    This function down-samples the matrix into an envelope across the X dimension: every block of
+    (resampleFactor) columns becomes two columns, its min followed by its max.
+    """
+    minMatrix = reduceDownsampleX(dataMatrix, resampleFactor, componentReduce(numpy.min))
+    maxMatrix = reduceDownsampleX(dataMatrix, resampleFactor, componentReduce(numpy.max))
+    outMatrix = numpy.empty((minMatrix.shape[0], 2 * minMatrix.shape[1]), dtype=dataMatrix.dtype)
+    outMatrix[:, 0::2] = minMatrix
+    outMatrix[:, 1::2] = maxMatrix
     return outMatrix
 
-def limit(data, sri, xMax, xBegin=None, xEnd=None, xUseMean=True, yMax=None, yBegin=None, yEnd=None, yUseMean=True):
+def minMaxDownsampleY(dataMatrix, resampleFactor):
+    """
+    This function down-samples the matrix into an envelope across the Y dimension: every block of
+    (resampleFactor) rows becomes two rows, its min followed by its max.
+    """
+    minMatrix = reduceDownsampleY(dataMatrix, resampleFactor, componentReduce(numpy.min))
+    maxMatrix = reduceDownsampleY(dataMatrix, resampleFactor, componentReduce(numpy.max))
+    outMatrix = numpy.empty((2 * minMatrix.shape[0], minMatrix.shape[1]), dtype=dataMatrix.dtype)
+    outMatrix[0::2, :] = minMatrix
+    outMatrix[1::2, :] = maxMatrix
+    return outMatrix
+
+def downsampleX(dataMatrix, resampleFactor, decimation):
+    """
+    This function down-samples the matrix across the X dimension with a DecimateEnum mode.
+    """
+    if (decimation in (DecimateEnum.Mean, DecimateEnum.FIR)):
+        return meanDownsampleX(dataMatrix, resampleFactor)
+    elif (decimation == DecimateEnum.MinMax):
+        return minMaxDownsampleX(dataMatrix, resampleFactor)
+    elif (decimation in (DecimateEnum.Max, DecimateEnum.MaxHold)):
+        return maxDownsampleX(dataMatrix, resampleFactor)
+    # Drop samples when down-sampling
+    return dataMatrix[:,::resampleFactor]
+
+def downsampleY(dataMatrix, resampleFactor, decimation):
+    """
+    This function down-samples the matrix across the Y dimension with a DecimateEnum mode.
+    """
+    if (decimation in (DecimateEnum.Mean, DecimateEnum.FIR)):
+        return meanDownsampleY(dataMatrix, resampleFactor)
+    elif (decimation == DecimateEnum.MinMax):
+        return minMaxDownsampleY(dataMatrix, resampleFactor)
+    elif (decimation in (DecimateEnum.Max, DecimateEnum.MaxHold)):
+        return maxDownsampleY(dataMatrix, resampleFactor)
+    # Drop samples when down-sampling
+    return dataMatrix[::resampleFactor,:]
+
+def toSamples(data, complexData=False, dtype=None):
+    """
+    This function converts a vector of words into a 1D numpy array of samples, without copying
+    whenever the words already are a numpy array or a buffer of the requested dtype.
+    Complex words are interleaved (real, imaginary) pairs and are viewed in place as complex samples
+    of the same precision (float32 words become complex64 samples).
+    """
+    # Wrap strings (octet/char data) and convert lists, keeping arrays as they are
+    if isinstance(data, str):
+        words = numpy.frombuffer(data, dtype=dtype or numpy.uint8)
+    else:
+        words = numpy.asarray(data, dtype=dtype).ravel()
+    if not complexData:
+        return words
+    # View the (real, imaginary) pairs as complex samples
+    complexType = COMPLEX_DTYPES[words.dtype.kind][words.dtype.itemsize]
+    if (words.dtype.kind != 'f'):
+        words = words.astype(numpy.dtype(complexType).char.lower())
+    return numpy.ascontiguousarray(words[:len(words) - len(words) % 2]).view(complexType)
+
+def toWords(samples):
+    """
+    This function converts a numpy array of samples back into a 1D numpy array of words.  Complex
+    samples are interleaved as (real, imaginary) word pairs.
+    """
+    samples = numpy.ascontiguousarray(samples).ravel()
+    if (samples.dtype.kind == 'c'):
+        return samples.view(samples.real.dtype)
+    return samples
+
+def limit(data, sri, xMax, xBegin=None, xEnd=None, xDecimation=DecimateEnum.Mean, yMax=None, yBegin=None, yEnd=None, yDecimation=DecimateEnum.Mean, dtype=None):
     """
     This function limits the output size of a bulkio packet.
     First, the data is sliced across two different dimensions (if applicable) with the indices (note the "inclusive" range definition):
@@ -92,169 +230,250 @@ def limit(data, sri, xMax, xBegin=None, xEnd=None, xUseMean=True, yMax=None, yBe
         yMax
     The down-sampling is performed across the X dimension first (this only matters if the mean function is used).
     These max sample sizes are in terms of samples rather than data words. The down-sampling operation either drops
-    samples or it uses the mean function to include information from the dropped samples.
-    The following flags indicate which operation to use:
-        xUseMean
-        yUseMean
-    """
-    #============================================
-    # Initialize
-    #============================================
-    outSRI = copy_sri(sri) # Copy SRI so it isn't modified in place
-    sriChanged = False
-    warningMessage = ""
-
-    #============================================
-    # Convert from a vector of words to a matrix of samples
-    #============================================
-    # Check if complex and convert (0:Scalar, 1:Complex)
-    if (outSRI.mode == 1):
-        outData = bulkio_helpers.bulkioComplexToPythonComplexList(data)
-        # Divide by two since this parameter uses word indexing rather than sample indexing
-        frameSize = outSRI.subsize/2
-    else:
-        outData = data
-        frameSize = outSRI.subsize
+    samples or reduces each block of samples with a mean, max or (min, max) envelope (see DecimateEnum).
+    The following modes indicate which operation to use:
+        xDecimation
+        yDecimation
+    The returned resample factors are the number of input samples per output sample (which is half the block
+    size for the MinMax envelope).
+    The data words are handled as a numpy array of the given dtype (e.g. the dtype of the port) and
+    the output words are returned as a numpy array of the same dtype (or of the float type used for
+    complex integer data).  Complex data is never unpacked into Python objects.
+    The returned words may be a view of the input words, see LimitPlan.apply().
+    """
+    plan = LimitPlan(len(data), sri, xMax, xBegin, xEnd, xDecimation, yMax, yBegin, yEnd, yDecimation, dtype)
+    return (plan.apply(data), plan.outSRI, plan.xFactor, plan.yFactor, plan.sriChanged, plan.warningMessage)
 
-    # Check for dimension (0:1D, otherwise:2D)
-    if (outSRI.subsize == 0):
-        xLength = len(outData)
-        yLength = 1
-    else:
-        xLength = frameSize
-        yLength = len(outData) / frameSize
-        # Check that the frame size evenly fits in the data length
-        if ((len(outData) % frameSize) > 0):
-            # Warn and attempt to correct by slicing off the end of the packet
-            warningMessage += "Malformed input packet!  Data with length=" + str(len(outData)) + " is not a multiple of the frame with length=" + str(frameSize) + "\n"
-            adjustedLength = (int(len(outData)) / int(frameSize)) * frameSize
-            outData = outData[:adjustedLength]
-            warningMessage += "Dropped data to fix malformed input packet! Data now has length=" + str(adjustedLength) + "\n"
-
-    # Convert to numpy array
-    outData = numpy.array(outData)
-
-    # Reshape data into matrix of yLength rows and xLength columns
-    outData = outData.reshape((yLength, xLength))
-
-    #============================================
-    # Slice the data if necessary
-    #============================================
-    # Slice the end of the X axis first
-    if (xEnd):
-        # Check for valid xEnd
-        if ((xEnd+1) <= xLength):
-            # Slice (Use xEnd+1 since [xBegin, xEnd] range is inclusive)
-            outData = outData[:,:xEnd+1]
-            # Recalculate xLength - number of columns
-            xLength = outData.shape[1]
-        else:
-            warningMessage += "Ignoring X axis end index! Index=" + str(xEnd) + " does not exist in samples with length=" + str(xLength)  + "\n"
-
-    # Slice the beginning of the X axis second
-    if (xBegin):
-        # Check for valid xBegin
-        if ((xBegin+1) <= xLength):
-            # Slice
-            outData = outData[:,xBegin:]
-            # Recalculate xLength - number of columns
-            xLength = outData.shape[1]
-            # Modify SRI
-            outSRI.xstart = outSRI.xstart + xBegin*outSRI.xunits
-            # Check if the SRI was updated here
-            if (sri.xstart != outSRI.xstart):
-                sriChanged = True
+class LimitPlan(object):
+    """
+    This class holds the work of limit() for the packets of a stream that have the same length, SRI
+    and limiter settings, which is nearly every packet of a steady stream.  The frame size, shape,
+    slices, resample factors, output SRI and warnings are worked out once when the plan is created,
+    and apply() only reshapes and slices views of the words and reduces them into output buffers
+    allocated on first use.
+    A plan must not be shared by concurrent callers, and the words returned by apply() are only valid
+    until its next call (they may be its output buffer).
+    """
+    def __init__(self, length, sri, xMax, xBegin=None, xEnd=None, xDecimation=DecimateEnum.Mean, yMax=None, yBegin=None, yEnd=None, yDecimation=DecimateEnum.Mean, dtype=None):
+        #============================================
+        # Initialize
+        #============================================
+        for decimation in (xDecimation, yDecimation):
+            if decimation not in DECIMATE_NAMES.values():
+                raise ValueError("Unknown decimation " + str(decimation))
+        self.length = length
+        self.sri = sri
+        self.dtype = dtype
+        outSRI = copy_sri(sri) # Copy SRI so it isn't modified in place
+        sriChanged = False
+        warningMessage = ""
+
+        #============================================
+        # Shape of the matrix of samples
+        #============================================
+        # Check if complex (0:Scalar, 1:Complex)
+        self.complexData = (outSRI.mode == 1)
+        if self.complexData:
+            if (length % 2):
+                warningMessage += "Malformed input packet!  Complex data with odd length=" + str(length) + ", dropping the last word\n"
+            samples = length // 2
+            # Divide by two since this parameter uses word indexing rather than sample indexing
+            frameSize = outSRI.subsize/2
         else:
-            warningMessage += "Ignoring X axis beginning index! Index=" + str(xBegin) + " does not exist in samples with length=" + str(xLength)  + "\n"
-
-    # Slice the end of the Y axis first
-    if (yEnd):
-        # Check for valid yEnd
-        if ((yEnd+1) <= yLength):
-            # Slice (Use yEnd+1 since [yBegin, yEnd] range is inclusive)
-            outData = outData[:yEnd+1,:]
-            # Recalculate yLength - number of rows
-            yLength = outData.shape[0]
+            samples = length
+            frameSize = outSRI.subsize
+
+        # Check for dimension (0:1D, otherwise:2D)
+        if (outSRI.subsize == 0):
+            xLength = samples
+            yLength = 1
         else:
-            warningMessage += "Ignoring Y axis end index! Index=" + str(yEnd) + " does not exist in samples with length=" + str(yLength)  + "\n"
-
-    # Slice the beginning of the Y axis second
-    if (yBegin):
-        # Check for valid xBegin
-        if ((yBegin+1) <= yLength):
-            # Slice
-            outData = outData[yBegin:,:]
-            # Recalculate xLength - number of rows
-            yLength = outData.shape[0]
-            # Modify SRI
-            outSRI.ystart = outSRI.ystart + yBegin*outSRI.yunits
-            # Check if SRI was updated here
-            if (sri.ystart != outSRI.ystart):
+            xLength = frameSize
+            yLength = samples / frameSize
+            # Check that the frame size evenly fits in the data length
+            if ((samples % frameSize) > 0):
+                # Warn and attempt to correct by slicing off the end of the packet
+                warningMessage += "Malformed input packet!  Data with length=" + str(samples) + " is not a multiple of the frame with length=" + str(frameSize) + "\n"
+                samples = yLength * frameSize
+                warningMessage += "Dropped data to fix malformed input packet! Data now has length=" + str(samples) + "\n"
+        self._samples = samples
+        self._shape = (yLength, xLength)
+
+        #============================================
+        # Slices of the matrix
+        #============================================
+        xStart, xStop = 0, xLength
+        yStart, yStop = 0, yLength
+        # Slice the end of the X axis first (use xEnd+1 since [xBegin, xEnd] range is inclusive)
+        if (xEnd):
+            if ((xEnd+1) <= xLength):
+                xStop = xEnd+1
+                xLength = xStop
+            else:
+                warningMessage += "Ignoring X axis end index! Index=" + str(xEnd) + " does not exist in samples with length=" + str(xLength)  + "\n"
+
+        # Slice the beginning of the X axis second
+        if (xBegin):
+            if ((xBegin+1) <= xLength):
+                xStart = xBegin
+                xLength = xStop - xStart
+                outSRI.xstart = outSRI.xstart + xBegin*outSRI.xunits
+                if (sri.xstart != outSRI.xstart):
+                    sriChanged = True
+            else:
+                warningMessage += "Ignoring X axis beginning index! Index=" + str(xBegin) + " does not exist in samples with length=" + str(xLength)  + "\n"
+
+        # Slice the end of the Y axis first
+        if (yEnd):
+            if ((yEnd+1) <= yLength):
+                yStop = yEnd+1
+                yLength = yStop
+            else:
+                warningMessage += "Ignoring Y axis end index! Index=" + str(yEnd) + " does not exist in samples with length=" + str(yLength)  + "\n"
+
+        # Slice the beginning of the Y axis second
+        if (yBegin):
+            if ((yBegin+1) <= yLength):
+                yStart = yBegin
+                yLength = yStop - yStart
+                outSRI.ystart = outSRI.ystart + yBegin*outSRI.yunits
+                if (sri.ystart != outSRI.ystart):
+                    sriChanged = True
+            else:
+                warningMessage += "Ignoring Y axis beginning index! Index=" + str(yBegin) + " does not exist in samples with length=" + str(yLength)  + "\n"
+        self._slices = (slice(yStart, yStop), slice(xStart, xStop))
+
+        #============================================
+        # Down-sampling
+        #============================================
+        # Check for down-sampling along the x axis
+        self.xFactor = 1
+        self._xReducer = None
+        if ((xMax) and (xMax < xLength)):
+            # The envelope has two output samples per block
+            samplesPerBlock = 2 if (xDecimation == DecimateEnum.MinMax) else 1
+            # Calculate integer re-sample factor (block size), with no more
+            # blocks than fit in xMax
+            xResampleFactor = int(math.ceil(float(xLength) / float(max(xMax // samplesPerBlock, 1))))
+            self._xReducer = _BlockReducer(yLength, xLength, xResampleFactor, xDecimation, False)
+            xLength = self._xReducer.outLength
+            self.xFactor = xResampleFactor / float(samplesPerBlock) if (samplesPerBlock > 1) else xResampleFactor
+            outSRI.xdelta = outSRI.xdelta * self.xFactor
+            # The SRI was updated here since re-sampling was performed
+            sriChanged = True
+
+        # Update the subsize if this is two dimensional data
+        if (outSRI.subsize > 0):
+            # If this is complex data, use 2x multiplier since xLength is in
+            # terms of samples whereas the subsize is in terms of words
+            outSRI.subsize = xLength * 2 if self.complexData else xLength
+            if (sri.subsize != outSRI.subsize):
                 sriChanged = True
-        else:
-            warningMessage += "Ignoring Y axis beginning index! Index=" + str(yBegin) + " does not exist in samples with length=" + str(yLength)  + "\n"
-
-    #============================================
-    # Down-sample the data if necessary
-    #============================================
-    # Check for down-sampling along the x axis
-    xResampleFactor = 1
-    if ((xMax) and (xMax < xLength)):
-        # Calculate integer re-sample factor
-        xResampleFactor = float(xLength) / float(xMax)
-        xResampleFactor = int(math.ceil(xResampleFactor))
-        # Down-sample
-        if (xUseMean):
-            # Use the average of the dropped samples and retained sample
-            outData = meanDownsampleX(outData, xResampleFactor)
-        else:
-            # Drop samples when down-sampling
-            outData = outData[:,::xResampleFactor]
-        # Recalculate xLength - number of columns
-        xLength = outData.shape[1]
-        # Modify SRI
-        outSRI.xdelta = outSRI.xdelta * xResampleFactor
-        # The SRI was updated here since re-sampling was performed
-        sriChanged = True
-
-    # Update the subsize if this is two dimensional data
-    if (outSRI.subsize > 0):
-        outSRI.subsize = xLength
-        # If this is complex data, use 2x multiplier since xLength is in
-        # terms of samples whereas the subsize is in terms of words
-        if (outSRI.mode == 1):
-            outSRI.subsize = outSRI.subsize * 2
-        # Check if the SRI was updated here
-        if (sri.subsize != outSRI.subsize):
+
+        # Check for down-sampling along the y axis
+        self.yFactor = 1
+        self._yReducer = None
+        if ((yMax) and (yMax < yLength)):
+            samplesPerBlock = 2 if (yDecimation == DecimateEnum.MinMax) else 1
+            yResampleFactor = int(math.ceil(float(yLength) / float(max(yMax // samplesPerBlock, 1))))
+            # Blocks of rows are reduced as blocks of columns of the transposed matrix
+            self._yReducer = _BlockReducer(xLength, yLength, yResampleFactor, yDecimation, True)
+            self.yFactor = yResampleFactor / float(samplesPerBlock) if (samplesPerBlock > 1) else yResampleFactor
+            outSRI.ydelta = outSRI.ydelta * self.yFactor
             sriChanged = True
 
-    # Check for down-sampling along the y axis
-    yResampleFactor = 1
-    if ((yMax) and (yMax < yLength)):
-        # Calculate integer re-sample factor
-        yResampleFactor = float(yLength) / float(yMax)
-        yResampleFactor = int(math.ceil(yResampleFactor))
+        self.outSRI = outSRI
+        self.sriChanged = sriChanged
+        self.warningMessage = warningMessage
+
+    def fits(self, length, sri):
+        """
+        Returns True if the plan applies to a packet of `length` words with the given SRI (object).
+        """
+        return (length == self.length and sri is self.sri)
+
+    def apply(self, data):
+        """
+        Returns the limited words of a packet that fits the plan.
+        """
+        # Convert from a vector of words to a (sliced) matrix of samples
+        samples = toSamples(data, self.complexData, self.dtype)
+        outData = samples[:self._samples].reshape(self._shape)[self._slices]
         # Down-sample
-        if (yUseMean):
-            # Use the average of the dropped samples and retained sample
-            outData = meanDownsampleY(outData, yResampleFactor)
+        if (self._xReducer is not None):
+            outData = self._xReducer(outData)
+        if (self._yReducer is not None):
+            outData = self._yReducer(outData)
+        # Flatten the matrix and word-serialize the complex data
+        return toWords(outData)
+
+class _BlockReducer(object):
+    """
+    This class down-samples matrices of one shape across the X dimension (or the Y dimension with
+    transpose) with a DecimateEnum mode, like downsampleX() (and downsampleY()), reducing into an
+    output buffer that is reused as long as the samples keep the same dtype.
+    """
+    def __init__(self, rows, cols, resampleFactor, decimation, transpose):
+        self.resampleFactor = resampleFactor
+        self.decimation = DecimateEnum.Mean if (decimation == DecimateEnum.FIR) else decimation
+        self.transpose = transpose
+        self._rows = rows
+        self._fullCols = cols // resampleFactor
+        self._tail = (self._fullCols * resampleFactor < cols)
+        if (decimation == DecimateEnum.Drop):
+            self.outLength = -(-cols // resampleFactor)
+        elif (decimation == DecimateEnum.MinMax):
+            self.outLength = 2 * (self._fullCols + self._tail)
+        else:
+            self.outLength = self._fullCols + self._tail
+        self._buffer = None
+
+    def __call__(self, dataMatrix):
+        if self.transpose:
+            dataMatrix = dataMatrix.T
+        if (self.decimation == DecimateEnum.Drop):
+            outMatrix = dataMatrix[:,::self.resampleFactor]
+            return outMatrix.T if self.transpose else outMatrix
+
+        buffer = self._buffer
+        if (buffer is None or buffer.dtype != dataMatrix.dtype):
+            # The buffer is laid out as the output matrix, whatever the orientation it is written in
+            shape = (self.outLength, self._rows) if self.transpose else (self._rows, self.outLength)
+            buffer = self._buffer = numpy.empty(shape, dtype=dataMatrix.dtype)
+        outMatrix = buffer.T if self.transpose else buffer
+
+        fullCols = self._fullCols
+        fullLength = fullCols * self.resampleFactor
+        blocks = dataMatrix[:, :fullLength].reshape((self._rows, fullCols, self.resampleFactor))
+        tail = dataMatrix[:, fullLength:]
+        if (self.decimation == DecimateEnum.Mean):
+            _reduceInto(numpy.mean, blocks, 2, outMatrix[:, :fullCols])
+            if self._tail:
+                _reduceInto(numpy.mean, tail, 1, outMatrix[:, fullCols])
+        elif (self.decimation == DecimateEnum.MinMax):
+            # Every block becomes two columns, its min followed by its max
+            blockCols = fullCols + self._tail
+            for offset, reduceFunc in ((0, numpy.min), (1, numpy.max)):
+                _reduceInto(reduceFunc, blocks, 2, outMatrix[:, offset:2 * fullCols:2])
+                if self._tail:
+                    _reduceInto(reduceFunc, tail, 1, outMatrix[:, 2 * (blockCols - 1) + offset])
         else:
-            outData = outData[::yResampleFactor,:]
-        # Recalculate yLength - number of rows
-        yLength = outData.shape[0]
-        # Modify SRI
-        outSRI.ydelta = outSRI.ydelta * yResampleFactor
-        # The SRI was updated here since re-sampling was performed
-        sriChanged = True
-
-    #============================================
-    # Convert from a matrix of samples to a vector of words
-    #============================================
-    # Convert the matrix back to a list
-    outData = outData.reshape((1, xLength*yLength)).squeeze().tolist()
-
-    # Word-serialize the complex data
-    if (outSRI.mode == 1):
-        outData = bulkio_helpers.pythonComplexListToBulkioComplex(outData)
-
-    return (outData, outSRI, xResampleFactor, yResampleFactor, sriChanged, warningMessage)
+            _reduceInto(numpy.max, blocks, 2, outMatrix[:, :fullCols])
+            if self._tail:
+                _reduceInto(numpy.max, tail, 1, outMatrix[:, fullCols])
+        return buffer
+
+def _reduceInto(reduceFunc, data, axis, out):
+    """
+    This function reduces data with numpy.mean, numpy.min or numpy.max into the out array (a view of an
+    output buffer).  Order-based reductions of complex data apply to the real and imaginary parts
+    separately (see componentReduce()), and integer means are truncated as the assignment of downsampleX()
+    truncates them.
+    """
+    if (out.dtype.kind == 'c' and reduceFunc is not numpy.mean):
+        reduceFunc(data.real, axis=axis, out=out.real)
+        reduceFunc(data.imag, axis=axis, out=out.imag)
+    elif (reduceFunc is numpy.mean and out.dtype.kind not in 'fc'):
+        out[...] = reduceFunc(data, axis=axis)
+    else:
+        reduceFunc(data, axis=axis, out=out)
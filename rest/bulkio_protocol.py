@@ -0,0 +1,279 @@
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+"""
+Wire encodings for the BulkIO websocket
+
+The binary protocol sends every data packet as one binary websocket frame:
+
+    offset  size  field
+         0     4  magic 'BIO1'
+         4     1  protocol version (1)
+         5     1  flags (bit 0: EOS, bit 1: SRI changed, bit 2: complex,
+                  bit 3: quantized)
+         6     1  dtype code (see DTYPE_CODES)
+         7     1  reserved
+         8     4  SRI version counter (uint32)
+        12     4  rows (uint32, 1 for 1D data)
+        16     4  columns in samples (uint32)
+        20     4  stream ID length in bytes (uint32)
+        24     2  tcmode (int16)
+        26     2  tcstatus (int16)
+        28     4  packets dropped for this client so far (uint32)
+        32     8  toff (float64)
+        40     8  twsec (float64)
+        48     8  tfsec (float64)
+        56     n  stream ID (utf-8), zero padded to a multiple of 8 bytes
+     56+pad   16  quantized packets only: scale and offset (float64)
+          -    -  samples, little-endian, real/imag interleaved if complex
+
+All header fields are little-endian.  The sample buffer starts on an 8-byte
+boundary so browsers can view it directly as a typed array.  The SRI itself
+is sent separately as a JSON text message (see sri_message()) whenever its
+version counter changes.
+
+Display clients can ask for lower precision samples (see PrecisionEnum and
+quantize()).  Integer encodings carry a per-packet scale and offset, in the
+binary header extension above or the 'scale' and 'offset' fields of JSON
+packets, and the values are recovered as sample * scale + offset.
+
+Functions:
+port_dtype -- numpy dtype carried by a BULKIO port type
+to_array -- convert a data buffer to a numpy array of the port's dtype
+to_list -- convert a data buffer to a list of numbers for JSON
+binary_packet -- encode a data packet as a binary frame
+sri_message -- encode an SRI as a JSON control message
+streams_message -- list the streams of a port as a JSON control message
+quantize -- reduce the precision of the samples of a packet
+round_significant -- round values to a number of significant digits
+"""
+
+import struct
+import numpy
+
+import bulkio_limiter
+
+MAGIC = 'BIO1'
+VERSION = 1
+
+FLAG_EOS = 0x01
+FLAG_SRI_CHANGED = 0x02
+FLAG_COMPLEX = 0x04
+FLAG_QUANTIZED = 0x08
+
+HEADER = struct.Struct('<4sBBBxIIIIhhIddd')
+QUANTIZATION = struct.Struct('<dd')
+
+
+def enum(**enums):
+    return type('Enum', (), enums)
+
+# Precision of the samples sent to a client:
+#   Native  - the samples of the port, unchanged
+#   Float32 - single precision floats (7 significant digits in JSON)
+#   Int16   - 16-bit integers with a per-packet scale and offset
+#   Int8Log - 8-bit integers of the magnitude in dB (20*log10|x|, or the
+#             values as they are if they already are in dB, e.g. spectra)
+#             with a per-packet scale and offset.  Complex samples become
+#             real magnitudes.
+PrecisionEnum = enum(Native=0, Float32=1, Int16=2, Int8Log=3)
+
+# Names of the precisions as accepted in query arguments
+PRECISION_NAMES = {
+    'native':  PrecisionEnum.Native,
+    'float32': PrecisionEnum.Float32,
+    'int16':   PrecisionEnum.Int16,
+    'int8log': PrecisionEnum.Int8Log,
+}
+
+# Dynamic range (dB) kept below the peak of an Int8Log packet
+INT8LOG_RANGE = 127.0
+
+# The sample type of each numeric BULKIO port type
+PORT_DTYPES = {
+    'dataChar':      numpy.dtype('int8'),
+    'dataOctet':     numpy.dtype('uint8'),
+    'dataShort':     numpy.dtype('<i2'),
+    'dataUShort':    numpy.dtype('<u2'),
+    'dataLong':      numpy.dtype('<i4'),
+    'dataULong':     numpy.dtype('<u4'),
+    'dataLongLong':  numpy.dtype('<i8'),
+    'dataULongLong': numpy.dtype('<u8'),
+    'dataFloat':     numpy.dtype('<f4'),
+    'dataDouble':    numpy.dtype('<f8'),
+}
+
+# The dtype code written into the binary header
+DTYPE_CODES = {
+    numpy.dtype('int8'):  0,
+    numpy.dtype('uint8'): 1,
+    numpy.dtype('<i2'):   2,
+    numpy.dtype('<u2'):   3,
+    numpy.dtype('<i4'):   4,
+    numpy.dtype('<u4'):   5,
+    numpy.dtype('<i8'):   6,
+    numpy.dtype('<u8'):   7,
+    numpy.dtype('<f4'):   8,
+    numpy.dtype('<f8'):   9,
+}
+
+
+def port_dtype(port_type):
+    """
+    Returns the numpy dtype of the BULKIO port type (e.g. 'dataFloat') or
+    None if the port type does not carry numeric samples.
+    """
+    return PORT_DTYPES.get(port_type, None)
+
+def to_array(data, dtype):
+    """
+    Converts a data buffer (list, string or array) to a 1D little-endian
+    numpy array of the given dtype.
+    """
+    if isinstance(data, str):
+        return numpy.frombuffer(data, dtype=dtype)
+    return numpy.asarray(data, dtype=dtype).ravel()
+
+def to_list(data, dtype):
+    """
+    Returns the words of a data buffer as a list, converting strings
+    (dataOctet and dataChar ports) with the given dtype rather than sending
+    them as text.  Strings without a dtype (the URLs of dataFile ports) are
+    returned as they are.
+    """
+    if (isinstance(data, str) and dtype is not None):
+        return numpy.frombuffer(data, dtype=dtype).tolist()
+    if isinstance(data, numpy.ndarray):
+        return data.tolist()
+    return data
+
+def binary_packet(data, dtype, stream_id, ts, EOS, sri, sri_version, sri_changed, dropped=0, scale=None, offset=0.0):
+    """
+    Encodes a data packet as a binary frame (see the module documentation).
+    The data words are converted to dtype and the shape is taken from the
+    subsize and mode of the (output) SRI.  Quantized packets pass their
+    scale and offset.  Strings (dataOctet and dataChar ports) already are
+    the bytes of their words and are sent as they are.
+    """
+    samples = to_array(data, dtype)
+    stream_id = stream_id.encode('utf-8') if isinstance(stream_id, unicode) else stream_id
+
+    flags = 0
+    if EOS:
+        flags |= FLAG_EOS
+    if sri_changed:
+        flags |= FLAG_SRI_CHANGED
+    if sri.mode == 1:
+        flags |= FLAG_COMPLEX
+    if scale is not None:
+        flags |= FLAG_QUANTIZED
+
+    # Shape in samples rather than words
+    words_per_sample = 2 if sri.mode == 1 else 1
+    cols = (sri.subsize or len(samples)) / words_per_sample
+    rows = len(samples) / (cols * words_per_sample) if cols else 0
+
+    header = HEADER.pack(MAGIC, VERSION, flags, DTYPE_CODES[samples.dtype],
+                         sri_version, rows, cols, len(stream_id),
+                         ts.tcmode, ts.tcstatus, dropped & 0xFFFFFFFF,
+                         ts.toff, ts.twsec, ts.tfsec)
+    padding = '\0' * (-len(stream_id) % 8)
+    quantization = QUANTIZATION.pack(scale, offset) if scale is not None else ''
+    body = data if (isinstance(data, str) and samples.dtype.itemsize == 1) else samples.tostring()
+    return ''.join((header, stream_id, padding, quantization, body))
+
+def sri_message(stream_id, sri_version, sri_dict):
+    """
+    Returns the JSON control message announcing a new SRI version of a stream.
+    Binary packets reference it by the version counter in their header.
+    """
+    return dict(
+        type      = 'sri',
+        streamID  = stream_id,
+        version   = sri_version,
+        SRI       = sri_dict
+        )
+
+def streams_message(streams, subscribed, subscription):
+    """
+    Returns the JSON control message listing the streams of a port, those
+    of them the client is subscribed to and its subscription (a list of
+    stream IDs, a pattern or None for all streams).
+    """
+    return dict(
+        type         = 'streams',
+        streams      = streams,
+        subscribed   = subscribed,
+        subscription = subscription
+        )
+
+def quantize(data, dtype, precision, sri, is_db=False):
+    """
+    Returns (samples, sri, scale, offset) with the words of a packet
+    reduced to the given PrecisionEnum.  scale is None unless the samples
+    are integers standing for sample * scale + offset.  The SRI is only
+    copied if it changes (complex data in Int8Log becomes real).
+    """
+    words = to_array(data, dtype)
+    if (precision == PrecisionEnum.Float32):
+        return words.astype(numpy.float32), sri, None, 0.0
+
+    if (precision == PrecisionEnum.Int16):
+        if not len(words):
+            return words.astype(numpy.int16), sri, 1.0, 0.0
+        low, high = float(words.min()), float(words.max())
+        offset = (high + low) / 2.0
+        scale = (high - low) / 65534.0 or 1.0
+        samples = numpy.rint((words - offset) / scale).astype(numpy.int16)
+        return samples, sri, scale, offset
+
+    if (precision == PrecisionEnum.Int8Log):
+        values = words
+        if sri.mode:
+            # Magnitude of the (real, imaginary) pairs
+            values = numpy.hypot(words[0:len(words) - 1:2], words[1::2])
+            sri = bulkio_limiter.copy_sri(sri)
+            sri.mode = 0
+            sri.subsize = sri.subsize // 2
+        if not is_db:
+            values = 20.0 * numpy.log10(numpy.maximum(numpy.abs(values), 1e-20))
+        if not len(values):
+            return values.astype(numpy.int8), sri, 1.0, 0.0
+        high = float(values.max())
+        low = max(float(values.min()), high - INT8LOG_RANGE)
+        offset = (high + low) / 2.0
+        scale = (high - low) / 254.0 or 1.0
+        samples = numpy.rint((numpy.clip(values, low, high) - offset) / scale).astype(numpy.int8)
+        return samples, sri, scale, offset
+
+    return words, sri, None, 0.0
+
+def round_significant(values, digits=7):
+    """
+    Rounds an array of floats to a number of significant digits so that
+    they JSON-encode to at most that many digits.
+    """
+    values = numpy.array(values, dtype=numpy.float64)
+    # Zeros, infinities and NaNs are left as they are
+    index = numpy.flatnonzero(numpy.isfinite(values))
+    index = index[values.flat[index] != 0.0]
+    rounded = values.flat[index]
+    factor = 10.0 ** (digits - 1 - numpy.floor(numpy.log10(numpy.abs(rounded))))
+    values.flat[index] = numpy.rint(rounded * factor) / factor
+    return values
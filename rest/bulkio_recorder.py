@@ -0,0 +1,521 @@
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+"""
+Server-side recording of BULKIO ports to disk
+
+A recording attaches to the PortHub of a uses port like any websocket and
+writes one stream of it at full rate, without limiting, into the directory
+set by configure() (see the bulkio_record_dir option of pyrest.py):
+
+    POST   .../ports/{PORT}/recordings       {"format": "blue", "streamID": ...}
+    GET    .../ports/{PORT}/recordings[/{ID}]
+    PUT    .../ports/{PORT}/recordings/{ID}  {"started": false}
+    DELETE .../ports/{PORT}/recordings/{ID}
+    GET    .../ports/{PORT}/recordings/{ID}/data
+    GET    .../ports/{PORT}/recordings/{ID}/sidecar
+
+The stream is the streamID given or else the first stream to send a packet,
+and the recording stops by itself at its end of stream.  The samples are
+written as they arrive, little-endian, either as a raw file or as a BLUE
+file (a 512-byte type 1000 or 2000 header followed by the samples).  Both
+get a JSON sidecar with every SRI of the stream and the timestamps of the
+first packet and of every packet that is not contiguous with the one
+before it, each at its offset in words.  The data download honours Range
+requests so that long recordings can be fetched in pieces or resumed.
+
+Functions:
+configure -- set the directory and queue size of the recordings
+recordings -- list the recordings, optionally of one port
+
+Classes:
+Recording -- one stream of a port written by its own thread
+BulkIORecordingHandler -- start, stop, list and delete recordings
+BulkIORecordingDataHandler -- download the files of a recording
+"""
+
+import collections
+import datetime
+import json
+import logging
+import os
+import Queue
+import struct
+import threading
+import uuid
+
+import tornado.web
+from tornado import gen
+
+from ossie.properties import props_to_dict
+
+import bulkio_hub
+import bulkio_protocol
+from crossdomain import CrossDomains
+from handler import JsonHandler
+from model.domain import ResourceNotFound
+
+
+def enum(**enums):
+    return type('Enum', (), enums)
+
+FormatEnum = enum(Raw=0, Blue=1)
+
+# Names of the formats as accepted in the request body
+FORMAT_NAMES = {
+    'raw':  FormatEnum.Raw,
+    'blue': FormatEnum.Blue,
+}
+
+FORMAT_EXTENSIONS = {
+    FormatEnum.Raw:  '.raw',
+    FormatEnum.Blue: '.blue',
+}
+
+# Directory of the recordings ('' disables recording)
+DEFAULT_DIRECTORY = ''
+
+# Packets waiting for the writer thread before new ones are dropped
+DEFAULT_QUEUE_PACKETS = 1024
+
+# Buffer of the data file; the writer thread hands whole packets to it
+WRITE_BUFFER = 8 * 1024 * 1024
+
+# Path lengths of the REDHAWK objects with ports (see get_object_by_path)
+_OBJECT_PATH_LENGTHS = {
+    'application': 2,
+    'component': 3,
+    'device': 3,
+}
+
+# BLUE header (HCB) up to the adjunct block, little-endian ('EEEI')
+BLUE_HEADER = struct.Struct('<4s4s4siiiiiddi2shdhhiiidd64xi92s')
+BLUE_ADJUNCT_1000 = struct.Struct('<ddi')
+BLUE_ADJUNCT_2000 = struct.Struct('<ddiiddi')
+BLUE_HEADER_SIZE = 512
+BLUE_ADJUNCT_OFFSET = 256
+
+# Seconds from the BLUE epoch (1950) to the Unix epoch
+BLUE_EPOCH_OFFSET = 631152000
+
+# BLUE format letters of the sample types (uint64 has none)
+BLUE_TYPES = {
+    'int8':  'B',
+    'uint8': 'O',
+    '<i2':   'I',
+    '<u2':   'U',
+    '<i4':   'L',
+    '<u4':   'V',
+    '<i8':   'X',
+    '<f4':   'F',
+    '<f8':   'D',
+}
+
+_DIRECTORY = DEFAULT_DIRECTORY
+_QUEUE_PACKETS = DEFAULT_QUEUE_PACKETS
+
+# Recordings by ID, oldest first
+_RECORDINGS = collections.OrderedDict()
+_RECORDINGS_LOCK = threading.Lock()
+
+
+def configure(directory=DEFAULT_DIRECTORY, queue_packets=DEFAULT_QUEUE_PACKETS):
+    """
+    Records into `directory`, creating it if needed.  Each recording queues
+    up to `queue_packets` packets for its writer thread.
+    """
+    global _DIRECTORY, _QUEUE_PACKETS
+    _DIRECTORY = directory
+    _QUEUE_PACKETS = max(queue_packets, 1)
+    if _DIRECTORY:
+        if not os.path.isdir(_DIRECTORY):
+            os.makedirs(_DIRECTORY)
+        logging.info('Bulkio recordings in %s', _DIRECTORY)
+
+def recordings(key=None):
+    """
+    Returns the recordings, oldest first, of the port identified by key (the
+    kind, object path and port name) or of all ports.
+    """
+    with _RECORDINGS_LOCK:
+        return [r for r in _RECORDINGS.values() if key is None or r.key == key]
+
+def _blue_format(dtype, complexData):
+    name = dtype.str if dtype.itemsize > 1 else dtype.name
+    if name not in BLUE_TYPES:
+        raise ValueError("Samples of type %s can not be recorded as BLUE, use raw" % dtype.name)
+    return ('C' if complexData else 'S') + BLUE_TYPES[name]
+
+def _duration(words, sri):
+    # Seconds covered by a number of words of a stream
+    if sri.subsize:
+        return words / float(sri.subsize * (2 if sri.mode else 1)) * (sri.ydelta or 0.0)
+    return words / (2.0 if sri.mode else 1.0) * (sri.xdelta or 0.0)
+
+def _sri_dict(sri):
+    return dict(sri.__dict__, keywords=props_to_dict(sri.keywords))
+
+def _ts_dict(ts):
+    return dict(tcmode=ts.tcmode, tcstatus=ts.tcstatus, toff=ts.toff, twsec=ts.twsec, tfsec=ts.tfsec)
+
+
+class Recording(object):
+    """
+    Writes one stream of a port to disk.
+
+    The hub callbacks only queue the packets, so the CORBA threads never
+    wait for the disk; a dedicated writer thread converts every packet to
+    the sample type of the port and appends it to the data file through a
+    WRITE_BUFFER sized buffer.  Packets that find the queue full are
+    dropped and counted, and show up in the sidecar as a time discontinuity.
+    """
+    def __init__(self, key, dtype, fmt=FormatEnum.Blue, stream_id=None, directory=None, queue_packets=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.dtype = dtype
+        self.format = fmt
+        self.streamID = stream_id
+        directory = directory or _DIRECTORY
+        self.path = os.path.join(directory, self.id + FORMAT_EXTENSIONS[fmt])
+        self.sidecarPath = os.path.join(directory, self.id + '.json')
+
+        self.started = datetime.datetime.utcnow()
+        self.stopped = None
+        self.words = 0
+        self.packets = 0
+        self.dropped = 0
+        self.error = None
+        self.hub = None
+
+        self._SRIs = dict()
+        self._sriLog = []
+        self._timestamps = []
+        self._stopping = False
+        self._remove = False
+        self._lock = threading.Lock()
+        self._queue = Queue.Queue(queue_packets or _QUEUE_PACKETS)
+        self._thread = threading.Thread(target=self._run, name='bulkio-recording-%s' % self.id)
+        self._thread.daemon = True
+
+    @property
+    def state(self):
+        if self.error:
+            return 'error'
+        if self._thread.is_alive():
+            return 'stopping' if self._stopping else 'recording'
+        return 'stopped'
+
+    def start(self, port, bulkio_poa):
+        """
+        Starts the writer thread and attaches to the hub of the port.  If
+        the port can not be attached the files are closed and removed.
+        """
+        self._thread.start()
+        try:
+            self.hub = bulkio_hub.attach(self.key + (None,), port, bulkio_poa, self)
+        except Exception:
+            with self._lock:
+                self._stopping = self._remove = True
+            self._queue.put(None)
+            self._thread.join()
+            raise
+        if self._stopping:
+            # The stream ended before the hub was known
+            bulkio_hub.detach(self.hub, self)
+
+    def stop(self):
+        """
+        Detaches from the port.  The writer thread finishes the packets
+        already queued, completes the header and writes the sidecar.
+        """
+        if self._detach():
+            self._queue.put(None)
+
+    def remove(self):
+        """
+        Stops the recording and deletes its files once they are closed.
+        """
+        self.stop()
+        with self._lock:
+            self._remove = True
+            if self._thread.is_alive():
+                return
+        self._removeFiles()
+
+    def _detach(self):
+        # Marks the recording as stopping and detaches it from the hub, the
+        # first time only.  Returns whether this was the first time.
+        with self._lock:
+            stopping, self._stopping = self._stopping, True
+        if (not stopping and self.hub is not None):
+            bulkio_hub.detach(self.hub, self)
+        return not stopping
+
+    def info(self):
+        info = dict(
+            id       = self.id,
+            state    = self.state,
+            format   = [k for k, v in FORMAT_NAMES.items() if v == self.format][0],
+            streamID = self.streamID,
+            dtype    = self.dtype.str,
+            started  = self.started.isoformat() + 'Z',
+            stopped  = self.stopped.isoformat() + 'Z' if self.stopped else None,
+            packets  = self.packets,
+            words    = self.words,
+            bytes    = self.words * self.dtype.itemsize,
+            dropped  = self.dropped,
+            )
+        if self.error:
+            info['error'] = self.error
+        return info
+
+    def _pushSRI(self, sri):
+        with self._lock:
+            self._SRIs[sri.streamID] = sri
+
+    def _pushPacket(self, data, ts, EOS, stream_id):
+        with self._lock:
+            if self._stopping:
+                return
+            if self.streamID is None:
+                self.streamID = stream_id
+            elif stream_id != self.streamID:
+                return
+            sri = self._SRIs.get(stream_id, None)
+        if sri is None:
+            return
+        try:
+            self._queue.put_nowait((data, ts, EOS, sri))
+        except Queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _run(self):
+        lastSRI = None
+        firstSRI = firstTime = None
+        expected = None
+        try:
+            with open(self.path, 'wb', WRITE_BUFFER) as f:
+                while True:
+                    item = self._queue.get()
+                    if item is None:
+                        break
+                    data, ts, EOS, sri = item
+                    words = bulkio_protocol.to_array(data, self.dtype)
+
+                    if sri is not lastSRI:
+                        if (lastSRI is None and self.format == FormatEnum.Blue):
+                            f.write(self._blueHeader(sri, ts, 0))
+                        self._sriLog.append(dict(offset=self.words, SRI=_sri_dict(sri)))
+                        lastSRI = sri
+                    if len(words):
+                        # Only the timestamps that can not be computed from
+                        # the one before them are kept
+                        seconds = ts.twsec + ts.tfsec
+                        halfSample = _duration((sri.subsize or 1) * (2 if sri.mode else 1), sri) / 2.0
+                        if (expected is None or abs(seconds - expected) > halfSample + 1e-9):
+                            self._timestamps.append(dict(_ts_dict(ts), offset=self.words))
+                        expected = seconds + _duration(len(words), sri)
+                    if firstTime is None:
+                        firstSRI, firstTime = sri, ts
+
+                    f.write(words.data)
+                    self.words += len(words)
+                    self.packets += 1
+
+                    if EOS:
+                        logging.info('Recording %s reached the end of stream %s', self.id, self.streamID)
+                        self._detach()
+                        break
+
+                if (lastSRI is not None and self.format == FormatEnum.Blue):
+                    # Complete the header with the size of the data
+                    f.flush()
+                    f.seek(0)
+                    f.write(self._blueHeader(firstSRI, firstTime, self.words * self.dtype.itemsize))
+        except Exception, e:
+            logging.exception('Error writing recording %s', self.id)
+            self.error = str(e)
+            self._detach()
+
+        self.stopped = datetime.datetime.utcnow()
+        try:
+            with open(self.sidecarPath, 'w') as f:
+                json.dump(dict(self.info(), state=self.state if self.error else 'stopped', SRIs=self._sriLog, timestamps=self._timestamps), f, indent=2)
+        except Exception:
+            logging.exception('Error writing the sidecar of recording %s', self.id)
+        with self._lock:
+            remove = self._remove
+        if remove:
+            self._removeFiles()
+
+    def _blueHeader(self, sri, ts, dataSize):
+        # The 512-byte header of a BLUE file, with the SRI and the time of
+        # the first packet
+        timecode = ts.twsec + BLUE_EPOCH_OFFSET + ts.tfsec
+        keywords = 'STREAMID=%s' % self.streamID
+        if sri.subsize:
+            blueType = 2000
+            # BLUE counts the subsize in (complex) samples
+            adjunct = BLUE_ADJUNCT_2000.pack(sri.xstart, sri.xdelta, sri.xunits,
+                                             sri.subsize // (2 if sri.mode else 1),
+                                             sri.ystart, sri.ydelta, sri.yunits)
+        else:
+            blueType = 1000
+            adjunct = BLUE_ADJUNCT_1000.pack(sri.xstart, sri.xdelta, sri.xunits)
+        header = BLUE_HEADER.pack('BLUE', 'EEEI', 'EEEI', 0, 0, 0, 0, 0,
+                                  float(BLUE_HEADER_SIZE), float(dataSize), blueType,
+                                  _blue_format(self.dtype, sri.mode), 0, timecode,
+                                  0, 0, 0, 0, 0, 0.0, 0.0, len(keywords), keywords[:92])
+        return header.ljust(BLUE_ADJUNCT_OFFSET, '\0') + adjunct.ljust(BLUE_HEADER_SIZE - BLUE_ADJUNCT_OFFSET, '\0')
+
+    def _removeFiles(self):
+        for path in (self.path, self.sidecarPath):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _recording(key, recording_id):
+    # The recording of a port, raising ResourceNotFound if there is none
+    with _RECORDINGS_LOCK:
+        recording = _RECORDINGS.get(recording_id, None)
+    if recording is None or recording.key != key:
+        raise ResourceNotFound('recording', recording_id)
+    return recording
+
+def _split_path(kind, args):
+    # (object path, port key, recording ID or None) from the URL arguments
+    length = _OBJECT_PATH_LENGTHS[kind]
+    recording_id = args[length + 1] if len(args) > length + 1 else None
+    return args[:length], (kind,) + tuple(args[:length + 1]), recording_id
+
+
+class BulkIORecordingHandler(JsonHandler):
+    """
+    Starts, stops, lists and deletes the recordings of a port (see the
+    module documentation).
+    """
+    def initialize(self, kind, redhawk=None):
+        super(BulkIORecordingHandler, self).initialize(redhawk)
+        self.kind = kind
+
+    @gen.coroutine
+    def get(self, *args):
+        try:
+            _, key, recording_id = _split_path(self.kind, args)
+            if recording_id:
+                info = _recording(key, recording_id).info()
+            else:
+                info = {'recordings': [r.info() for r in recordings(key)]}
+            self._render_json(info)
+        except Exception as e:
+            self._handle_request_exception(e)
+
+    @gen.coroutine
+    def post(self, *args):
+        try:
+            data = json.loads(self.request.body or '{}')
+            path, key, _ = _split_path(self.kind, args)
+            if not _DIRECTORY:
+                raise ValueError('Recording is disabled, see the bulkio_record_dir option')
+
+            fmt = data.get('format', 'blue')
+            if fmt not in FORMAT_NAMES:
+                raise ValueError("Unknown format '%s'" % fmt)
+            stream_id = data.get('streamID', None)
+
+            obj, _ = yield self.redhawk.get_object_by_path(path, path_type=self.kind)
+            port, bulkio_poa = bulkio_hub.find_port(obj, key[-1])
+            dtype = bulkio_protocol.port_dtype(port._using.name)
+            if dtype is None:
+                raise ValueError("Port '%s' does not carry samples" % key[-1])
+            if FORMAT_NAMES[fmt] == FormatEnum.Blue and dtype.str == '<u8':
+                raise ValueError("Samples of type %s can not be recorded as BLUE, use raw" % dtype.name)
+
+            recording = Recording(key, dtype, FORMAT_NAMES[fmt], stream_id)
+            recording.start(port, bulkio_poa)
+            with _RECORDINGS_LOCK:
+                _RECORDINGS[recording.id] = recording
+            logging.info('Started recording %s of %s', recording.id, port)
+
+            self._render_json({'started': recording.id, 'recordings': [r.info() for r in recordings(key)]})
+        except Exception as e:
+            self._handle_request_exception(e)
+
+    @gen.coroutine
+    def put(self, *args):
+        try:
+            data = json.loads(self.request.body)
+            _, key, recording_id = _split_path(self.kind, args)
+            recording = _recording(key, recording_id)
+
+            if data['started']:
+                if recording.state != 'recording':
+                    raise ValueError('Recording %s can not be restarted' % recording_id)
+            else:
+                recording.stop()
+
+            self._render_json(recording.info())
+        except Exception as e:
+            self._handle_request_exception(e)
+
+    @gen.coroutine
+    def delete(self, *args):
+        try:
+            _, key, recording_id = _split_path(self.kind, args)
+            recording = _recording(key, recording_id)
+            with _RECORDINGS_LOCK:
+                _RECORDINGS.pop(recording_id, None)
+            recording.remove()
+
+            self._render_json({'deleted': recording_id, 'recordings': [r.info() for r in recordings(key)]})
+        except Exception as e:
+            self._handle_request_exception(e)
+
+
+class BulkIORecordingDataHandler(CrossDomains, tornado.web.StaticFileHandler):
+    """
+    Downloads the data file or the JSON sidecar of a recording, with the
+    Range support of StaticFileHandler.  The data of a running recording
+    can be downloaded as far as it has been written.
+    """
+    def initialize(self, kind, redhawk=None):
+        super(BulkIORecordingDataHandler, self).initialize(_DIRECTORY or os.curdir)
+        self.kind = kind
+
+    def head(self, *args):
+        return self.get(*args, include_body=False)
+
+    def get(self, *args, **kwargs):
+        what = args[-1]
+        _, key, recording_id = _split_path(self.kind, args[:-1])
+        try:
+            recording = _recording(key, recording_id)
+        except ResourceNotFound:
+            raise tornado.web.HTTPError(404)
+        path = recording.path if what == 'data' else recording.sidecarPath
+        return super(BulkIORecordingDataHandler, self).get(os.path.basename(path), **kwargs)
+
+    def compute_etag(self):
+        # Recordings grow, hashing them (the default) would be slow and stale
+        stat = os.stat(self.absolute_path)
+        return '"%x-%x"' % (stat.st_size, int(stat.st_mtime * 1000))
+
+    def set_extra_headers(self, path):
+        self.set_header('Content-Disposition', 'attachment; filename="%s"' % os.path.basename(path))
@@ -0,0 +1,136 @@
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+"""
+Live statistics of the bulkio clients
+
+Every client attached to a port (websocket or HTTP stream) counts what
+goes through it and is listed, for as long as it is attached, at
+
+    GET /redhawk/rest/bulkio/connections[/{ID}]
+
+with its port path, connection ID, remote address and counters (the
+listing also has the totals of the websocket compression).  A heavy
+consumer can be throttled with
+
+    PUT /redhawk/rest/bulkio/connections/{ID}    {"maxpps": 5}
+
+The counters are plain attributes bumped by the ORB, worker and ioloop
+threads without a lock; a lost increment now and then is the price of
+not slowing the data path down.
+
+Functions:
+register -- list a client
+unregister -- stop listing a client
+clients -- the listed clients
+
+Classes:
+Counters -- the counters of one client
+BulkIOStatsHandler -- list and throttle the clients
+"""
+
+import json
+import logging
+import threading
+import weakref
+
+from tornado import gen
+
+import crossdomainsocket
+from handler import JsonHandler
+from model.domain import ResourceNotFound
+
+
+class Counters(object):
+    """
+    What went through one client since it was attached.
+    """
+    __slots__ = ('packetsIn', 'samplesIn', 'filtered', 'packetsOut', 'samplesOut',
+                 'bytesSent', 'limitSeconds', 'encodeSeconds')
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+
+# Clients by ID, see register()
+_CLIENTS = weakref.WeakValueDictionary()
+_CLIENTS_LOCK = threading.Lock()
+
+
+def register(client):
+    """
+    Lists the client (anything with the stats() and throttle() methods of
+    bulkio_handler.BulkIOClient) and returns its ID.
+    """
+    client_id = '%x' % id(client)
+    with _CLIENTS_LOCK:
+        _CLIENTS[client_id] = client
+    return client_id
+
+def unregister(client_id):
+    with _CLIENTS_LOCK:
+        _CLIENTS.pop(client_id, None)
+
+def clients():
+    """
+    Returns the listed clients by ID.
+    """
+    with _CLIENTS_LOCK:
+        return dict(_CLIENTS.items())
+
+
+class BulkIOStatsHandler(JsonHandler):
+    """
+    Lists the bulkio clients with their statistics and throttles them (see
+    the module documentation).
+    """
+    @gen.coroutine
+    def get(self, client_id=None):
+        try:
+            listed = clients()
+            if client_id:
+                if client_id not in listed:
+                    raise ResourceNotFound('bulkio connection', client_id)
+                info = dict(listed[client_id].stats(), id=client_id)
+            else:
+                info = {'connections': [dict(client.stats(), id=cid) for cid, client in sorted(listed.items())],
+                        'compression': crossdomainsocket.compression_stats()}
+            self._render_json(info)
+        except Exception as e:
+            self._handle_request_exception(e)
+
+    @gen.coroutine
+    def put(self, client_id):
+        try:
+            data = json.loads(self.request.body)
+            client = clients().get(client_id, None)
+            if client is None:
+                raise ResourceNotFound('bulkio connection', client_id)
+
+            maxpps = max(float(data['maxpps']), 0.0)
+            client.throttle(maxpps)
+            logging.info('Bulkio connection %s throttled to %s packets per second', client_id, maxpps)
+
+            self._render_json(dict(client.stats(), id=client_id))
+        except Exception as e:
+            self._handle_request_exception(e)
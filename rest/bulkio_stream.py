@@ -0,0 +1,139 @@
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+"""
+Streaming of BULKIO ports over plain HTTP
+
+For clients that can not use the bulkio websocket (e.g. scripts behind
+proxies), a GET of
+
+    .../ports/{PORT}/stream[/{CONNECTION ID}]?format=...&xmax=...
+
+attaches to the port exactly like the websocket and streams the packets
+in the response until the client disconnects.  All of the websocket
+query arguments apply, plus the limiter settings that the websocket sets
+with control messages: xmax, ymax, xdecimation and ydecimation.
+
+With format=binary the response is a chunked application/octet-stream of
+the records of bulkio_capture (SRI and other JSON control messages and
+binary packets, each behind a length and kind header).  The JSON formats are
+sent as Server-Sent Events, one JSON message per event.
+
+The response is written one message at a time, each waiting for the
+previous one to be flushed to the socket, so a slow reader fills the send
+queue and its drop policy applies instead of the server buffering.
+
+Classes:
+BulkIOStreamHandler -- stream a port as chunked records or SSE
+"""
+
+import json
+import logging
+import time
+
+from tornado import gen, iostream
+from tornado.concurrent import Future
+
+import bulkio_capture
+from bulkio_handler import BulkIOClient, ProtocolEnum
+from handler import JsonHandler
+
+
+class BulkIOStreamHandler(BulkIOClient, JsonHandler):
+    """
+    Streams a port for as long as the client stays connected (see the
+    module documentation).
+    """
+    _transport = 'http'
+
+    def initialize(self, kind, redhawk=None, _ioloop=None):
+        super(BulkIOStreamHandler, self).initialize(redhawk)
+        self._setup(kind, redhawk, _ioloop)
+        # Resolved by _drain() when messages are queued
+        self._ready = None
+
+    @gen.coroutine
+    def get(self, *args):
+        try:
+            logging.debug("BulkIOStreamHandler get kind=%s, path=%s", self.kind, args)
+            self._parseArguments()
+            yield self._attach(args)
+        except Exception, e:
+            logging.exception('Error with request %s' % self.request.full_url())
+            self._closed = True
+            self._handle_request_exception(e)
+            return
+
+        if (self._protocol == ProtocolEnum.Binary):
+            self.set_header('Content-Type', 'application/octet-stream')
+        else:
+            self.set_header('Content-Type', 'text/event-stream')
+            self.set_header('Cache-Control', 'no-cache')
+        # Keep proxies (e.g. nginx) from buffering the stream
+        self.set_header('X-Accel-Buffering', 'no')
+
+        try:
+            yield self.flush()
+            while not self._closed:
+                item = self._sendQueue.pop()
+                if item is None:
+                    self._ready = Future()
+                    yield self._ready
+                    continue
+                message, binary, trace = item
+                started = time.time()
+                chunk = self._encode(message, binary)
+                self._stats.encodeSeconds += time.time() - started
+                self._stats.bytesSent += len(chunk)
+                self.write(chunk)
+                if trace is not None:
+                    trace.finish('send')
+                # Backpressure: nothing more is written until the client
+                # has taken this message
+                yield self.flush()
+        except iostream.StreamClosedError:
+            logging.debug('Bulkio stream client went away')
+        finally:
+            self._close()
+
+    def on_connection_close(self):
+        self._close()
+
+    def _close(self):
+        self._closed = True
+        self._sendQueue.clear()
+        self._coalescer.clear()
+        self._wake()
+        self._detach()
+
+    def _drain(self):
+        self._wake()
+
+    def _wake(self):
+        if (self._ready is not None and not self._ready.done()):
+            self._ready.set_result(None)
+
+    def _encode(self, message, binary):
+        # One record (binary) or event (JSON) of the response
+        if (self._protocol == ProtocolEnum.Binary):
+            if binary:
+                return bulkio_capture.record(bulkio_capture.RECORD_PACKET, message)
+            kind = bulkio_capture.RECORD_SRI if message.get('type', None) == 'sri' else bulkio_capture.RECORD_MESSAGE
+            return bulkio_capture.record(kind, json.dumps(message))
+        return 'data: %s\n\n' % json.dumps(message)
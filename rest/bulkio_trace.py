@@ -0,0 +1,286 @@
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+"""
+Latency tracing of the bulkio pipeline
+
+When enabled (see configure() and the bulkio_trace option of pyrest.py)
+one packet out of every N pushed to an AsyncPort is followed through the
+pipeline of every client it reaches and the time it spent in each stage
+is added to a histogram:
+
+    dispatch -- AsyncPort._pushPacket to the client's _pushPacket (hub fan out)
+    queue    -- waiting for a worker thread (and the packet rate limit)
+    limit    -- bulkio_limiter.limit()
+    build    -- max hold, quantization and encoding of the packet
+    send     -- waiting in the send queue, up to write_message()
+    total    -- AsyncPort._pushPacket to write_message()
+    age      -- wall clock at write_message() minus the packet's timestamp
+
+Stage times come from a monotonic clock (CLOCK_MONOTONIC through ctypes
+on Python 2, which has no time.monotonic; tracing can not be enabled
+without one).  The age compares the wall clock with the BULKIO
+PrecisionUTCTime so it includes the time the component took to push the
+packet (and any clock offset between the hosts).
+Coalesced packets are not traced, and a packet that makes a client send
+several (e.g. spectra) only traces the first one.
+
+The histograms are served at
+
+    GET /redhawk/rest/bulkio/trace[?format=prometheus]
+
+and reset with a DELETE of the same URL.
+
+Functions:
+configure -- trace one packet out of every N (0 disables the tracing)
+begin -- start tracing a packet pushed to a port, if it is sampled
+end -- stop tracing the packet of the current thread
+current -- the trace of the current thread
+activate -- set the trace of the current thread
+histograms -- the histograms of the stages
+
+Classes:
+Trace -- the progress of one traced packet through one client
+Histogram -- the latencies of one stage
+BulkIOTraceHandler -- serve and reset the histograms
+"""
+
+import bisect
+import ctypes
+import ctypes.util
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+
+from tornado import gen
+
+from handler import JsonHandler
+
+# clock_gettime() clock ID of CLOCK_MONOTONIC on Linux
+_CLOCK_MONOTONIC = 1
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+def _monotonic_clock():
+    """
+    Returns a function returning the seconds of a monotonic clock, or None
+    if there is none.
+    """
+    try:
+        from time import monotonic
+        return monotonic
+    except ImportError:
+        pass
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        # In libc since glibc 2.17, in librt before
+        clock_gettime = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1', use_errno=True).clock_gettime
+    except (OSError, AttributeError):
+        return None
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+
+    def monotonic():
+        spec = _timespec()
+        if clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(spec)):
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return spec.tv_sec + spec.tv_nsec * 1e-9
+    return monotonic
+
+_clock = _monotonic_clock()
+
+STAGES = ('dispatch', 'queue', 'limit', 'build', 'send', 'total', 'age')
+
+# Upper bounds (in seconds) of the histogram buckets, the last bucket has
+# no bound
+BUCKETS = tuple(float('%de%d' % (m, e)) for e in xrange(-6, 2) for m in (1, 2, 5))
+
+# Default number of packets per traced packet (0 disables the tracing)
+DEFAULT_EVERY = 0
+
+_EVERY = DEFAULT_EVERY
+_COUNTER = itertools.count()
+_LOCAL = threading.local()
+
+
+def configure(every=DEFAULT_EVERY):
+    """
+    Traces one packet out of every `every` pushed to any port.  Raises
+    RuntimeError if there is no monotonic clock to time the stages with.
+    """
+    global _EVERY
+    if (every > 0 and _clock is None):
+        raise RuntimeError('Bulkio trace needs a monotonic clock, none found on %s' % sys.platform)
+    _EVERY = max(every, 0)
+    if _EVERY:
+        logging.info('Bulkio trace: one packet out of %d', _EVERY)
+
+
+class Histogram(object):
+    """
+    Counts of the latencies of one stage by bucket (see BUCKETS).
+    """
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(BUCKETS) + 1)
+            self.count = 0
+            self.sum = 0.0
+            self.max = None
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            if (self.max is None or seconds > self.max):
+                self.max = seconds
+
+    def info(self):
+        with self._lock:
+            return dict(
+                name    = self.name,
+                count   = self.count,
+                sum     = self.sum,
+                mean    = self.sum / self.count if self.count else None,
+                max     = self.max,
+                buckets = [dict(le=bound, count=count) for bound, count in zip(BUCKETS + (None,), self.counts)])
+
+
+_HISTOGRAMS = dict((stage, Histogram(stage)) for stage in STAGES)
+
+
+def histograms():
+    """
+    Returns the histograms in the order of STAGES.
+    """
+    return [_HISTOGRAMS[stage] for stage in STAGES]
+
+
+class Trace(object):
+    """
+    A traced packet on its way through one client.  Each mark() adds the
+    time since the previous mark to the histogram of a stage.
+    """
+    __slots__ = ('started', 'last', 'timestamp')
+
+    def __init__(self, timestamp, started=None):
+        # timestamp: seconds since the epoch of the packet's PrecisionUTCTime
+        self.timestamp = timestamp
+        self.started = self.last = started if started is not None else _clock()
+
+    def fork(self, stage):
+        """
+        Returns a copy for one client, marked at `stage`.
+        """
+        trace = Trace(self.timestamp, self.started)
+        trace.last = self.last
+        trace.mark(stage)
+        return trace
+
+    def mark(self, stage):
+        now = _clock()
+        _HISTOGRAMS[stage].observe(now - self.last)
+        self.last = now
+
+    def finish(self, stage):
+        """
+        Marks the last stage, the total time and the age of the packet.
+        """
+        self.mark(stage)
+        _HISTOGRAMS['total'].observe(self.last - self.started)
+        if self.timestamp:
+            _HISTOGRAMS['age'].observe(time.time() - self.timestamp)
+
+
+def begin(ts):
+    """
+    Returns the Trace of a packet with the PrecisionUTCTime `ts` just pushed
+    to a port and makes it the trace of the current thread, or returns None
+    if the packet is not sampled.
+    """
+    if (not _EVERY or next(_COUNTER) % _EVERY):
+        return None
+    timestamp = (ts.twsec + ts.tfsec) if ts is not None else None
+    _LOCAL.trace = trace = Trace(timestamp)
+    return trace
+
+def end():
+    _LOCAL.trace = None
+
+def current():
+    return getattr(_LOCAL, 'trace', None)
+
+def activate(trace):
+    """
+    Makes `trace` the trace of the current thread and returns the previous one.
+    """
+    previous = getattr(_LOCAL, 'trace', None)
+    _LOCAL.trace = trace
+    return previous
+
+
+class BulkIOTraceHandler(JsonHandler):
+    """
+    Serves the histograms of the stages as JSON or in the text format of
+    Prometheus, and resets them (see the module documentation).
+    """
+    @gen.coroutine
+    def get(self):
+        try:
+            if (self.get_argument('format', 'json') == 'prometheus'):
+                self.set_header('Content-Type', 'text/plain; version=0.0.4')
+                self.finish(self._prometheus())
+                return
+            self._render_json(dict(every=_EVERY, stages=[histogram.info() for histogram in histograms()]))
+        except Exception as e:
+            self._handle_request_exception(e)
+
+    @gen.coroutine
+    def delete(self):
+        try:
+            for histogram in histograms():
+                histogram.reset()
+            self._render_json(dict(every=_EVERY, stages=[histogram.info() for histogram in histograms()]))
+        except Exception as e:
+            self._handle_request_exception(e)
+
+    def _prometheus(self):
+        lines = ['# HELP bulkio_stage_seconds Time spent by traced bulkio packets in each stage',
+                 '# TYPE bulkio_stage_seconds histogram']
+        for histogram in histograms():
+            info = histogram.info()
+            cumulative = 0
+            for bucket in info['buckets']:
+                cumulative += bucket['count']
+                bound = '+Inf' if bucket['le'] is None else repr(bucket['le'])
+                lines.append('bulkio_stage_seconds_bucket{stage="%s",le="%s"} %d' % (info['name'], bound, cumulative))
+            lines.append('bulkio_stage_seconds_sum{stage="%s"} %r' % (info['name'], info['sum']))
+            lines.append('bulkio_stage_seconds_count{stage="%s"} %d' % (info['name'], info['count']))
+        return '\n'.join(lines) + '\n'
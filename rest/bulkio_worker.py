@@ -0,0 +1,167 @@
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+"""
+Worker stage of the BulkIO websocket
+
+Packets are handed from the omniORB upcall thread to a pool of worker
+threads so the sending component's pushPacket returns immediately.  Tasks
+submitted with the same key (client and stream) run one at a time in the
+order they were submitted.  Large packets can additionally have the
+bulkio_limiter run in a process pool so heavy down-sampling does not hold
+the GIL of the server process.
+
+Functions:
+configure -- size the thread and process pools (see pyrest.py options)
+submit -- run a task on the thread pool, ordered by key
+shutdown -- stop the pools, running the tasks already submitted
+limit -- bulkio_limiter.limit(), in the process pool for large packets
+in_process -- whether limit() uses the process pool for a packet
+"""
+
+import collections
+import logging
+import threading
+
+# Suppressed known DeprecationWarning for the futures backport
+try:
+    import warnings, exceptions
+    warnings.filterwarnings("ignore", "The futures package has been deprecated.*", exceptions.DeprecationWarning, "futures")
+    from futures import ThreadPoolExecutor, ProcessPoolExecutor
+except:
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from bulkio import sri
+import bulkio_limiter
+
+# Default number of worker threads (0 processes packets on the ORB thread)
+DEFAULT_THREADS = 4
+
+# Default number of limiter processes (0 disables the process pool)
+DEFAULT_PROCESSES = 0
+
+# Packets with at least this many words are limited in the process pool
+DEFAULT_PROCESS_THRESHOLD = 65536
+
+_THREADS = None
+_PROCESSES = None
+_PROCESS_THRESHOLD = DEFAULT_PROCESS_THRESHOLD
+
+# Tasks waiting per key and the lock protecting them
+_PENDING = dict()
+_PENDING_LOCK = threading.Lock()
+
+
+def configure(threads=DEFAULT_THREADS, processes=DEFAULT_PROCESSES, process_threshold=DEFAULT_PROCESS_THRESHOLD):
+    """
+    Creates the worker pools.  Must be called before the first submit().
+    """
+    global _THREADS, _PROCESSES, _PROCESS_THRESHOLD
+    _THREADS = ThreadPoolExecutor(threads) if threads > 0 else None
+    _PROCESSES = ProcessPoolExecutor(processes) if processes > 0 else None
+    _PROCESS_THRESHOLD = process_threshold
+    logging.info('Bulkio workers: %d threads, %d processes', threads, processes)
+
+def submit(key, fn, *args):
+    """
+    Runs fn(*args) on the thread pool after every task previously submitted
+    with the same key.  Runs it immediately if there is no thread pool.
+    """
+    if _THREADS is None:
+        fn(*args)
+        return
+
+    with _PENDING_LOCK:
+        tasks = _PENDING.get(key, None)
+        if tasks is not None:
+            # A worker is already running this key and will pick it up
+            tasks.append((fn, args))
+            return
+        threads = _THREADS
+        if threads is not None:
+            _PENDING[key] = collections.deque([(fn, args)])
+            # Under the lock so that shutdown() can not stop the pool first
+            threads.submit(_run, key)
+            return
+    # The pool was shut down
+    fn(*args)
+
+def shutdown(wait=True):
+    """
+    Stops the worker pools.  The tasks already submitted still run, and
+    with wait this returns once they have; the tasks submitted afterwards
+    run on the calling thread, as if there were no thread pool.
+    """
+    global _THREADS, _PROCESSES
+    with _PENDING_LOCK:
+        threads, _THREADS = _THREADS, None
+        processes, _PROCESSES = _PROCESSES, None
+    if threads is not None:
+        threads.shutdown(wait)
+    if processes is not None:
+        processes.shutdown(wait)
+
+def _run(key):
+    # Runs the tasks of a key until there are none left
+    while True:
+        with _PENDING_LOCK:
+            tasks = _PENDING[key]
+            if not tasks:
+                del _PENDING[key]
+                return
+            fn, args = tasks[0]
+        try:
+            fn(*args)
+        except Exception:
+            logging.exception('Bulkio worker task failed')
+        with _PENDING_LOCK:
+            tasks.popleft()
+
+def in_process(length):
+    """
+    Returns True if limit() runs in the process pool for `length` words.
+    """
+    return _PROCESSES is not None and length >= _PROCESS_THRESHOLD
+
+def limit(data, inSRI, *args):
+    """
+    Same as bulkio_limiter.limit().  Packets of at least the configured
+    threshold are limited in the process pool, which blocks the calling
+    worker thread until the result is ready.
+    """
+    if not in_process(len(data)):
+        return bulkio_limiter.limit(data, inSRI, *args)
+
+    # CORBA keywords don't pickle; the limiter only copies them anyway
+    fields = dict(inSRI.__dict__, keywords=[])
+    result = _PROCESSES.submit(_limit_fields, data, fields, *args).result()
+    outData, outFields, xFactor, yFactor, sriChanged, warningMessage = result
+    outSRI = bulkio_limiter.copy_sri(inSRI)
+    for name, value in outFields.items():
+        if name != 'keywords':
+            setattr(outSRI, name, value)
+    return outData, outSRI, xFactor, yFactor, sriChanged, warningMessage
+
+def _limit_fields(data, fields, *args):
+    # Runs in the process pool with the SRI passed as a dictionary
+    inSRI = sri.create()
+    for name, value in fields.items():
+        setattr(inSRI, name, value)
+    outData, outSRI, xFactor, yFactor, sriChanged, warningMessage = bulkio_limiter.limit(data, inSRI, *args)
+    return outData, dict(outSRI.__dict__), xFactor, yFactor, sriChanged, warningMessage
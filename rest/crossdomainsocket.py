@@ -20,16 +20,116 @@
 """
 Rest handlers for Cross Domains
 
+Websockets negotiate permessage-deflate (RFC 7692) with clients that offer
+it once configure_compression() has been called with a level above 0 (see
+the ws_compression options of pyrest.py).  Requires tornado 4.5 or later.
+
+Functions:
+configure_compression -- enable permessage-deflate for all websockets
+compression_stats -- totals of the messages written by the compressors
+
 Classes:
 Cross Domains - add access-controll-allow-origin headers to origin 
 """
 
-from tornado import ioloop, websocket
+import logging
+import time
+
+from tornado import ioloop, websocket, escape
+
+# Default zlib level (0 disables the compression), window bits and size in
+# bytes of the smallest message compressed
+DEFAULT_COMPRESSION_LEVEL = 0
+DEFAULT_COMPRESSION_WBITS = 15
+DEFAULT_COMPRESSION_MIN_SIZE = 256
+
+# Compression options handed to tornado, None when disabled
+_COMPRESSION = None
+_WINDOW_BITS = DEFAULT_COMPRESSION_WBITS
+_MIN_SIZE = DEFAULT_COMPRESSION_MIN_SIZE
+
+# Totals of the messages written by compressing websockets (ioloop only)
+_STATS = dict(messages=0, compressed=0, bytes_in=0, bytes_out=0, seconds=0.0)
+
+
+def configure_compression(level=DEFAULT_COMPRESSION_LEVEL, window_bits=DEFAULT_COMPRESSION_WBITS, min_size=DEFAULT_COMPRESSION_MIN_SIZE):
+    """
+    Enables permessage-deflate at the zlib level (1-9, 0 disables it) with
+    a server window of 2**window_bits bytes (9-15).  Messages shorter than
+    min_size bytes are sent uncompressed.
+    """
+    global _COMPRESSION, _WINDOW_BITS, _MIN_SIZE
+    if level <= 0:
+        _COMPRESSION = None
+        return
+    if not hasattr(websocket.WebSocketHandler, 'get_websocket_protocol'):
+        logging.warning('Websocket compression requires tornado 4.5 or later, disabled')
+        _COMPRESSION = None
+        return
+    if not 9 <= window_bits <= 15:
+        raise ValueError('Compression window bits must be between 9 and 15, not %d' % window_bits)
+    _COMPRESSION = dict(compression_level=min(level, 9), mem_level=8)
+    _WINDOW_BITS = window_bits
+    _MIN_SIZE = min_size
+    logging.info('Websocket compression: level %d, %d window bits, %d bytes minimum', level, window_bits, min_size)
+
+def compression_stats():
+    """
+    Returns the number of messages written by compressing websockets, how
+    many were compressed, their size before and after compression and the
+    seconds spent compressing them.
+    """
+    return dict(_STATS)
+
+
+class _DeflateProtocol13(websocket.WebSocketProtocol13):
+    """
+    The websocket protocol with the configured server window size and
+    without compressing short messages (RFC 7692 compresses per message,
+    flagged by RSV1, so uncompressed messages can be mixed in).
+    """
+    def _create_compressors(self, side, agreed_parameters, compression_options=None):
+        if (side == 'server'):
+            # Offer our window unless the client asked for a smaller one.
+            # The agreed parameters are echoed in the handshake response.
+            offered = agreed_parameters.get('server_max_window_bits', None)
+            if (offered is None or int(offered) > _WINDOW_BITS):
+                agreed_parameters['server_max_window_bits'] = str(_WINDOW_BITS)
+        super(_DeflateProtocol13, self)._create_compressors(side, agreed_parameters, compression_options)
+
+    def write_message(self, message, binary=False):
+        if self._compressor is None:
+            return super(_DeflateProtocol13, self).write_message(message, binary)
+
+        opcode = 0x2 if binary else 0x1
+        message = escape.utf8(message)
+        self._message_bytes_out += len(message)
+        _STATS['messages'] += 1
+        if (len(message) < _MIN_SIZE):
+            return self._write_frame(True, opcode, message)
+
+        start = time.time()
+        compressed = self._compressor.compress(message)
+        _STATS['seconds'] += time.time() - start
+        _STATS['compressed'] += 1
+        _STATS['bytes_in'] += len(message)
+        _STATS['bytes_out'] += len(compressed)
+        return self._write_frame(True, opcode, compressed, flags=self.RSV1)
+
 
 class CrossDomainSockets(websocket.WebSocketHandler):
     def check_origin(self, origin):
     	return True
 
+    def get_compression_options(self):
+        return _COMPRESSION
+
+    def get_websocket_protocol(self):
+        protocol = super(CrossDomainSockets, self).get_websocket_protocol()
+        if (_COMPRESSION is not None and isinstance(protocol, websocket.WebSocketProtocol13)):
+            return _DeflateProtocol13(self, compression_options=_COMPRESSION)
+        return protocol
+
 
 
 
@@ -26,6 +26,15 @@ ApplicationTests -- /domain/{NAME}/applications
 ComponentTests -- /domain/{NAME}/applications/{ID}/components
 DeviceManagerTests -- /domain/{NAME}/deviceManagers
 DeviceTests -- /domain/{NAME}/deviceManagers/{ID}/devices
+BulkIOLimiterTests -- rest.bulkio_limiter (no domain required)
+BulkIODSPTests -- rest.bulkio_dsp (no domain required)
+BulkIOCaptureTests -- rest.bulkio_capture (no domain required)
+BulkIORecorderTests -- rest.bulkio_recorder (no domain required)
+BulkIOTraceTests -- rest.bulkio_trace (no domain required)
+BulkIOFlowTests -- rest.bulkio_flow (no domain required)
+BulkIOWorkerTests -- rest.bulkio_worker (no domain required)
+BulkIOProtocolTests -- rest.bulkio_protocol (no domain required)
+BulkIOHandlerTests -- rest.bulkio_handler packet path (no domain required)
 """
 __author__ = 'rpcanno'
 
@@ -37,5 +46,14 @@ from device import DeviceTests
 from application import ApplicationTests
 from component import ComponentTests
 from bulkio_tests import BulkIOTests
+from bulkio_limiter_tests import BulkIOLimiterTests
+from bulkio_dsp_tests import BulkIODSPTests
+from bulkio_capture_tests import BulkIOCaptureTests
+from bulkio_recorder_tests import BulkIORecorderTests
+from bulkio_trace_tests import BulkIOTraceTests
+from bulkio_flow_tests import BulkIOFlowTests
+from bulkio_worker_tests import BulkIOWorkerTests
+from bulkio_protocol_tests import BulkIOProtocolTests
+from bulkio_handler_tests import BulkIOHandlerTests
 from port import PortTests
 from concurrent import ConcurrencyTests
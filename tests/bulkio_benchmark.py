@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+"""
+Standalone benchmarks for the bulkio data path.  No domain is required.
+
+    python tests/bulkio_benchmark.py [--json results.json]
+        [--baseline old.json [--tolerance 0.25]] [benchmark ...]
+
+Every benchmark prints a table and returns its results as records, which
+--json writes out as one JSON list.  Given the records of an
+earlier run, --baseline exits with status 1 if any measurement that both
+runs share got slower by more than the tolerance, so that a regression of
+the hot path can fail a build.
+"""
+import argparse
+import ctypes
+import json
+import os
+import sys
+import timeit
+import zlib
+
+import numpy
+from bulkio import sri, timestamp
+from ossie.utils.bulkio import bulkio_helpers
+
+# tests/concurrent.py would shadow the concurrent.futures package that
+# the rest modules import, so the tests directory goes last
+_TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path = [path for path in sys.path if os.path.abspath(path or os.curdir) != _TESTS_DIR]
+sys.path.insert(0, os.path.dirname(_TESTS_DIR))
+from rest import bulkio_limiter
+from rest.bulkio_handler import BulkIOClient, ProtocolEnum
+sys.path.append(_TESTS_DIR)
+from bulkio_limiter_tests import loopMeanDownsampleX, loopMeanDownsampleY
+
+
+def _best_time(func, repeat=5):
+    '''
+        Returns the fastest of (repeat) calls of func in seconds
+    '''
+    number = 1
+    # Scale the number of calls so that each measurement is at least 10ms
+    while True:
+        elapsed = timeit.Timer(func).timeit(number)
+        if elapsed > 0.01 or number >= 1000:
+            break
+        number *= 10
+    return min(timeit.Timer(func).repeat(repeat, number)) / number
+
+def _memory_kib(field):
+    '''
+        Returns a memory field of /proc/self/status (e.g. VmHWM) in KiB
+    '''
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+
+def _peak_bytes(func):
+    '''
+        Returns how much a call of func raises the resident memory of the
+        process at its peak, or None where that can not be measured (it
+        takes Linux).  The call is made in a forked child that first hands
+        the free heap back to the system (with glibc), so that buffers
+        reusing it are counted too, to the page.
+    '''
+    if not (hasattr(os, 'fork') and os.path.exists('/proc/self/clear_refs')):
+        return None
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(read)
+            # Fault in the code that func runs, then reset the peak (VmHWM)
+            # to the current resident memory
+            func()
+            try:
+                ctypes.CDLL(None).malloc_trim(0)
+            except AttributeError:
+                pass
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+            before = _memory_kib('VmRSS')
+            func()
+            os.write(write, str(max(_memory_kib('VmHWM') - before, 0) * 1024))
+        finally:
+            os._exit(0)
+    os.close(write)
+    with os.fdopen(read) as f:
+        peak = f.read()
+    os.waitpid(pid, 0)
+    return int(peak) if peak else None
+
+def bench_mean_downsample():
+    '''
+        Compares the per-cell loop against the vectorized mean down-sampling
+        for a sweep of packet shapes (rows x cols) and resample factors.
+    '''
+    rng = numpy.random.RandomState(0)
+    results = []
+    print '%-16s %-8s %-8s %12s %12s %8s' % ('shape', 'axis', 'factor', 'loop (ms)', 'numpy (ms)', 'speedup')
+    for shape in ((1, 4096), (1, 65536), (64, 1024), (256, 512), (1024, 128)):
+        matrix = rng.randn(*shape)
+        for axis, loop, vectorized in (('x', loopMeanDownsampleX, bulkio_limiter.meanDownsampleX),
+                                       ('y', loopMeanDownsampleY, bulkio_limiter.meanDownsampleY)):
+            length = shape[1] if axis == 'x' else shape[0]
+            for factor in (2, 7, 64):
+                if factor >= length:
+                    continue
+                loopTime = _best_time(lambda: loop(matrix, factor), repeat=3)
+                numpyTime = _best_time(lambda: vectorized(matrix, factor))
+                print '%-16s %-8s %-8d %12.3f %12.3f %7.1fx' % (
+                    '%dx%d' % shape, axis, factor, loopTime * 1e3, numpyTime * 1e3, loopTime / numpyTime)
+                results.append(dict(benchmark='mean_downsample', shape=list(shape), axis=axis, factor=factor,
+                                    loop_seconds=loopTime, seconds=numpyTime))
+    return results
+
+def legacyComplexLimit(data, xMax):
+    '''
+        The complex path of bulkio_limiter.limit() before it used numpy
+        views: words -> Python complex list -> array -> list -> words
+    '''
+    samples = numpy.array(bulkio_helpers.bulkioComplexToPythonComplexList(data))
+    factor = int(numpy.ceil(float(len(samples)) / xMax))
+    samples = bulkio_limiter.meanDownsampleX(samples.reshape((1, len(samples))), factor)
+    return bulkio_helpers.pythonComplexListToBulkioComplex(samples.squeeze().tolist())
+
+def bench_complex_limit(numSamples=1000000, xMax=1024):
+    '''
+        Limits a complex float packet of (numSamples) samples with the legacy
+        list round-trip and with bulkio_limiter.limit(), for both the list
+        input omniORB produces and numpy input.
+    '''
+    rng = numpy.random.RandomState(0)
+    words = rng.randn(2 * numSamples).astype(numpy.float32)
+    wordList = words.tolist()
+    inSRI = sri.create('bench')
+    inSRI.mode = 1
+
+    legacyTime = _best_time(lambda: legacyComplexLimit(wordList, xMax), repeat=1)
+    listTime = _best_time(lambda: bulkio_limiter.limit(wordList, inSRI, xMax, dtype=numpy.float32), repeat=3)
+    arrayTime = _best_time(lambda: bulkio_limiter.limit(words, inSRI, xMax, dtype=numpy.float32))
+    print
+    print 'Complex float packet, %d samples limited to %d' % (numSamples, xMax)
+    print '%-32s %12s %8s' % ('path', 'time (ms)', 'speedup')
+    for name, elapsed in (('legacy (Python complex list)', legacyTime),
+                          ('limit(), list input', listTime),
+                          ('limit(), numpy input', arrayTime)):
+        print '%-32s %12.3f %7.1fx' % (name, elapsed * 1e3, legacyTime / elapsed)
+    return [dict(benchmark='complex_limit', path=path, samples=numSamples, xmax=xMax, seconds=elapsed)
+            for path, elapsed in (('legacy', legacyTime), ('list', listTime), ('numpy', arrayTime))]
+
+def _deflate(compressor, message):
+    # Same as tornado's permessage-deflate compressor
+    data = compressor.compress(message) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return data[:-4]
+
+def bench_compression(count=200):
+    '''
+        Cost of permessage-deflate (see crossdomainsocket) per message and
+        the bandwidth it saves, for a stream of JSON bulkio packets and of
+        event messages at a sweep of zlib levels and window sizes.
+    '''
+    rng = numpy.random.RandomState(0)
+    inSRI = sri.create('bench')
+    sriDict = dict(inSRI.__dict__, keywords={})
+    tone = numpy.sin(numpy.arange(1024) * 0.1).astype(numpy.float32)
+    bulkio = [json.dumps(dict(streamID='bench', T=dict(tcmode=1, tcstatus=1, toff=0.0, twsec=1.5e9 + n, tfsec=0.25),
+                              EOS=False, sriChanged=False, SRI=sriDict, type='dataFloat', dropped=0, samples=1024,
+                              dataBuffer=(tone + rng.randn(1024).astype(numpy.float32) * 0.01).tolist()))
+              for n in range(count)]
+    events = [json.dumps(dict(domainId='REDHAWK_DEV', topic='ODM_Channel', body=dict(
+                  sourceId='DCE:%08x-0000-4000-8000-%012x' % (n, n), sourceName='GPP_%d' % (n % 4),
+                  sourceCategory='DEVICE', stateChangeCategory='USAGE_STATE_EVENT',
+                  stateChangeFrom='IDLE', stateChangeTo='ACTIVE')))
+              for n in range(count)]
+
+    results = []
+    print
+    print 'permessage-deflate, %d messages per stream' % count
+    print '%-8s %-6s %-6s %10s %10s %8s %12s %10s' % ('stream', 'level', 'wbits', 'bytes in', 'bytes out', 'ratio', 'us/message', 'MB/s')
+    for name, messages in (('bulkio', bulkio), ('events', events)):
+        size = sum(len(message) for message in messages)
+        for level in (1, 6, 9):
+            for wbits in (10, 15):
+                def compress():
+                    compressor = zlib.compressobj(level, zlib.DEFLATED, -wbits, 8)
+                    return sum(len(_deflate(compressor, message)) for message in messages)
+                elapsed = _best_time(compress, repeat=3)
+                compressed = compress()
+                print '%-8s %-6d %-6d %10d %10d %7.1fx %12.1f %10.1f' % (
+                    name, level, wbits, size, compressed, float(size) / compressed,
+                    elapsed / count * 1e6, size / elapsed / 1e6)
+                results.append(dict(benchmark='compression', stream=name, level=level, wbits=wbits,
+                                    bytes_in=size, bytes_out=compressed, seconds=elapsed / count))
+    return results
+
+class _BenchPort(object):
+    class _Using(object):
+        name = 'dataFloat'
+    _using = _Using()
+
+class _BenchClient(BulkIOClient):
+    '''
+        The packet path of the bulkio handlers up to the transport: limit(),
+        the encoding of the packet and the JSON encoding of its messages
+        (as write_message does).  The messages are kept instead of queued.
+    '''
+    def __init__(self, protocol, xMax=0, yMax=0, zoom=None):
+        self._setup('component')
+        self.port = _BenchPort()
+        self._protocol = protocol
+        self._xMax = xMax
+        self._yMax = yMax
+        if zoom:
+            self._xBegin, self._xEnd = zoom
+        self.sent = []
+
+    def _drain(self):
+        pass
+
+    def _send(self, message, binary=False, stream_id=None, droppable=True, trace=None):
+        self.sent.append(message if binary else json.dumps(message))
+
+    def push(self, data, ts, inSRI):
+        del self.sent[:]
+        self._sendPacket(data, ts, False, inSRI.streamID, inSRI, False, numpy.dtype('<f4'))
+        return self.sent
+
+def _limit_cases():
+    # (layout, complex, words per packet, subsize, xMax, yMax, zoom) of the sweep
+    for complexData in (False, True):
+        for samples in (1024, 16384, 262144):
+            for xMax in (0, 1024, 256):
+                for zoom in (False, True):
+                    if (xMax and xMax >= samples):
+                        continue
+                    yield '1d', complexData, samples, 0, xMax, 0, zoom
+        for subsize in (256, 2048):
+            for frames in (16, 256):
+                for xMax, yMax in ((0, 0), (128, 0), (128, 8)):
+                    for zoom in (False, True):
+                        yield '2d', complexData, subsize * frames, subsize, xMax, yMax, zoom
+
+def bench_limit_encode():
+    '''
+        Throughput of limit() and the encoding of a packet (as sent by the
+        bulkio handlers) for synthetic float packets, real and complex, 1D
+        and 2D, over a sweep of packet sizes, subsizes, xMax/yMax and with
+        or without a zoom on the middle half of the X axis.  Packets are
+        lists, like omniORB delivers them.
+    '''
+    rng = numpy.random.RandomState(0)
+    results = []
+    print
+    print 'limit() + encode, dataFloat list packets'
+    print '%-6s %-5s %-8s %-8s %-6s %-6s %-5s %-12s %10s %12s %10s %12s' % (
+        'layout', 'cplx', 'samples', 'subsize', 'xMax', 'yMax', 'zoom', 'format',
+        'ms/packet', 'Msamples/s', 'packets/s', 'peak KiB')
+    for layout, complexData, samples, subsize, xMax, yMax, zoom in _limit_cases():
+        words = samples * (2 if complexData else 1)
+        data = rng.randn(words).astype(numpy.float32).tolist()
+        inSRI = sri.create('bench')
+        inSRI.mode = 1 if complexData else 0
+        inSRI.subsize = subsize
+        ts = timestamp.now()
+        # The limiter counts the subsize of complex data in words
+        width = subsize // (2 if complexData else 1) if subsize else samples
+        zoomRange = (width // 4, 3 * width // 4) if zoom else None
+        for name, protocol in (('json', ProtocolEnum.JSON), ('binary', ProtocolEnum.Binary)):
+            client = _BenchClient(protocol, xMax, yMax, zoomRange)
+            push = lambda: client.push(data, ts, inSRI)
+            push()
+            elapsed = _best_time(push, repeat=3)
+            peak = _peak_bytes(push)
+            print '%-6s %-5s %-8d %-8d %-6d %-6d %-5s %-12s %10.3f %12.2f %10.1f %12s' % (
+                layout, complexData, samples, subsize, xMax, yMax, zoom, name, elapsed * 1e3,
+                samples / elapsed / 1e6, 1.0 / elapsed, '-' if peak is None else '%d' % (peak // 1024))
+            results.append(dict(benchmark='limit_encode', layout=layout, complex=complexData, samples=samples,
+                                subsize=subsize, xmax=xMax, ymax=yMax, zoom=zoom, format=name,
+                                seconds=elapsed, samples_per_second=samples / elapsed,
+                                packets_per_second=1.0 / elapsed, peak_bytes=peak))
+    return results
+
+def bench_limit_plan():
+    '''
+        limit() against the LimitPlan the bulkio handlers cache per stream,
+        for the limited cases of the limit_encode sweep with numpy packets
+        (so the conversion of lists does not hide the difference).
+    '''
+    rng = numpy.random.RandomState(0)
+    results = []
+    print
+    print 'limit() vs cached LimitPlan, float32 array packets'
+    print '%-6s %-5s %-8s %-8s %-6s %-6s %-5s %12s %12s %8s' % (
+        'layout', 'cplx', 'samples', 'subsize', 'xMax', 'yMax', 'zoom', 'limit (ms)', 'plan (ms)', 'speedup')
+    for layout, complexData, samples, subsize, xMax, yMax, zoom in _limit_cases():
+        if not (xMax or yMax or zoom):
+            continue
+        data = rng.randn(samples * (2 if complexData else 1)).astype(numpy.float32)
+        inSRI = sri.create('bench')
+        inSRI.mode = 1 if complexData else 0
+        inSRI.subsize = subsize
+        width = subsize // (2 if complexData else 1) if subsize else samples
+        xBegin, xEnd = (width // 4, 3 * width // 4) if zoom else (None, None)
+        args = (xMax, xBegin, xEnd, bulkio_limiter.DecimateEnum.Mean, yMax, None, None,
+                bulkio_limiter.DecimateEnum.Mean, numpy.dtype(numpy.float32))
+        plan = bulkio_limiter.LimitPlan(len(data), inSRI, *args)
+        limitTime = _best_time(lambda: bulkio_limiter.limit(data, inSRI, *args))
+        planTime = _best_time(lambda: plan.apply(data))
+        print '%-6s %-5s %-8d %-8d %-6d %-6d %-5s %12.4f %12.4f %7.1fx' % (
+            layout, complexData, samples, subsize, xMax, yMax, zoom, limitTime * 1e3, planTime * 1e3,
+            limitTime / planTime)
+        results.append(dict(benchmark='limit_plan', layout=layout, complex=complexData, samples=samples,
+                            subsize=subsize, xmax=xMax, ymax=yMax, zoom=zoom,
+                            limit_seconds=limitTime, seconds=planTime))
+    return results
+
+BENCHMARKS = (
+    ('mean_downsample', bench_mean_downsample),
+    ('complex_limit', bench_complex_limit),
+    ('compression', bench_compression),
+    ('limit_encode', bench_limit_encode),
+    ('limit_plan', bench_limit_plan),
+)
+
+# Fields of a record that are measurements rather than parameters
+_MEASUREMENTS = ('seconds', 'loop_seconds', 'limit_seconds', 'samples_per_second', 'packets_per_second', 'peak_bytes', 'bytes_out')
+
+def _record_key(record):
+    return json.dumps(dict((k, v) for k, v in record.items() if k not in _MEASUREMENTS), sort_keys=True)
+
+def compare(results, baseline, tolerance):
+    '''
+        Returns the (record, baseline record) pairs of the measurements that
+        are slower than in the baseline by more than tolerance (a fraction)
+    '''
+    previous = dict((_record_key(record), record) for record in baseline)
+    regressions = []
+    for record in results:
+        old = previous.get(_record_key(record), None)
+        if (old is not None and record['seconds'] > old['seconds'] * (1.0 + tolerance)):
+            regressions.append((record, old))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the bulkio data path')
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help='benchmarks to run: %s (default all)' % ', '.join(name for name, _ in BENCHMARKS))
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='slowdown from the baseline reported as a regression (default 0.25)')
+    args = parser.parse_args()
+    unknown = set(args.benchmarks).difference(name for name, _ in BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmark %s' % ', '.join(sorted(unknown)))
+
+    results = []
+    for name, bench in BENCHMARKS:
+        if (not args.benchmarks or name in args.benchmarks):
+            results.extend(bench())
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for record, old in regressions:
+            print >> sys.stderr, 'REGRESSION %s: %.3f ms, was %.3f ms' % (
+                _record_key(record), record['seconds'] * 1e3, old['seconds'] * 1e3)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+
+# system imports
+import unittest
+
+# third party imports
+import numpy
+from bulkio import sri, timestamp
+
+# application imports
+from rest import bulkio_capture, bulkio_dsp, bulkio_protocol
+
+
+def readSnapshot(snapshot):
+    '''
+        Returns the (kind, record) tuples of a snapshot
+    '''
+    records = []
+    offset = 0
+    while offset < len(snapshot):
+        length, kind = bulkio_capture.RECORD.unpack_from(snapshot, offset)
+        offset += bulkio_capture.RECORD.size
+        records.append((kind, snapshot[offset:offset + length]))
+        offset += length
+    return records
+
+def frameSamples(frame):
+    '''
+        Returns the header fields and samples of a binary frame
+    '''
+    fields = bulkio_protocol.HEADER.unpack_from(frame)
+    start = bulkio_protocol.HEADER.size + -(-fields[7] // 8) * 8
+    return fields, numpy.frombuffer(frame[start:], dtype='<i2')
+
+
+class BulkIOCaptureTests(unittest.TestCase):
+
+    def setUp(self):
+        self.capture = bulkio_capture.CaptureBuffer(numpy.int16, seconds=0.5)
+        self.inSRI = sri.create('capture_test', srate=1000.0)
+        self.capture.pushSRI(self.inSRI)
+        self.ts = timestamp.now()
+        for packet in range(10):
+            data = range(packet * 100, packet * 100 + 100)
+            self.capture.pushPacket(data, bulkio_dsp.offset_time(self.ts, 0.1 * packet), False, 'capture_test')
+
+    def test_snapshot_wraps(self):
+        records = readSnapshot(self.capture.snapshot())
+        self.assertEqual(bulkio_capture.RECORD_SRI, records[0][0])
+        samples = numpy.concatenate([frameSamples(record)[1] for _, record in records[1:]])
+        numpy.testing.assert_array_equal(samples, numpy.arange(500, 1000))
+
+    def test_snapshot_seconds(self):
+        records = readSnapshot(self.capture.snapshot(0.25))
+        fields, samples = frameSamples(records[1][1])
+        self.assertEqual(750, samples[0])
+        # The first packet is trimmed and keeps the time of its first sample
+        start = self.ts.twsec + self.ts.tfsec
+        self.assertAlmostEqual(0.75, fields[12] + fields[13] - start, places=6)
+        self.assertEqual(3, len(records) - 1)
+
+    def test_packet_larger_than_ring(self):
+        # 1000 words, not a whole number of 300 word frames
+        capture = bulkio_capture.CaptureBuffer(numpy.float32, nbytes=4000)
+        inSRI = sri.create('capture_test', srate=1000.0)
+        inSRI.subsize = 300
+        capture.pushSRI(inSRI)
+        capture.pushPacket(numpy.arange(1500, dtype=numpy.float32), self.ts, False, 'capture_test')
+
+        records = readSnapshot(capture.snapshot())
+        fields = bulkio_protocol.HEADER.unpack_from(records[1][1])
+        start = bulkio_protocol.HEADER.size + -(-fields[7] // 8) * 8
+        # The last whole frames that fit
+        numpy.testing.assert_array_equal(numpy.arange(600, 1500),
+                                         numpy.frombuffer(records[1][1][start:], dtype='<f4'))
+        self.assertEqual((3, 300), (fields[5], fields[6]))
+
+
+if __name__ == '__main__':
+    unittest.main()
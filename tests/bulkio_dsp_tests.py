@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+
+# system imports
+import unittest
+
+# third party imports
+import numpy
+from bulkio import sri, timestamp
+
+# application imports
+from rest import bulkio_dsp
+
+
+class BulkIODSPTests(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = numpy.random.RandomState(0)
+        self.inSRI = sri.create('dsp_test', srate=1000.0)
+
+    def test_spectrum_tone(self):
+        spectrum = bulkio_dsp.PowerSpectrum(256, 50, bulkio_dsp.WindowEnum.Hann, 4)
+        tone = numpy.sin(2 * numpy.pi * 125.0 * numpy.arange(4096) / 1000.0)
+        frames = spectrum.push(tone, timestamp.now(), self.inSRI)
+
+        # (4096 - 256) / 128 + 1 = 31 segments, 4 per frame
+        self.assertEqual(7, len(frames))
+        outSRI = bulkio_dsp.spectrum_sri(self.inSRI, 256)
+        self.assertAlmostEqual(1000.0 / 256, outSRI.xdelta)
+        self.assertEqual(bulkio_dsp.UNITS_FREQUENCY, outSRI.xunits)
+        frame, _ = frames[0]
+        self.assertEqual(129, len(frame))
+        self.assertEqual(bulkio_dsp.SPECTRUM_DTYPE, frame.dtype)
+        self.assertAlmostEqual(125.0, outSRI.xstart + frame.argmax() * outSRI.xdelta)
+
+    def test_spectrum_complex_centered(self):
+        self.inSRI.mode = 1
+        spectrum = bulkio_dsp.PowerSpectrum(128, 0, bulkio_dsp.WindowEnum.Rectangular, 1)
+        tone = numpy.exp(-2j * numpy.pi * 250.0 * numpy.arange(128) / 1000.0)
+        words = numpy.empty(256)
+        words[0::2] = tone.real
+        words[1::2] = tone.imag
+        frames = spectrum.push(words, timestamp.now(), self.inSRI)
+
+        outSRI = bulkio_dsp.spectrum_sri(self.inSRI, 128)
+        self.assertEqual(1, len(frames))
+        self.assertEqual(128, len(frames[0][0]))
+        self.assertAlmostEqual(-250.0, outSRI.xstart + frames[0][0].argmax() * outSRI.xdelta)
+
+    def test_spectrum_noise_density(self):
+        # Unit variance white noise at 1 kHz is 1/500 per Hz one-sided (-27 dB)
+        spectrum = bulkio_dsp.PowerSpectrum(1024, 50, bulkio_dsp.WindowEnum.Hann, 100)
+        frames = spectrum.push(self.rng.randn(1024 * 60), timestamp.now(), self.inSRI)
+        self.assertEqual(1, len(frames))
+        self.assertAlmostEqual(10 * numpy.log10(1 / 500.0), frames[0][0][10:-10].mean(), delta=0.25)
+
+    def test_spectrum_across_packets(self):
+        samples = self.rng.randn(5000)
+        ts = timestamp.now()
+        whole = bulkio_dsp.PowerSpectrum(512, 25, bulkio_dsp.WindowEnum.Blackman, 2)
+        split = bulkio_dsp.PowerSpectrum(512, 25, bulkio_dsp.WindowEnum.Blackman, 2)
+
+        expected = whole.push(samples, ts, self.inSRI)
+        actual = []
+        for start in range(0, len(samples), 700):
+            packetTime = bulkio_dsp.offset_time(ts, start * self.inSRI.xdelta)
+            actual.extend(split.push(samples[start:start + 700], packetTime, self.inSRI))
+
+        self.assertEqual(len(expected), len(actual))
+        for (expectedFrame, expectedTime), (actualFrame, actualTime) in zip(expected, actual):
+            numpy.testing.assert_allclose(actualFrame, expectedFrame, rtol=1e-5)
+            self.assertAlmostEqual(expectedTime.twsec + expectedTime.tfsec,
+                                   actualTime.twsec + actualTime.tfsec, places=6)
+
+    def test_raster_ring(self):
+        raster = bulkio_dsp.Raster(3, 4, numpy.float32)
+        ts = timestamp.now()
+        for row in range(5):
+            raster.push(numpy.arange(4) + 10 * row, bulkio_dsp.offset_time(ts, 0.25 * row))
+            if (row == 1):
+                matrix, first = raster.snapshot()
+                self.assertEqual((2, 4), matrix.shape)
+
+        matrix, first = raster.snapshot()
+        self.assertEqual(3, len(raster))
+        self.assertAlmostEqual(0.25, raster.ydelta)
+        numpy.testing.assert_array_equal(matrix[:, 0], [20, 30, 40])
+        self.assertAlmostEqual(ts.twsec + ts.tfsec + 0.5, first.twsec + first.tfsec, places=6)
+
+    def test_decimator_across_packets(self):
+        # 1 kHz stream decimated by 10: a 5 Hz tone passes, 180 Hz (above
+        # the 50 Hz Nyquist of the output) does not alias into the display
+        decimator = bulkio_dsp.Decimator(10)
+        inSRI = self.inSRI
+        ts = timestamp.now()
+        start = ts.twsec + ts.tfsec
+        tone = numpy.sin(2 * numpy.pi * 5 * numpy.arange(5000) * inSRI.xdelta)
+
+        outputs = []
+        expectedTime = None
+        for first in range(0, len(tone), 333):
+            words, outTime = decimator.push(tone[first:first + 333], bulkio_dsp.offset_time(ts, first * inSRI.xdelta), inSRI)
+            if outTime is None:
+                continue
+            # Every packet continues where the previous one stopped
+            if expectedTime is not None:
+                self.assertAlmostEqual(expectedTime, outTime.twsec + outTime.tfsec, places=6)
+            expectedTime = outTime.twsec + outTime.tfsec + len(words) * 10 * inSRI.xdelta
+            outputs.append(words)
+        output = numpy.concatenate(outputs)
+        self.assertEqual(500, len(output))
+        self.assertEqual(numpy.float64, output.dtype)
+
+        # Time-stamped for the delay of the filter
+        times = start - decimator.delay * inSRI.xdelta + numpy.arange(len(output)) * 10 * inSRI.xdelta
+        numpy.testing.assert_allclose(output[20:], numpy.sin(2 * numpy.pi * 5 * (times[20:] - start)), atol=1e-4)
+
+        decimator.reset()
+        alias = numpy.sin(2 * numpy.pi * 180 * numpy.arange(5000) * inSRI.xdelta).astype(numpy.float32)
+        words, _ = decimator.push(alias, ts, inSRI, numpy.float32)
+        self.assertEqual(numpy.float32, words.dtype)
+        self.assertTrue(abs(words[20:]).max() < 1e-3)
+
+
+if __name__ == '__main__':
+    unittest.main()
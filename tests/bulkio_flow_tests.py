@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+
+# system imports
+import unittest
+
+# third party imports
+import numpy
+
+# application imports
+from rest import bulkio_flow
+from rest.bulkio_flow import DropPolicyEnum, RatePolicyEnum
+
+
+class _Clock(object):
+    '''
+        Stands in for the time module of bulkio_flow
+    '''
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class BulkIOFlowTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = _Clock()
+        self._time, bulkio_flow.time = bulkio_flow.time, self.clock
+
+    def tearDown(self):
+        bulkio_flow.time = self._time
+
+    def _drain(self, queue):
+        messages = []
+        item = queue.pop()
+        while item is not None:
+            messages.append(item[0])
+            item = queue.pop()
+        return messages
+
+    def test_queue_drop_oldest(self):
+        queue = bulkio_flow.SendQueue(2, DropPolicyEnum.DropOldest)
+        for index in range(4):
+            queue.put(index, stream_id='a')
+        self.assertEqual(2, queue.dropped)
+        self.assertEqual([2, 3], self._drain(queue))
+
+    def test_queue_drop_newest(self):
+        queue = bulkio_flow.SendQueue(2, DropPolicyEnum.DropNewest)
+        for index in range(4):
+            queue.put(index, stream_id='a')
+        self.assertEqual(2, queue.dropped)
+        self.assertEqual([0, 1], self._drain(queue))
+
+    def test_queue_keep_latest(self):
+        queue = bulkio_flow.SendQueue(8, DropPolicyEnum.KeepLatest)
+        for index in range(3):
+            queue.put(('a', index), stream_id='a')
+            queue.put(('b', index), stream_id='b')
+        self.assertEqual(4, queue.dropped)
+        self.assertEqual([('a', 2), ('b', 2)], self._drain(queue))
+
+    def test_queue_control_messages_kept(self):
+        for policy in (DropPolicyEnum.DropOldest, DropPolicyEnum.DropNewest, DropPolicyEnum.KeepLatest):
+            queue = bulkio_flow.SendQueue(1, policy)
+            queue.put('sri', stream_id='a', droppable=False)
+            for index in range(3):
+                queue.put(index, stream_id='a')
+            queue.put('eos', stream_id='a', droppable=False)
+            messages = self._drain(queue)
+            self.assertEqual(['sri', 'eos'], [message for message in messages if isinstance(message, str)])
+            self.assertEqual(1, len(messages) - 2)
+            self.assertEqual(2, queue.dropped)
+
+    def test_queue_scheduled(self):
+        queue = bulkio_flow.SendQueue()
+        # Only the first put() asks for a drain until pop() empties the queue
+        self.assertTrue(queue.put(0))
+        self.assertFalse(queue.put(1))
+        self.assertEqual(0, queue.pop()[0])
+        self.assertFalse(queue.put(2))
+        self.assertEqual([1, 2], self._drain(queue))
+        self.assertTrue(queue.put(3))
+        self.assertEqual((3, False, None), queue.pop())
+
+    def test_rate_refill(self):
+        limiter = bulkio_flow.PacketRateLimiter(4)
+        self.assertIsNotNone(limiter.filter([1], 0, False, 'a'))
+        self.assertIsNone(limiter.filter([2], 0, False, 'a'))
+        # One token every 250 ms
+        self.clock.now += 0.125
+        self.assertIsNone(limiter.filter([3], 0, False, 'a'))
+        self.clock.now += 0.125
+        self.assertEqual(([4], 0), limiter.filter([4], 0, False, 'a'))
+        self.assertEqual(2, limiter.dropped)
+
+    def test_rate_burst(self):
+        limiter = bulkio_flow.PacketRateLimiter(10, burst=3.0)
+        # A long pause only fills the bucket up to the burst
+        self.clock.now += 60.0
+        passed = [limiter.filter([index], 0, False, 'a') is not None for index in range(5)]
+        self.assertEqual([True, True, True, False, False], passed)
+
+    def test_rate_eos(self):
+        limiter = bulkio_flow.PacketRateLimiter(1)
+        limiter.filter([1], 0, False, 'a')
+        for policy in (RatePolicyEnum.Drop, RatePolicyEnum.Merge):
+            limiter.policy = policy
+            self.assertIsNone(limiter.filter([2], 0, False, 'a'))
+            self.assertIsNotNone(limiter.filter([3], 0, True, 'a'))
+
+    def test_rate_merge(self):
+        limiter = bulkio_flow.PacketRateLimiter(1, RatePolicyEnum.Merge)
+        dtype = numpy.dtype('<f4')
+        self.assertEqual(([1.0, 2.0], 'ts0'), limiter.filter([1.0, 2.0], 'ts0', False, 'a', dtype))
+        self.assertIsNone(limiter.filter([2.0, 4.0], 'ts1', False, 'a', dtype))
+        self.assertIsNone(limiter.filter([4.0, 8.0], 'ts2', False, 'a', dtype))
+        self.clock.now += 1.0
+        data, ts = limiter.filter([6.0, 0.0], 'ts3', False, 'a', dtype)
+        # The average of the packets since the last one, stamped with the first
+        numpy.testing.assert_array_equal([4.0, 4.0], data)
+        self.assertEqual(dtype, data.dtype)
+        self.assertEqual('ts1', ts)
+
+    def test_rate_merge_char(self):
+        # dataChar packets are strings of signed bytes
+        limiter = bulkio_flow.PacketRateLimiter(1, RatePolicyEnum.Merge)
+        dtype = numpy.dtype('int8')
+        limiter.filter('\x00', 0, False, 'a', dtype)
+        packet = numpy.array([-1, -2, 3], dtype).tostring()
+        self.assertIsNone(limiter.filter(packet, 0, False, 'a', dtype))
+        self.clock.now += 1.0
+        data, _ = limiter.filter(numpy.array([-3, -2, 4], dtype).tostring(), 0, False, 'a', dtype)
+        self.assertEqual(dtype, data.dtype)
+        numpy.testing.assert_array_equal([-2, -2, 4], data)
+
+        # Strings without a dtype (dataFile URLs) are passed or dropped as is
+        limiter.filter('sca:///data/a.tmp', 0, False, 'b')
+        self.assertIsNone(limiter.filter('sca:///data/b.tmp', 0, False, 'b'))
+        self.clock.now += 1.0
+        self.assertEqual(('sca:///data/c.tmp', 0), limiter.filter('sca:///data/c.tmp', 0, False, 'b'))
+
+    def _emit(self, data, ts, EOS, stream_id, sri):
+        self.released.append((data, ts, EOS, stream_id, sri))
+
+    def test_coalesce_bytes(self):
+        self.released = []
+        coalescer = bulkio_flow.PacketCoalescer(maxBytes=32)
+        coalescer.add([1.0], 'ts0', False, 'a', 'sri', self._emit)
+        coalescer.add([2.0, 3.0], 'ts1', False, 'a', 'sri', self._emit)
+        self.assertEqual([], self.released)
+        coalescer.add([4.0], 'ts2', False, 'a', 'sri', self._emit)
+        # Released with the timestamp of the first packet
+        self.assertEqual([([1.0, 2.0, 3.0, 4.0], 'ts0', False, 'a', 'sri')], self.released)
+        self.assertEqual(2, coalescer.coalesced)
+        self.assertEqual(0, len(coalescer))
+
+    def test_coalesce_window(self):
+        self.released = []
+        coalescer = bulkio_flow.PacketCoalescer(window=100)
+        coalescer.add('ab', 'ts0', False, 'a', 'sri', self._emit)
+        coalescer.add('cd', 'ts1', False, 'b', 'sri', self._emit)
+        self.clock.now += 0.0625
+        self.assertEqual(2, coalescer.expire(self._emit))
+        coalescer.add('ef', 'ts2', False, 'a', 'sri', self._emit)
+        self.assertEqual([], self.released)
+
+        # add() releases a stream once its window is over, expire() the
+        # streams that see no more packets
+        self.clock.now += 0.0625
+        coalescer.add('gh', 'ts3', False, 'a', 'sri', self._emit)
+        self.assertEqual([('abefgh', 'ts0', False, 'a', 'sri')], self.released)
+        self.assertEqual(0, coalescer.expire(self._emit))
+        self.assertEqual(('cd', 'ts1', False, 'b', 'sri'), self.released[1])
+
+    def test_coalesce_eos(self):
+        self.released = []
+        coalescer = bulkio_flow.PacketCoalescer(window=1000)
+        coalescer.add(numpy.arange(2), 'ts0', False, 'a', 'sri', self._emit)
+        coalescer.add(numpy.arange(2, 3), 'ts1', True, 'a', 'sri', self._emit)
+        data, ts, EOS, _, _ = self.released[0]
+        numpy.testing.assert_array_equal([0, 1, 2], data)
+        self.assertEqual(('ts0', True), (ts, EOS))
+        self.assertEqual(0, len(coalescer))
+
+    def test_coalesce_sri_change(self):
+        self.released = []
+        coalescer = bulkio_flow.PacketCoalescer(window=1000)
+        coalescer.add([1], 'ts0', False, 'a', 'sri0', self._emit)
+        coalescer.add([2], 'ts1', False, 'a', 'sri0', self._emit)
+        coalescer.add([3], 'ts2', False, 'a', 'sri1', self._emit)
+        # The packets of the old SRI go first, the new one is held
+        self.assertEqual([([1, 2], 'ts0', False, 'a', 'sri0')], self.released)
+        coalescer.flush(self._emit)
+        self.assertEqual(([3], 'ts2', False, 'a', 'sri1'), self.released[1])
+
+    def test_coalesce_chunk_types(self):
+        self.released = []
+        coalescer = bulkio_flow.PacketCoalescer(window=1000)
+        for chunks, expected in ((['ab', 'c'], 'abc'),
+                                 ([[1, 2], [3]], [1, 2, 3]),
+                                 ([numpy.array([1.0, 2.0], numpy.float32), numpy.array([3.0], numpy.float32)], [1.0, 2.0, 3.0])):
+            for chunk in chunks:
+                coalescer.add(chunk, 'ts', False, 'a', 'sri', self._emit)
+            coalescer.flush(self._emit)
+            data = self.released.pop()[0]
+            self.assertEqual(type(chunks[0]), type(data))
+            self.assertEqual(list(expected), list(data))
+        self.assertEqual(numpy.float32, data.dtype)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
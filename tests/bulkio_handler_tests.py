@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+
+# system imports
+import unittest
+
+# third party imports
+import numpy
+from bulkio import sri, timestamp
+
+# application imports
+from rest import bulkio_dsp, bulkio_flow, bulkio_limiter
+from rest.bulkio_handler import BulkIOClient
+
+
+class _Port(object):
+    class _Using(object):
+        name = 'dataFloat'
+    _using = _Using()
+
+class _Client(BulkIOClient):
+    '''
+        The packet path of the bulkio handlers, with the messages kept
+        instead of queued
+    '''
+    def __init__(self):
+        self._setup('component')
+        self.port = _Port()
+        self.sent = []
+
+    def _drain(self):
+        pass
+
+    def _send(self, message, binary=False, stream_id=None, droppable=True, trace=None):
+        self.sent.append(message)
+
+
+class _Clock(object):
+    '''
+        Stands in for the time module of bulkio_flow
+    '''
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class BulkIOHandlerTests(unittest.TestCase):
+
+    def test_merge_sri_change(self):
+        clock = _Clock()
+        original, bulkio_flow.time = bulkio_flow.time, clock
+        try:
+            for newSRI, expected in ((sri.create('handler_test', srate=1000.0), [2.0]),
+                                     (sri.create('handler_test', srate=500.0), [1.0])):
+                client = _Client()
+                client._rateLimiter.policy = bulkio_flow.RatePolicyEnum.Merge
+                client._rateLimiter.rate = 1
+                client._pushSRI(sri.create('handler_test', srate=1000.0))
+                client._pushPacket(numpy.array([9.0], numpy.float32), timestamp.now(), False, 'handler_test')
+                # Merged until a packet is let through a second later
+                client._pushPacket(numpy.array([4.0], numpy.float32), timestamp.now(), False, 'handler_test')
+                # The same SRI again keeps the merge, a new one starts over
+                client._pushSRI(newSRI)
+                client._pushPacket(numpy.array([0.0], numpy.float32), timestamp.now(), False, 'handler_test')
+                clock.now += 1.0
+                client._pushPacket(numpy.array([2.0], numpy.float32), timestamp.now(), False, 'handler_test')
+
+                packets = [message for message in client.sent if 'dataBuffer' in message]
+                self.assertEqual(2, len(packets))
+                self.assertEqual(expected, list(packets[1]['dataBuffer']))
+        finally:
+            bulkio_flow.time = original
+
+    def test_fir_waterfall_factor(self):
+        client = _Client()
+        client._xMax = 100
+        client._xDecimation = bulkio_limiter.DecimateEnum.FIR
+        client._waterfallRows = 4
+        # Only the first raster is sent, the next packets are held
+        client._waterfallInterval = 60000
+
+        inSRI = sri.create('handler_test', srate=1000.0)
+        ts = timestamp.now()
+        for index in xrange(5):
+            data = numpy.ones(1000, numpy.float32)
+            client._processPacket(data, bulkio_dsp.offset_time(ts, index), False, 'handler_test', inSRI, index == 0)
+            # Decimated by 10, within xMax after that
+            self.assertEqual(10, client._xFactor)
+
+        packets = [message for message in client.sent if 'dataBuffer' in message]
+        self.assertEqual(1, len(packets))
+        self.assertEqual(100, packets[0]['SRI']['subsize'])
+        self.assertAlmostEqual(0.01, packets[0]['SRI']['xdelta'])
+
+        client._processPacket(numpy.ones(1000, numpy.float32), bulkio_dsp.offset_time(ts, 5), True, 'handler_test', inSRI, False)
+        self.assertEqual(10, client._xFactor)
+        self.assertTrue(client.sent[-1]['EOS'])
+        self.assertEqual({}, client._decimators)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+
+# system imports
+import unittest
+
+# third party imports
+import numpy
+from bulkio import sri
+
+# application imports
+from rest import bulkio_limiter
+
+
+def loopMeanDownsampleX(dataMatrix, resampleFactor):
+    '''
+        Reference (per-cell loop) implementation of
+        bulkio_limiter.meanDownsampleX
+    '''
+    dataMatrix = dataMatrix.copy()
+    outMatrix = dataMatrix[:,::resampleFactor]
+    origCols = dataMatrix.shape[1]
+    for row in range(0, outMatrix.shape[0]):
+        for col in range(0, outMatrix.shape[1]):
+            outMatrix[row, col] = dataMatrix[row, col*resampleFactor:min(col*resampleFactor+resampleFactor, origCols)].mean()
+    return outMatrix
+
+def loopMeanDownsampleY(dataMatrix, resampleFactor):
+    '''
+        Reference (per-cell loop) implementation of
+        bulkio_limiter.meanDownsampleY
+    '''
+    dataMatrix = dataMatrix.copy()
+    outMatrix = dataMatrix[::resampleFactor,:]
+    origRows = dataMatrix.shape[0]
+    for col in range(0, outMatrix.shape[1]):
+        for row in range(0, outMatrix.shape[0]):
+            outMatrix[row, col] = dataMatrix[row*resampleFactor:min(row*resampleFactor+resampleFactor, origRows), col].mean()
+    return outMatrix
+
+
+class BulkIOLimiterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = numpy.random.RandomState(0)
+
+    def _matrices(self):
+        yield self.rng.randn(7, 101)
+        yield self.rng.randint(-2**15, 2**15, size=(13, 64))
+        yield self.rng.randn(5, 33) + 1j * self.rng.randn(5, 33)
+        yield self.rng.randn(1, 1000)
+
+    def test_mean_downsample_x(self):
+        for matrix in self._matrices():
+            for factor in (1, 2, 3, 7, 64, matrix.shape[1], matrix.shape[1] + 5):
+                expected = loopMeanDownsampleX(matrix, factor)
+                actual = bulkio_limiter.meanDownsampleX(matrix, factor)
+                self.assertEqual(expected.shape, actual.shape)
+                self.assertEqual(expected.dtype, actual.dtype)
+                numpy.testing.assert_allclose(actual, expected, rtol=1e-12, atol=1e-9)
+
+    def test_mean_downsample_y(self):
+        for matrix in self._matrices():
+            for factor in (1, 2, 3, 4, matrix.shape[0], matrix.shape[0] + 2):
+                expected = loopMeanDownsampleY(matrix, factor)
+                actual = bulkio_limiter.meanDownsampleY(matrix, factor)
+                self.assertEqual(expected.shape, actual.shape)
+                self.assertEqual(expected.dtype, actual.dtype)
+                numpy.testing.assert_allclose(actual, expected, rtol=1e-12, atol=1e-9)
+
+    def test_limit_2d_mean(self):
+        inSRI = sri.create('limiter_test')
+        inSRI.subsize = 100
+        data = self.rng.randn(50 * 100).tolist()
+
+        outData, outSRI, xFactor, yFactor, sriChanged, warning = bulkio_limiter.limit(
+            data, inSRI, 30, yMax=20)
+
+        self.assertEqual((4, 3), (xFactor, yFactor))
+        self.assertEqual(25, outSRI.subsize)
+        self.assertEqual(25 * 17, len(outData))
+        self.assertTrue(sriChanged)
+        self.assertFalse(warning)
+
+        matrix = numpy.array(data).reshape((50, 100))
+        expected = loopMeanDownsampleY(loopMeanDownsampleX(matrix, 4), 3)
+        numpy.testing.assert_allclose(outData, expected.ravel(), rtol=1e-12)
+
+    def test_limit_complex_native_dtype(self):
+        inSRI = sri.create('limiter_test')
+        inSRI.mode = 1
+        words = self.rng.randn(2 * 1000).astype(numpy.float32)
+
+        outData, outSRI, xFactor, _, _, _ = bulkio_limiter.limit(
+            words, inSRI, 100, dtype=numpy.float32)
+
+        self.assertEqual(10, xFactor)
+        self.assertEqual(numpy.float32, outData.dtype)
+        self.assertEqual(2 * 100, len(outData))
+
+        samples = words[0::2].astype(numpy.float64) + 1j * words[1::2]
+        expected = samples.reshape((100, 10)).mean(axis=1)
+        numpy.testing.assert_allclose(outData[0::2], expected.real, rtol=1e-5, atol=1e-6)
+        numpy.testing.assert_allclose(outData[1::2], expected.imag, rtol=1e-5, atol=1e-6)
+
+    def test_limit_min_max_envelope(self):
+        inSRI = sri.create('limiter_test')
+        data = numpy.zeros(1000)
+        data[123] = 5.0
+        data[877] = -3.0
+
+        outData, outSRI, xFactor, _, _, _ = bulkio_limiter.limit(
+            data, inSRI, 100, xDecimation=bulkio_limiter.DecimateEnum.MinMax)
+
+        # 50 blocks of 20 samples, each as a (min, max) pair
+        self.assertEqual(10, xFactor)
+        self.assertEqual(100, len(outData))
+        self.assertAlmostEqual(inSRI.xdelta * 10, outSRI.xdelta)
+        self.assertEqual(5.0, outData[2 * (123 // 20) + 1])
+        self.assertEqual(-3.0, outData[2 * (877 // 20)])
+        self.assertEqual(5.0, outData.max())
+        self.assertEqual(-3.0, outData.min())
+
+        # The mean smears the spike away
+        outData, _, _, _, _, _ = bulkio_limiter.limit(data, inSRI, 100)
+        self.assertTrue(outData.max() < 1.0)
+
+    def test_limit_min_max_odd(self):
+        inSRI = sri.create('limiter_test')
+        data = numpy.arange(1000, dtype=numpy.float32)
+
+        for xMax in (1, 3, 99, 101, 333):
+            outData, _, _, _, _, _ = bulkio_limiter.limit(
+                data, inSRI, xMax, xDecimation=bulkio_limiter.DecimateEnum.MinMax)
+            self.assertTrue(len(outData) <= max(xMax, 2), '%d samples for xMax %d' % (len(outData), xMax))
+
+        # 48 blocks of 21 samples (the last one short)
+        outData, _, xFactor, _, _, _ = bulkio_limiter.limit(
+            data, inSRI, 99, xDecimation=bulkio_limiter.DecimateEnum.MinMax)
+        self.assertEqual(96, len(outData))
+        self.assertEqual(10.5, xFactor)
+
+    def test_max_downsample_complex(self):
+        matrix = self.rng.randn(3, 40) + 1j * self.rng.randn(3, 40)
+        actual = bulkio_limiter.maxDownsampleX(matrix, 8)
+        blocks = matrix.reshape((3, 5, 8))
+        numpy.testing.assert_array_equal(actual.real, blocks.real.max(axis=2))
+        numpy.testing.assert_array_equal(actual.imag, blocks.imag.max(axis=2))
+
+    def test_to_samples_no_copy(self):
+        words = numpy.arange(8, dtype=numpy.float32)
+        samples = bulkio_limiter.toSamples(words, True, numpy.float32)
+        self.assertEqual(numpy.complex64, samples.dtype)
+        self.assertTrue(numpy.may_share_memory(words, samples))
+        self.assertTrue(numpy.may_share_memory(words, bulkio_limiter.toWords(samples)))
+        self.assertEqual(complex(2, 3), samples[1])
+
+    def test_limit_plan(self):
+        inSRI = sri.create('plan_test')
+        inSRI.subsize = 64
+        plan = bulkio_limiter.LimitPlan(64 * 10, inSRI, 16, 8, None, bulkio_limiter.DecimateEnum.MinMax, 4,
+                                        dtype=numpy.dtype(numpy.float32))
+        self.assertTrue(plan.fits(64 * 10, inSRI))
+        self.assertFalse(plan.fits(64 * 11, inSRI))
+        self.assertFalse(plan.fits(64 * 10, sri.create('plan_test')))
+
+        # Same result as limit(), reducing into the same buffer every packet
+        first = None
+        for _ in xrange(3):
+            data = self.rng.randn(64 * 10).astype(numpy.float32)
+            expected = bulkio_limiter.limit(data, inSRI, 16, 8, None, bulkio_limiter.DecimateEnum.MinMax, 4,
+                                            dtype=numpy.dtype(numpy.float32))
+            outData = plan.apply(data)
+            numpy.testing.assert_array_equal(expected[0], outData)
+            self.assertEqual(expected[1].__dict__, plan.outSRI.__dict__)
+            self.assertEqual(expected[2:5], (plan.xFactor, plan.yFactor, plan.sriChanged))
+            if first is None:
+                first = outData
+            self.assertTrue(numpy.may_share_memory(first, outData))
+
+    def test_limit_unknown_decimation(self):
+        inSRI = sri.create('limiter_test')
+        inSRI.subsize = 10
+        data = self.rng.randn(100)
+        for decimation in (dict(xDecimation=42), dict(yDecimation=-1)):
+            self.assertRaises(ValueError, bulkio_limiter.limit, data, inSRI, 5, yMax=5, **decimation)
+
+    def test_limit_octet_string(self):
+        # Octet data comes from omniORB as a string, wrapped rather than listed
+        data = ''.join(chr(i) for i in xrange(200, 240))
+        samples = bulkio_limiter.toSamples(data, False, numpy.dtype('uint8'))
+        self.assertFalse(samples.flags.writeable)
+        self.assertEqual(200, samples[0])
+
+        inSRI = sri.create('octet_test')
+        outData, _, xFactor, _, _, _ = bulkio_limiter.limit(
+            data, inSRI, 10, xDecimation=bulkio_limiter.DecimateEnum.Drop, dtype=numpy.dtype('uint8'))
+        self.assertEqual(4, xFactor)
+        self.assertEqual(numpy.uint8, outData.dtype)
+        numpy.testing.assert_array_equal(numpy.arange(200, 240, 4), outData)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+
+# system imports
+import unittest
+
+# third party imports
+import numpy
+from bulkio import sri, timestamp
+
+# application imports
+from rest import bulkio_protocol
+from rest.bulkio_protocol import PrecisionEnum
+
+
+class BulkIOProtocolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = numpy.random.RandomState(0)
+
+    def test_quantize_int16(self):
+        inSRI = sri.create('protocol_test')
+        words = (self.rng.randn(1000) * 1e3 + 5e3).astype(numpy.float32)
+        samples, outSRI, scale, offset = bulkio_protocol.quantize(words, numpy.dtype('<f4'), PrecisionEnum.Int16, inSRI)
+        self.assertEqual(numpy.int16, samples.dtype)
+        self.assertIs(inSRI, outSRI)
+        # Within one LSB of the original values
+        numpy.testing.assert_allclose(samples * scale + offset, words, rtol=0, atol=scale)
+        self.assertEqual(32767, abs(samples).max())
+
+    def test_quantize_int8log(self):
+        words = (self.rng.rand(512) * 100.0).astype(numpy.float64)
+        samples, _, scale, offset = bulkio_protocol.quantize(
+            words, numpy.dtype('<f8'), PrecisionEnum.Int8Log, sri.create('protocol_test'), is_db=True)
+        self.assertEqual(numpy.int8, samples.dtype)
+        numpy.testing.assert_allclose(samples * scale + offset, words, rtol=0, atol=scale)
+
+    def test_quantize_int8log_complex(self):
+        inSRI = sri.create('protocol_test')
+        inSRI.mode = 1
+        inSRI.subsize = 64
+        words = self.rng.randn(2 * 256).astype(numpy.float32)
+        samples, outSRI, scale, offset = bulkio_protocol.quantize(words, numpy.dtype('<f4'), PrecisionEnum.Int8Log, inSRI)
+
+        # Real magnitudes, with the SRI of the input untouched
+        self.assertEqual(256, len(samples))
+        self.assertEqual((0, 32), (outSRI.mode, outSRI.subsize))
+        self.assertEqual((1, 64), (inSRI.mode, inSRI.subsize))
+        magnitude = 20.0 * numpy.log10(numpy.hypot(words[0::2], words[1::2]))
+        kept = magnitude >= magnitude.max() - bulkio_protocol.INT8LOG_RANGE
+        numpy.testing.assert_allclose((samples * scale + offset)[kept], magnitude[kept], rtol=0, atol=scale)
+
+    def test_to_list(self):
+        # Octet and char strings are numbers, dataFile strings are URLs
+        self.assertEqual([200, 1], bulkio_protocol.to_list('\xc8\x01', bulkio_protocol.port_dtype('dataOctet')))
+        self.assertEqual([-56, 1], bulkio_protocol.to_list('\xc8\x01', bulkio_protocol.port_dtype('dataChar')))
+        self.assertIsNone(bulkio_protocol.port_dtype('dataFile'))
+        self.assertEqual('sca:///data/file.tmp', bulkio_protocol.to_list('sca:///data/file.tmp', None))
+        self.assertEqual([1.5, 2.5], bulkio_protocol.to_list(numpy.array([1.5, 2.5], numpy.float32), None))
+
+    def test_round_significant(self):
+        values = [0.0, -1.23456789, float('nan'), float('inf'), 123456789.0, -0.000123456789]
+        rounded = bulkio_protocol.round_significant(values, 3)
+        self.assertEqual([0.0, -1.23, 123000000.0, -0.000123], [rounded[i] for i in (0, 1, 4, 5)])
+        self.assertTrue(numpy.isnan(rounded[2]))
+        self.assertEqual(float('inf'), rounded[3])
+        self.assertEqual(0, len(bulkio_protocol.round_significant([])))
+
+    def test_binary_quantized_header(self):
+        inSRI = sri.create('protocol_test')
+        inSRI.mode = 1
+        words = self.rng.randn(2 * 100).astype(numpy.float32)
+        ts = timestamp.now()
+        for precision, dtype in ((PrecisionEnum.Int16, numpy.int16), (PrecisionEnum.Int8Log, numpy.int8)):
+            samples, outSRI, scale, offset = bulkio_protocol.quantize(words, numpy.dtype('<f4'), precision, inSRI)
+            frame = bulkio_protocol.binary_packet(samples, samples.dtype, 'protocol_test', ts, True, outSRI, 1, False,
+                                                  scale=scale, offset=offset)
+            fields = bulkio_protocol.HEADER.unpack_from(frame)
+            flags = fields[2]
+            self.assertEqual(bulkio_protocol.DTYPE_CODES[numpy.dtype(dtype)], fields[3])
+            self.assertTrue(flags & bulkio_protocol.FLAG_QUANTIZED)
+            self.assertTrue(flags & bulkio_protocol.FLAG_EOS)
+            self.assertFalse(flags & bulkio_protocol.FLAG_SRI_CHANGED)
+            # Int8Log sends real magnitudes
+            self.assertEqual(precision == PrecisionEnum.Int16, bool(flags & bulkio_protocol.FLAG_COMPLEX))
+            start = bulkio_protocol.HEADER.size + -(-fields[7] // 8) * 8
+            self.assertEqual((scale, offset), bulkio_protocol.QUANTIZATION.unpack_from(frame, start))
+            body = numpy.frombuffer(frame[start + bulkio_protocol.QUANTIZATION.size:], dtype)
+            numpy.testing.assert_array_equal(samples, body)
+
+        # Not flagged nor extended when not quantized
+        frame = bulkio_protocol.binary_packet(words, numpy.dtype('<f4'), 'protocol_test', ts, False, inSRI, 1, True)
+        fields = bulkio_protocol.HEADER.unpack_from(frame)
+        self.assertFalse(fields[2] & bulkio_protocol.FLAG_QUANTIZED)
+        self.assertEqual(bulkio_protocol.HEADER.size + 16 + words.nbytes, len(frame))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+
+
+# system imports
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+# third party imports
+import numpy
+from bulkio import sri, timestamp
+
+# application imports
+from rest import bulkio_dsp, bulkio_recorder
+
+
+class BulkIORecorderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _record(self, fmt, inSRI, packets):
+        # Runs a recording over (data, ts) packets without a port
+        recording = bulkio_recorder.Recording(('component', 'd', 'a', 'c', 'p'), numpy.dtype('<i2'), fmt,
+                                              directory=self.directory)
+        recording._thread.start()
+        recording._pushSRI(inSRI)
+        for data, ts in packets:
+            recording._pushPacket(data, ts, False, inSRI.streamID)
+        recording.stop()
+        recording._thread.join()
+        return recording
+
+    def test_blue_complex(self):
+        inSRI = sri.create('recorder_test', srate=1000.0)
+        inSRI.mode = 1
+        ts = timestamp.now()
+        # Two contiguous packets of 50 complex samples, then a gap
+        packets = [(range(0, 100), ts),
+                   (range(100, 200), bulkio_dsp.offset_time(ts, 0.05)),
+                   (range(200, 300), bulkio_dsp.offset_time(ts, 1.0))]
+        recording = self._record(bulkio_recorder.FormatEnum.Blue, inSRI, packets)
+        self.assertEqual('stopped', recording.state)
+
+        data = open(recording.path, 'rb').read()
+        header = bulkio_recorder.BLUE_HEADER.unpack_from(data)
+        self.assertEqual(('BLUE', 'EEEI', 'EEEI'), header[:3])
+        self.assertEqual((512.0, 600.0, 1000, 'CI'), header[8:12])
+        self.assertAlmostEqual(ts.twsec + ts.tfsec + bulkio_recorder.BLUE_EPOCH_OFFSET, header[13], places=6)
+        self.assertEqual((0.0, 0.001, 1), bulkio_recorder.BLUE_ADJUNCT_1000.unpack_from(data, 256))
+        numpy.testing.assert_array_equal(numpy.frombuffer(data[512:], dtype='<i2'), numpy.arange(300))
+
+        sidecar = json.load(open(recording.sidecarPath))
+        self.assertEqual(300, sidecar['words'])
+        self.assertEqual([0], [entry['offset'] for entry in sidecar['SRIs']])
+        self.assertEqual([0, 200], [entry['offset'] for entry in sidecar['timestamps']])
+
+    def test_blue_complex_frames(self):
+        inSRI = sri.create('recorder_test', srate=1000.0)
+        inSRI.mode = 1
+        inSRI.subsize = 8
+        inSRI.ydelta = 0.5
+        recording = self._record(bulkio_recorder.FormatEnum.Blue, inSRI, [(range(16), timestamp.now())])
+
+        data = open(recording.path, 'rb').read()
+        self.assertEqual(2000, bulkio_recorder.BLUE_HEADER.unpack_from(data)[10])
+        self.assertEqual(4, bulkio_recorder.BLUE_ADJUNCT_2000.unpack_from(data, 256)[3])
+
+    def test_attach_error(self):
+        recording = bulkio_recorder.Recording(('component', 'd', 'a', 'c', 'p'), numpy.dtype('<i2'),
+                                              directory=self.directory)
+        def attach(*args):
+            raise RuntimeError('No such port')
+        original, bulkio_recorder.bulkio_hub.attach = bulkio_recorder.bulkio_hub.attach, attach
+        try:
+            self.assertRaises(RuntimeError, recording.start, None, None)
+        finally:
+            bulkio_recorder.bulkio_hub.attach = original
+        self.assertEqual('stopped', recording.state)
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_raw_other_streams(self):
+        inSRI = sri.create('recorder_test')
+        recording = bulkio_recorder.Recording(('component', 'd', 'a', 'c', 'p'), numpy.dtype('<i2'),
+                                              bulkio_recorder.FormatEnum.Raw, 'recorder_test', self.directory)
+        recording._thread.start()
+        recording._pushSRI(inSRI)
+        recording._pushSRI(sri.create('other'))
+        recording._pushPacket(range(10), timestamp.now(), False, 'other')
+        recording._pushPacket(range(10), timestamp.now(), False, 'recorder_test')
+        recording.stop()
+        recording._thread.join()
+
+        numpy.testing.assert_array_equal(numpy.fromfile(recording.path, dtype='<i2'), numpy.arange(10))
+        recording.remove()
+        self.assertEqual([], os.listdir(self.directory))
+
+
+if __name__ == '__main__':
+    unittest.main()
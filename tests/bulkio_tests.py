@@ -35,6 +35,7 @@ from tornado import websocket, gen, concurrent
 
 # application imports
 from pyrest import Application
+from rest import bulkio_protocol, bulkio_hub
 from base import JsonTests
 from defaults import Default
 
@@ -71,14 +72,14 @@ class BulkIOTests(JsonTests, AsyncHTTPTestCase, LogTrapTestCase):
         self.close_future = concurrent.Future()
         return Application(debug=True, _ioloop=self.io_loop, close_future=self.close_future)
 
-    def _get_connection(self):
+    def _get_connection(self, query=''):
         cid = next(
             (cp['id'] for cp in self.components if cp['name'] == Default.COMPONENT), None)
         if not cid:
             self.fail('Unable to find %s component' % (Default.COMPONENT))
 
-        url = self.get_url("%s/components/%s/ports/%s/bulkio" % (Default.REST_BASE +
-            self.base_url, cid, Default.COMPONENT_USES_PORT)).replace('http', 'ws')
+        url = self.get_url("%s/components/%s/ports/%s/bulkio%s" % (Default.REST_BASE +
+            self.base_url, cid, Default.COMPONENT_USES_PORT, query)).replace('http', 'ws')
         logging.debug('WS URL: ' + url)
         return websocket.websocket_connect(url, io_loop=self.io_loop)
 
@@ -113,6 +114,166 @@ class BulkIOTests(JsonTests, AsyncHTTPTestCase, LogTrapTestCase):
         conn.close()
         yield self.close_future
 
+    @tornado.testing.gen_test
+    def test_bulkio_binary_ws(self):
+        conn = yield self._get_connection('?format=binary')
+
+        # The SRI is announced as a text message before the first binary frame
+        msg = yield conn.read_message()
+        self.assertIsInstance(msg, unicode, 'Expected an SRI text message')
+        sri_msg = json.loads(msg)
+        self.assertIsNone(sri_msg.get('error', None),
+            'Recieved websocket error %s' % sri_msg)
+        self.assertEqual('sri', sri_msg.get('type', None))
+        self.assertIn('SRI', sri_msg)
+        sri_version = sri_msg['version']
+
+        for _ in xrange(10):
+            msg = yield conn.read_message()
+            if isinstance(msg, unicode):
+                # SRI update
+                sri_version = json.loads(msg)['version']
+                continue
+
+            (magic, version, flags, dtype, frame_sri_version, rows, cols,
+             sid_len, _, _, _, _, _, _) = bulkio_protocol.HEADER.unpack_from(msg)
+            self.assertEqual(bulkio_protocol.MAGIC, magic)
+            self.assertEqual(bulkio_protocol.VERSION, version)
+            self.assertEqual(bulkio_protocol.DTYPE_CODES[bulkio_protocol.port_dtype('dataShort')], dtype)
+            self.assertEqual(sri_version, frame_sri_version)
+
+            offset = bulkio_protocol.HEADER.size + sid_len + (-sid_len % 8)
+            self.assertEqual(rows * cols * 2, len(msg) - offset)
+            self.assertGreater(rows * cols, 0, "Data buffer was empty.")
+
+        conn.close()
+        yield self.close_future
+
+    @tornado.testing.gen_test
+    def test_bulkio_compact_ws(self):
+        conn = yield self._get_connection('?format=json-compact')
+
+        sri_version = None
+        for _ in xrange(10):
+            msg = yield conn.read_message()
+            packet = json.loads(msg)
+            self.assertIsNone(packet.get('error', None),
+                'Recieved websocket error %s' % packet)
+
+            if packet.get('type', None) == 'sri':
+                self.assertIn('keywords', packet['SRI'])
+                sri_version = packet['version']
+                continue
+
+            # Data packets reference the SRI sent before them
+            self.assertIsNotNone(sri_version, 'SRI was not sent first')
+            self.assertNotIn('SRI', packet)
+            self.assertEqual(sri_version, packet.get('sriVersion', None))
+            self.assertGreater(len(packet.get('dataBuffer', [])), 0, "Data buffer was empty.")
+
+        conn.close()
+        yield self.close_future
+
+    @tornado.testing.gen_test
+    def test_bulkio_stream_http(self):
+        cid = next(
+            (cp['id'] for cp in self.components if cp['name'] == Default.COMPONENT), None)
+        url = self.get_url("%s/components/%s/ports/%s/stream?xmax=64" % (Default.REST_BASE +
+            self.base_url, cid, Default.COMPONENT_USES_PORT))
+
+        # Server-Sent Events, read until 10 packets came in
+        received = []
+        def on_chunk(chunk):
+            received.append(chunk)
+            if ''.join(received).count('\n\n') >= 10:
+                raise StopIteration()
+
+        client = AsyncHTTPClient(self.io_loop, force_instance=True)
+        try:
+            yield client.fetch(HTTPRequest(url, streaming_callback=on_chunk, request_timeout=30))
+        except StopIteration:
+            pass
+        client.close()
+
+        events = ''.join(received).split('\n\n')[:10]
+        for event in events:
+            self.assertTrue(event.startswith('data: '), 'Not an event: %s' % event)
+            packet = json.loads(event[len('data: '):])
+            self.assertIsNone(packet.get('error', None),
+                'Recieved stream error %s' % packet)
+            self.assertGreater(len(packet.get('dataBuffer', [])), 0, "Data buffer was empty.")
+            self.assertLessEqual(packet['samples'], 64)
+
+    @tornado.testing.gen_test
+    def test_bulkio_subscription_ws(self):
+        conn = yield self._get_connection('?streams=no_such_stream')
+
+        # Only the listing of the streams comes in
+        msg = yield conn.read_message()
+        listing = json.loads(msg)
+        self.assertEqual('streams', listing.get('type', None), 'Expected a streams message %s' % listing)
+        self.assertGreater(len(listing['streams']), 0, 'No stream listed')
+        self.assertEqual([], listing['subscribed'])
+        self.assertEqual(['no_such_stream'], listing['subscription'])
+
+        # Subscribe to all of them
+        conn.write_message(json.dumps(dict(type=27, value=None)))
+        for _ in xrange(10):
+            msg = yield conn.read_message()
+            packet = json.loads(msg)
+            self.assertIsNone(packet.get('error', None),
+                'Recieved websocket error %s' % packet)
+            if packet.get('type', None) == 'streams':
+                self.assertEqual(packet['streams'], packet['subscribed'])
+                continue
+            self.assertIn(packet['streamID'], listing['streams'])
+
+        conn.close()
+        yield self.close_future
+
+    @tornado.testing.gen_test
+    def test_bulkio_shared_ws(self):
+        conn1 = yield self._get_connection()
+        conn2 = yield self._get_connection()
+
+        # Both clients are served by a single connection to the port
+        for conn in (conn1, conn2):
+            msg = yield conn.read_message()
+            packet = json.loads(msg)
+            self.assertIsNone(packet.get('error', None),
+                'Recieved websocket error %s' % packet)
+            self.assertGreater(len(packet.get('dataBuffer', [])), 0, "Data buffer was empty.")
+        self.assertEqual(1, len(bulkio_hub.hubs()))
+
+        conn1.close()
+        yield self.close_future
+        conn2.close()
+
+    @tornado.testing.gen_test
+    def test_bulkio_connections(self):
+        conn = yield self._get_connection()
+        yield conn.read_message()
+
+        # The client is listed with its counters
+        data, _ = yield self._async_json_request('/bulkio/connections', 200)
+        self.assertList(data, 'connections')
+        self.assertEqual(1, len(data['connections']))
+        info = data['connections'][0]
+        self.assertIn(Default.COMPONENT_USES_PORT, info['port'])
+        self.assertEqual('websocket', info['transport'])
+        self.assertGreater(info['packetsOut'], 0)
+        self.assertGreater(info['bytesSent'], 0)
+
+        # And can be throttled
+        data, _ = yield self._async_json_request('/bulkio/connections/%s' % info['id'], 200, 'PUT', {'maxpps': 2})
+        self.assertEqual(2, data['maxpps'])
+
+        conn.close()
+        yield self.close_future
+        data, _ = yield self._async_json_request('/bulkio/connections', 200)
+        self.assertEqual([], data['connections'])
+        yield self._async_json_request('/bulkio/connections/%s' % info['id'], 404)
+
     @tornado.testing.gen_test
     def test_sri_keywords_ws(self):
         conn = yield self._get_connection()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+
+
+
+# system imports
+import time
+import unittest
+
+# third party imports
+from bulkio import timestamp
+
+# application imports
+from rest import bulkio_trace
+
+
+class BulkIOTraceTests(unittest.TestCase):
+
+    def setUp(self):
+        for histogram in bulkio_trace.histograms():
+            histogram.reset()
+
+    def tearDown(self):
+        bulkio_trace.configure(bulkio_trace.DEFAULT_EVERY)
+        bulkio_trace.end()
+
+    def _counts(self):
+        return dict((histogram.name, histogram.count) for histogram in bulkio_trace.histograms())
+
+    def test_histogram_buckets(self):
+        histogram = bulkio_trace.Histogram('test')
+        for seconds in (0.0, 1.5e-6, 0.003, 1000.0):
+            histogram.observe(seconds)
+        info = histogram.info()
+        self.assertEqual(4, info['count'])
+        self.assertEqual(1000.0, info['max'])
+        counts = dict((bucket['le'], bucket['count']) for bucket in info['buckets'])
+        self.assertEqual(1, counts[1e-6])
+        self.assertEqual(1, counts[2e-6])
+        self.assertEqual(1, counts[5e-3])
+        self.assertEqual(1, counts[None])
+
+    def test_monotonic_clock(self):
+        self.assertIsNot(time.time, bulkio_trace._clock)
+        first = bulkio_trace._clock()
+        time.sleep(0.01)
+        self.assertGreaterEqual(bulkio_trace._clock() - first, 0.009)
+
+        clock, bulkio_trace._clock = bulkio_trace._clock, None
+        try:
+            self.assertRaises(RuntimeError, bulkio_trace.configure, 1)
+            bulkio_trace.configure(0)
+        finally:
+            bulkio_trace._clock = clock
+
+    def test_sampling(self):
+        bulkio_trace.configure(0)
+        self.assertIsNone(bulkio_trace.begin(timestamp.now()))
+
+        bulkio_trace.configure(4)
+        traces = [bulkio_trace.begin(timestamp.now()) for _ in xrange(8)]
+        self.assertEqual(2, len([trace for trace in traces if trace is not None]))
+
+    def test_stages(self):
+        bulkio_trace.configure(1)
+        trace = bulkio_trace.begin(timestamp.now())
+        self.assertIs(trace, bulkio_trace.current())
+
+        client = trace.fork('dispatch')
+        for stage in ('queue', 'limit', 'build'):
+            client.mark(stage)
+        time.sleep(0.01)
+        client.finish('send')
+        bulkio_trace.end()
+        self.assertIsNone(bulkio_trace.current())
+
+        self.assertEqual(dict((stage, 1) for stage in bulkio_trace.STAGES), self._counts())
+        total = [histogram.info() for histogram in bulkio_trace.histograms() if histogram.name == 'total'][0]
+        self.assertGreaterEqual(total['sum'], 0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+#
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of REDHAWK rest-python.
+#
+# REDHAWK rest-python is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# REDHAWK rest-python is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+
+# system imports
+import logging
+import random
+import threading
+import time
+import unittest
+
+# application imports
+from rest import bulkio_worker
+
+
+class BulkIOWorkerTests(unittest.TestCase):
+
+    def setUp(self):
+        bulkio_worker.configure(threads=4)
+        self.lock = threading.Lock()
+        self.done = dict()
+
+    def tearDown(self):
+        bulkio_worker.shutdown()
+
+    def _record(self, key, index, delay=0.0):
+        if delay:
+            time.sleep(delay)
+        with self.lock:
+            self.done.setdefault(key, []).append(index)
+
+    def test_order_per_key(self):
+        rng = random.Random(0)
+        for index in xrange(50):
+            for key in ('a', 'b', 'c', 'd', 'e'):
+                bulkio_worker.submit(key, self._record, key, index, rng.random() * 0.001)
+        bulkio_worker.shutdown()
+
+        self.assertEqual(set('abcde'), set(self.done))
+        for key, indexes in self.done.items():
+            self.assertEqual(range(50), indexes)
+
+    def test_failing_task(self):
+        def fail():
+            raise RuntimeError('task failure')
+
+        logging.disable(logging.ERROR)
+        try:
+            bulkio_worker.submit('a', self._record, 'a', 0, 0.01)
+            bulkio_worker.submit('a', fail)
+            bulkio_worker.submit('a', self._record, 'a', 1)
+            for index in xrange(8):
+                # More failures than workers, on other keys
+                bulkio_worker.submit(index, fail)
+            bulkio_worker.submit('b', self._record, 'b', 0)
+            bulkio_worker.shutdown()
+        finally:
+            logging.disable(logging.NOTSET)
+
+        self.assertEqual(dict(a=[0, 1], b=[0]), self.done)
+
+    def test_shutdown(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5.0)
+            self._record('a', 0)
+
+        bulkio_worker.submit('a', block)
+        started.wait(5.0)
+        # Queued behind the running task of the key, still run in order
+        bulkio_worker.submit('a', self._record, 'a', 1)
+        threading.Timer(0.05, release.set).start()
+        bulkio_worker.shutdown(wait=True)
+        self.assertEqual([0, 1], self.done['a'])
+
+        # Run on the calling thread once the pool is gone
+        caller = []
+        bulkio_worker.submit('b', lambda: caller.append(threading.current_thread()))
+        self.assertEqual([threading.current_thread()], caller)
+
+
+if __name__ == '__main__':
+    unittest.main()